@@ -0,0 +1,463 @@
+"""
+Agregações de acessos às páginas para o relatório administrativo.
+
+Os acessos brutos são consolidados em AcessoAgregado por hora e por dia
+(no horário de Brasília) pelo comando agregar_acessos. O relatório combina:
+  - linhas diárias para os dias completos do intervalo;
+  - linhas horárias para as horas das pontas do intervalo;
+  - a tabela bruta apenas para os trechos ainda não agregados: antes do início
+    das agregações (inicio_agregados) e após a cobertura (cobertura_agregados).
+
+O comando agregar_acessos agrega sempre dias inteiros a partir da meia-noite,
+então o primeiro dia agregado não fica com uma linha diária parcial.
+
+Os cliques em cupons são consolidados por dia e cupom em CliqueAgregado pelo
+comando agregar_cliques, e as séries temporais de cliques seguem a mesma
+ideia: dias agregados vêm de CliqueAgregado e os demais da tabela bruta.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Greatest, TruncDate, TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import AcessoAgregado, AcessoPagina, CliqueAgregado, CliqueCupom
+
+CHAVE_COBERTURA = 'acessos_agregados_cobertura'
+CHAVE_INICIO = 'acessos_agregados_inicio'
+
+
+def _fuso():
+    return timezone.get_default_timezone()
+
+
+def inicio_da_hora(dt):
+    """Trunca a data/hora para o início da hora no horário de Brasília"""
+    return timezone.localtime(dt, _fuso()).replace(minute=0, second=0, microsecond=0)
+
+
+def inicio_do_dia(dt):
+    """Trunca a data/hora para a meia-noite do dia no horário de Brasília"""
+    return timezone.localtime(dt, _fuso()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def proximo_dia(dt):
+    """Meia-noite do dia seguinte (ou a própria data, se já for meia-noite)"""
+    dia = inicio_do_dia(dt)
+    if dia == dt:
+        return dia
+    return inicio_do_dia(dia + timedelta(days=1, hours=1))
+
+
+def intervalo_datas(data_inicio, data_fim):
+    """
+    Converte os filtros de data (YYYY-MM-DD) do relatório de acessos em um
+    intervalo [inicio, fim) timezone-aware. Datas inválidas são ignoradas.
+    """
+    inicio = None
+    fim = None
+    if data_inicio:
+        try:
+            inicio = timezone.make_aware(datetime.strptime(data_inicio, '%Y-%m-%d'))
+        except ValueError:
+            pass
+    if data_fim:
+        try:
+            # Início do dia seguinte, para incluir o dia inteiro
+            fim = timezone.make_aware(datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1))
+        except ValueError:
+            pass
+    return inicio, fim
+
+
+def filtrar_acessos(acessos, inicio=None, fim=None, estado='', cidade=''):
+    """Aplica ao queryset de AcessoPagina os filtros do relatório de acessos"""
+    if inicio:
+        acessos = acessos.filter(data_acesso__gte=inicio)
+    if fim:
+        acessos = acessos.filter(data_acesso__lt=fim)
+    if estado:
+        acessos = acessos.filter(estado__iexact=estado)
+    if cidade:
+        acessos = acessos.filter(cidade__icontains=cidade)
+    return acessos
+
+
+def agregar_acessos(inicio, fim):
+    """
+    Recalcula as agregações horárias de [inicio, fim) a partir dos acessos
+    brutos e, em seguida, as agregações diárias dos dias afetados.
+    Retorna a quantidade de linhas horárias geradas.
+    """
+    from .arquivamento import limite_arquivado
+    
+    inicio = inicio_da_hora(inicio)
+    fim = inicio_da_hora(fim)
+    
+    # Períodos já arquivados não têm mais os acessos brutos: preservar as agregações
+    arquivado_ate = limite_arquivado('acessos')
+    if arquivado_ate is not None and inicio < arquivado_ate:
+        inicio = inicio_da_hora(arquivado_ate)
+    if fim <= inicio:
+        return 0
+
+    with transaction.atomic():
+        AcessoAgregado.objects.filter(
+            granularidade='hora', periodo__gte=inicio, periodo__lt=fim
+        ).delete()
+
+        linhas = (
+            AcessoPagina.objects.filter(data_acesso__gte=inicio, data_acesso__lt=fim)
+            .annotate(hora=TruncHour('data_acesso', tzinfo=_fuso()))
+            .values('hora', 'url', 'estado', 'cidade')
+            .annotate(total=Count('id'), nome=Max('nome_pagina'))
+            .order_by()
+        )
+        horarias = [
+            AcessoAgregado(
+                granularidade='hora',
+                periodo=linha['hora'],
+                url=linha['url'],
+                nome_pagina=linha['nome'] or '',
+                estado=linha['estado'],
+                cidade=linha['cidade'],
+                total=linha['total'],
+            )
+            for linha in linhas
+        ]
+        AcessoAgregado.objects.bulk_create(horarias, batch_size=1000)
+
+        recalcular_dias(inicio_do_dia(inicio), proximo_dia(fim))
+
+    return len(horarias)
+
+
+def recalcular_dias(inicio, fim):
+    """Recalcula as agregações diárias de [inicio, fim) somando as horárias"""
+    AcessoAgregado.objects.filter(
+        granularidade='dia', periodo__gte=inicio, periodo__lt=fim
+    ).delete()
+
+    linhas = (
+        AcessoAgregado.objects.filter(granularidade='hora', periodo__gte=inicio, periodo__lt=fim)
+        .annotate(dia=TruncDay('periodo', tzinfo=_fuso()))
+        .values('dia', 'url', 'estado', 'cidade')
+        .annotate(soma=Sum('total'), nome=Max('nome_pagina'))
+        .order_by()
+    )
+    AcessoAgregado.objects.bulk_create([
+        AcessoAgregado(
+            granularidade='dia',
+            periodo=linha['dia'],
+            url=linha['url'],
+            nome_pagina=linha['nome'] or '',
+            estado=linha['estado'],
+            cidade=linha['cidade'],
+            total=linha['soma'],
+        )
+        for linha in linhas
+    ], batch_size=1000)
+
+
+def descontar_acessos(acessos):
+    """
+    Subtrai das agregações horárias e diárias os acessos do queryset que já
+    foram agregados. Deve ser chamado antes de excluí-los da tabela bruta.
+    """
+    desde = inicio_agregados()
+    cobertura = cobertura_agregados()
+    if desde is None or cobertura is None:
+        return
+
+    grupos = (
+        acessos.filter(data_acesso__gte=desde, data_acesso__lt=cobertura)
+        .annotate(
+            hora=TruncHour('data_acesso', tzinfo=_fuso()),
+            dia=TruncDay('data_acesso', tzinfo=_fuso()),
+        )
+        .values('hora', 'dia', 'url', 'estado', 'cidade')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    for grupo in grupos:
+        for granularidade in ('hora', 'dia'):
+            AcessoAgregado.objects.filter(
+                granularidade=granularidade,
+                periodo=grupo[granularidade],
+                url=grupo['url'],
+                estado=grupo['estado'],
+                cidade=grupo['cidade'],
+            ).update(total=Greatest(F('total') - grupo['total'], Value(0)))
+
+
+def registrar_cobertura(fim, inicio=None):
+    """
+    Registra até quando os acessos já estão agregados (nunca retrocede) e,
+    com `inicio`, desde quando (nunca avança).
+    """
+    if inicio is not None:
+        inicio = inicio_da_hora(inicio)
+        atual = inicio_agregados()
+        if atual is None or inicio < atual:
+            cache.set(CHAVE_INICIO, inicio, None)
+
+    fim = inicio_da_hora(fim)
+    atual = cobertura_agregados()
+    if atual is None or fim > atual:
+        cache.set(CHAVE_COBERTURA, fim, None)
+
+
+def inicio_agregados():
+    """
+    Instante a partir do qual as agregações horárias estão completas; antes
+    dele o relatório lê os acessos brutos. Sem o valor em cache, usa a
+    primeira hora agregada (não há acessos entre o início registrado e ela).
+    """
+    inicio = cache.get(CHAVE_INICIO)
+    if inicio is not None:
+        return inicio
+
+    primeira_hora = AcessoAgregado.objects.filter(granularidade='hora').aggregate(
+        primeira=Min('periodo')
+    )['primeira']
+    if primeira_hora is not None:
+        cache.set(CHAVE_INICIO, primeira_hora, None)
+    return primeira_hora
+
+
+def cobertura_agregados():
+    """
+    Instante até o qual as agregações horárias estão completas.
+    Sem o valor em cache, usa a última hora agregada (estimativa conservadora).
+    """
+    cobertura = cache.get(CHAVE_COBERTURA)
+    if cobertura is not None:
+        return cobertura
+
+    ultima_hora = AcessoAgregado.objects.filter(granularidade='hora').aggregate(
+        ultima=Max('periodo')
+    )['ultima']
+    if ultima_hora is None:
+        return None
+    cobertura = ultima_hora + timedelta(hours=1)
+    cache.set(CHAVE_COBERTURA, cobertura, None)
+    return cobertura
+
+
+def _filtro_periodos(inicio, limite):
+    """
+    Seleciona as linhas agregadas que cobrem [inicio, limite) sem sobreposição:
+    diárias para os dias completos e horárias para as pontas.
+    """
+    primeiro_dia = proximo_dia(inicio) if inicio is not None else None
+    ultimo_dia = inicio_do_dia(limite)
+
+    if primeiro_dia is not None and primeiro_dia >= ultimo_dia:
+        return Q(granularidade='hora', periodo__gte=inicio, periodo__lt=limite)
+
+    filtro_dias = Q(granularidade='dia', periodo__lt=ultimo_dia)
+    if primeiro_dia is not None:
+        filtro_dias &= Q(periodo__gte=primeiro_dia)
+    filtro = filtro_dias | Q(granularidade='hora', periodo__gte=ultimo_dia, periodo__lt=limite)
+    if inicio is not None:
+        filtro |= Q(granularidade='hora', periodo__gte=inicio, periodo__lt=primeiro_dia)
+    return filtro
+
+
+def _filtrar_localizacao(queryset, estado, cidade):
+    if estado:
+        queryset = queryset.filter(estado__iexact=estado)
+    if cidade:
+        queryset = queryset.filter(cidade__icontains=cidade)
+    return queryset
+
+
+def _acumular(queryset, contagem, paginas, nomes, por_estado, por_cidade):
+    """Soma em Python os agrupamentos por página, estado e cidade de uma fonte"""
+    for linha in queryset.values('url').annotate(total=contagem, nome=Max('nome_pagina')).order_by():
+        paginas[linha['url']] += linha['total']
+        nomes.setdefault(linha['url'], linha['nome'])
+
+    for linha in queryset.exclude(estado='').values('estado').annotate(total=contagem).order_by():
+        por_estado[linha['estado']] += linha['total']
+
+    for linha in queryset.exclude(cidade='').exclude(estado='').values('cidade', 'estado').annotate(total=contagem).order_by():
+        por_cidade[(linha['cidade'], linha['estado'])] += linha['total']
+
+
+def estatisticas_acessos(inicio=None, fim=None, estado='', cidade=''):
+    """
+    Estatísticas do relatório de acessos para o intervalo [inicio, fim).
+
+    Retorna um dicionário com paginas_mais_visitadas (top 20), acessos_por_estado,
+    acessos_por_cidade (top 50) e total_acessos, no mesmo formato das consultas
+    agrupadas feitas antes diretamente sobre AcessoPagina.
+    """
+    paginas = Counter()
+    nomes = {}
+    por_estado = Counter()
+    por_cidade = Counter()
+
+    brutos = AcessoPagina.objects.all()
+    if inicio is not None:
+        brutos = brutos.filter(data_acesso__gte=inicio)
+    if fim is not None:
+        brutos = brutos.filter(data_acesso__lt=fim)
+
+    desde = inicio_agregados()
+    cobertura = cobertura_agregados()
+    if desde is not None and cobertura is not None:
+        # Agregações para [desde, cobertura); acessos brutos antes e depois
+        inicio_agregado = max(inicio, desde) if inicio is not None else desde
+        fim_agregado = min(fim, cobertura) if fim is not None else cobertura
+        if fim_agregado > inicio_agregado:
+            agregados = _filtrar_localizacao(
+                AcessoAgregado.objects.filter(_filtro_periodos(inicio_agregado, fim_agregado), total__gt=0),
+                estado, cidade,
+            )
+            _acumular(agregados, Sum('total'), paginas, nomes, por_estado, por_cidade)
+        brutos = brutos.filter(Q(data_acesso__lt=desde) | Q(data_acesso__gte=cobertura))
+
+    brutos = _filtrar_localizacao(brutos, estado, cidade)
+    _acumular(brutos, Count('id'), paginas, nomes, por_estado, por_cidade)
+
+    return {
+        'paginas_mais_visitadas': [
+            {'url': url, 'nome_pagina': nomes.get(url) or '', 'total': total}
+            for url, total in paginas.most_common(20)
+        ],
+        'acessos_por_estado': [
+            {'estado': sigla, 'total': total}
+            for sigla, total in por_estado.most_common()
+        ],
+        'acessos_por_cidade': [
+            {'cidade': nome, 'estado': sigla, 'total': total}
+            for (nome, sigla), total in por_cidade.most_common(50)
+        ],
+        'total_acessos': sum(paginas.values()),
+    }
+
+
+def _inicio_da_data(dia):
+    """Meia-noite (horário de Brasília) de uma data"""
+    return timezone.make_aware(datetime.combine(dia, time.min), _fuso())
+
+
+def _cliques_por_dia(cliques):
+    """Agrupa um queryset de CliqueCupom por cupom e dia (horário de Brasília)"""
+    return (
+        cliques.annotate(dia=TruncDate('data_clique', tzinfo=_fuso()))
+        .values('cupom_id', 'dia')
+        .annotate(total=Count('id'), ips=Count('ip_address', distinct=True))
+        .order_by()
+    )
+
+
+def agregar_cliques(inicio, fim):
+    """
+    Recalcula os totais diários de cliques (CliqueAgregado) dos dias que
+    intersectam [inicio, fim). Dias já arquivados são preservados.
+    Retorna a quantidade de linhas geradas.
+    """
+    from .arquivamento import limite_arquivado
+
+    inicio = inicio_do_dia(inicio)
+    fim = proximo_dia(fim)
+
+    # Dia parcialmente ou totalmente arquivado: os cliques brutos não estão mais completos
+    arquivado_ate = limite_arquivado('cliques')
+    if arquivado_ate is not None and inicio < arquivado_ate:
+        inicio = proximo_dia(arquivado_ate)
+    if fim <= inicio:
+        return 0
+
+    with transaction.atomic():
+        CliqueAgregado.objects.filter(dia__gte=inicio.date(), dia__lt=fim.date()).delete()
+
+        linhas = _cliques_por_dia(CliqueCupom.objects.filter(data_clique__gte=inicio, data_clique__lt=fim))
+        diarias = [
+            CliqueAgregado(
+                cupom_id=linha['cupom_id'],
+                dia=linha['dia'],
+                cliques=linha['total'],
+                ips_unicos=linha['ips'],
+            )
+            for linha in linhas
+        ]
+        CliqueAgregado.objects.bulk_create(diarias, batch_size=1000)
+
+    return len(diarias)
+
+
+def cobertura_cliques():
+    """Primeiro dia ainda não agregado em CliqueAgregado (ou None se não houver agregações)"""
+    ultimo_dia = CliqueAgregado.objects.aggregate(ultimo=Max('dia'))['ultimo']
+    if ultimo_dia is None:
+        return None
+    return ultimo_dia + timedelta(days=1)
+
+
+def serie_cliques(cupom_id, inicio, fim):
+    """
+    Série diária de cliques de um cupom para as datas de [inicio, fim):
+    lista de {'dia', 'cliques', 'ips_unicos'}, com zero nos dias sem cliques.
+    """
+    por_dia = {}
+
+    cobertura = cobertura_cliques()
+    if cobertura is not None and inicio < cobertura:
+        agregados = CliqueAgregado.objects.filter(
+            cupom_id=cupom_id, dia__gte=inicio, dia__lt=min(fim, cobertura)
+        ).values_list('dia', 'cliques', 'ips_unicos')
+        for dia, cliques, ips_unicos in agregados:
+            por_dia[dia] = (cliques, ips_unicos)
+
+    inicio_bruto = max(inicio, cobertura) if cobertura is not None else inicio
+    if inicio_bruto < fim:
+        brutos = CliqueCupom.objects.filter(
+            cupom_id=cupom_id,
+            data_clique__gte=_inicio_da_data(inicio_bruto),
+            data_clique__lt=_inicio_da_data(fim),
+        )
+        for linha in _cliques_por_dia(brutos):
+            por_dia[linha['dia']] = (linha['total'], linha['ips'])
+
+    serie = []
+    dia = inicio
+    while dia < fim:
+        cliques, ips_unicos = por_dia.get(dia, (0, 0))
+        serie.append({'dia': dia, 'cliques': cliques, 'ips_unicos': ips_unicos})
+        dia += timedelta(days=1)
+    return serie
+
+
+def cliques_recentes(dias=30):
+    """Total de cliques por cupom nos últimos `dias` dias (incluindo hoje): {cupom_id: total}"""
+    hoje = timezone.localdate()
+    inicio = hoje - timedelta(days=dias - 1)
+    totais = Counter()
+
+    cobertura = cobertura_cliques()
+    if cobertura is not None and inicio < cobertura:
+        agregados = (
+            CliqueAgregado.objects.filter(dia__gte=inicio, dia__lt=cobertura)
+            .values('cupom_id')
+            .annotate(soma=Sum('cliques'))
+            .order_by()
+        )
+        for linha in agregados:
+            totais[linha['cupom_id']] += linha['soma']
+
+    inicio_bruto = max(inicio, cobertura) if cobertura is not None else inicio
+    brutos = (
+        CliqueCupom.objects.filter(data_clique__gte=_inicio_da_data(inicio_bruto))
+        .values('cupom_id')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    for linha in brutos:
+        totais[linha['cupom_id']] += linha['total']
+    return totais
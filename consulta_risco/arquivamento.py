@@ -0,0 +1,341 @@
+"""
+Retenção e arquivamento dos registros de rastreamento (AcessoPagina; CliqueCupom
+apenas para leitura e restauração de arquivos existentes, ver ARQUIVAVEIS).
+
+Os registros mais antigos que o período de retenção são exportados, um dia
+(horário de Brasília) por vez, para arquivos compactados particionados por data:
+
+    <ARQUIVAMENTO_DIRETORIO>/<tabela>/<AAAA>/<MM>/<tabela>-<AAAA-MM-DD>-<primeiro_id>.csv.gz
+
+(ou .parquet, quando pyarrow está instalado) e só então removidos das tabelas,
+em lotes de chaves primárias. As agregações de acessos (AcessoAgregado) são
+mantidas, então o relatório continua contando o histórico arquivado; o
+comando agregar_acessos não recalcula períodos já arquivados.
+
+Os arquivos podem ser lidos de volta (ler_arquivados / carregar_dataframe)
+ou restaurados nas tabelas (restaurar_arquivados).
+"""
+import csv
+import glob
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from .agregacao import inicio_do_dia, proximo_dia
+from .geoip import abrir_texto
+from .models import AcessoPagina, CliqueCupom
+
+logger = logging.getLogger(__name__)
+
+# nome da tabela arquivada -> (modelo, campo de data usado na partição)
+TABELAS = {
+    'acessos': (AcessoPagina, 'data_acesso'),
+    'cliques': (CliqueCupom, 'data_clique'),
+}
+
+# Tabelas que arquivar() remove do banco. Os totais de cliques de cada cupom no
+# dashboard (num_cliques, filtro com/sem cliques) ainda são contados nos cliques
+# brutos; arquivá-los reduziria esses totais. Arquivos de cliques já gerados
+# continuam legíveis e restauráveis.
+ARQUIVAVEIS = ('acessos',)
+
+FORMATOS = {
+    'csv': '.csv.gz',
+    'parquet': '.parquet',
+}
+
+ARQUIVO_LIMITE = 'arquivado_ate.txt'
+PADRAO_NOME = re.compile(r'^(?P<tabela>[a-z]+)-(?P<dia>\d{4}-\d{2}-\d{2})-(?P<primeiro_id>\d+)\.(csv\.gz|parquet)$')
+
+
+def diretorio_arquivo(tabela=None):
+    """Diretório raiz dos arquivos (configurável via ARQUIVAMENTO_DIRETORIO)"""
+    raiz = str(getattr(settings, 'ARQUIVAMENTO_DIRETORIO', os.path.join(settings.BASE_DIR, 'arquivo')))
+    return os.path.join(raiz, tabela) if tabela else raiz
+
+
+def _campos(modelo):
+    """Colunas exportadas: todos os campos concretos (FKs como <campo>_id)"""
+    return [campo.attname for campo in modelo._meta.concrete_fields]
+
+
+def limite_arquivado(tabela):
+    """Instante até o qual os registros da tabela já foram arquivados (ou None)"""
+    caminho = os.path.join(diretorio_arquivo(tabela), ARQUIVO_LIMITE)
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            return datetime.fromisoformat(arquivo.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _registrar_limite(tabela, limite):
+    atual = limite_arquivado(tabela)
+    if atual is not None and atual >= limite:
+        return
+    diretorio = diretorio_arquivo(tabela)
+    os.makedirs(diretorio, exist_ok=True)
+    temporario = os.path.join(diretorio, f'.tmp-{ARQUIVO_LIMITE}')
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(limite.isoformat())
+    os.replace(temporario, os.path.join(diretorio, ARQUIVO_LIMITE))
+
+
+def _caminho_particao(tabela, dia, primeiro_id, formato):
+    dia_local = timezone.localtime(dia)
+    return os.path.join(
+        diretorio_arquivo(tabela),
+        dia_local.strftime('%Y'),
+        dia_local.strftime('%m'),
+        f'{tabela}-{dia_local.strftime("%Y-%m-%d")}-{primeiro_id}{FORMATOS[formato]}',
+    )
+
+
+def _serializar(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+
+class _EscritorCsv:
+    def __init__(self, caminho, campos):
+        self.arquivo = abrir_texto(caminho, 'wt')
+        self.escritor = csv.writer(self.arquivo)
+        self.escritor.writerow(campos)
+
+    def escrever(self, linhas):
+        self.escritor.writerows([[_serializar(valor) for valor in linha] for linha in linhas])
+
+    def fechar(self):
+        self.arquivo.close()
+
+
+class _EscritorParquet:
+    def __init__(self, caminho, campos, modelo):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        tipos = []
+        for campo in modelo._meta.concrete_fields:
+            tipo_interno = campo.get_internal_type()
+            if tipo_interno in ('AutoField', 'BigAutoField', 'ForeignKey', 'IntegerField', 'BigIntegerField', 'PositiveIntegerField'):
+                tipos.append(pa.int64())
+            elif tipo_interno == 'BooleanField':
+                tipos.append(pa.bool_())
+            elif tipo_interno == 'DateTimeField':
+                tipos.append(pa.timestamp('us', tz='UTC'))
+            else:
+                tipos.append(pa.string())
+        self.campos = campos
+        self.schema = pa.schema(list(zip(campos, tipos)))
+        self.escritor = pq.ParquetWriter(caminho, self.schema, compression='zstd')
+
+    def escrever(self, linhas):
+        colunas = list(zip(*linhas)) if linhas else [[] for _ in self.campos]
+        tabela = self.pa.Table.from_arrays(
+            [self.pa.array(list(coluna), type=self.schema.field(i).type) for i, coluna in enumerate(colunas)],
+            schema=self.schema,
+        )
+        self.escritor.write_table(tabela)
+
+    def fechar(self):
+        self.escritor.close()
+
+
+def _exportar_dia(tabela, queryset, dia, formato, tamanho_lote):
+    """
+    Grava os registros de um dia em um arquivo da partição, lendo o queryset
+    em blocos (iterator). Retorna (caminho, quantidade, maior_id).
+    """
+    modelo = TABELAS[tabela][0]
+    campos = _campos(modelo)
+    linhas = queryset.order_by('id').values_list(*campos).iterator(chunk_size=tamanho_lote)
+
+    primeira = next(linhas, None)
+    if primeira is None:
+        return None, 0, None
+
+    caminho = _caminho_particao(tabela, dia, primeira[campos.index('id')], formato)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = os.path.join(os.path.dirname(caminho), f'.tmp-{os.path.basename(caminho)}')
+
+    if formato == 'parquet':
+        escritor = _EscritorParquet(temporario, campos, modelo)
+    else:
+        escritor = _EscritorCsv(temporario, campos)
+
+    quantidade = 0
+    maior_id = None
+    bloco = [primeira]
+    try:
+        for linha in linhas:
+            bloco.append(linha)
+            if len(bloco) >= tamanho_lote:
+                escritor.escrever(bloco)
+                quantidade += len(bloco)
+                maior_id = bloco[-1][campos.index('id')]
+                bloco = []
+        if bloco:
+            escritor.escrever(bloco)
+            quantidade += len(bloco)
+            maior_id = bloco[-1][campos.index('id')]
+    finally:
+        escritor.fechar()
+
+    # Só substitui o arquivo final depois de gravado por completo
+    os.replace(temporario, caminho)
+    return caminho, quantidade, maior_id
+
+
+def _excluir_em_lotes(queryset, tamanho_lote):
+    excluidos = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:tamanho_lote])
+        if not ids:
+            return excluidos
+        excluidos += queryset.model.objects.filter(id__in=ids).delete()[0]
+
+
+def arquivar(tabela, antes_de, formato='csv', tamanho_lote=5000, simular=False):
+    """
+    Arquiva e remove da tabela os registros anteriores ao dia de `antes_de`.
+
+    Cada dia é exportado por completo antes de seus registros serem excluídos,
+    então uma execução interrompida pode ser repetida sem perda (o arquivo do
+    dia é regravado com o mesmo nome). Retorna a lista de (dia, quantidade, caminho).
+    """
+    if tabela not in ARQUIVAVEIS:
+        raise ValueError(f'A tabela {tabela} não pode ser arquivada')
+
+    modelo, campo_data = TABELAS[tabela]
+    limite = inicio_do_dia(antes_de)
+    antigos = modelo.objects.filter(**{f'{campo_data}__lt': limite})
+
+    resultado = []
+    primeiro = antigos.aggregate(primeiro=Min(campo_data))['primeiro']
+    while primeiro is not None:
+        dia = inicio_do_dia(primeiro)
+        proximo = proximo_dia(dia + timedelta(hours=1))
+        do_dia = antigos.filter(**{f'{campo_data}__gte': dia, f'{campo_data}__lt': proximo})
+
+        if simular:
+            resultado.append((dia, do_dia.count(), None))
+        else:
+            caminho, quantidade, maior_id = _exportar_dia(tabela, do_dia, dia, formato, tamanho_lote)
+            if quantidade:
+                # Registros gravados com atraso após a exportação ficam para a próxima execução
+                _excluir_em_lotes(do_dia.filter(id__lte=maior_id), tamanho_lote)
+                logger.info('Arquivados %d registro(s) de %s em %s', quantidade, tabela, caminho)
+            resultado.append((dia, quantidade, caminho))
+
+        primeiro = antigos.filter(**{f'{campo_data}__gte': proximo}).aggregate(primeiro=Min(campo_data))['primeiro']
+
+    if not simular:
+        _registrar_limite(tabela, limite)
+    return resultado
+
+
+def arquivos_do_intervalo(tabela, inicio=None, fim=None):
+    """Arquivos de partição da tabela cujos dias se sobrepõem a [inicio, fim)"""
+    dia_inicio = timezone.localtime(inicio_do_dia(inicio)).date() if inicio else None
+    dia_fim = timezone.localtime(fim).date() if fim else None
+
+    caminhos = []
+    for caminho in glob.glob(os.path.join(diretorio_arquivo(tabela), '*', '*', f'{tabela}-*')):
+        correspondencia = PADRAO_NOME.match(os.path.basename(caminho))
+        if not correspondencia:
+            continue
+        dia = datetime.strptime(correspondencia.group('dia'), '%Y-%m-%d').date()
+        if dia_inicio and dia < dia_inicio:
+            continue
+        if dia_fim and dia > dia_fim:
+            continue
+        caminhos.append(caminho)
+    return sorted(caminhos)
+
+
+def _ler_arquivo(caminho):
+    if caminho.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        arquivo = pq.ParquetFile(caminho)
+        for bloco in arquivo.iter_batches():
+            yield from bloco.to_pylist()
+    else:
+        with abrir_texto(caminho) as arquivo:
+            yield from csv.DictReader(arquivo)
+
+
+def _converter(modelo, registro):
+    """Converte os valores lidos do arquivo para os tipos dos campos do modelo"""
+    valores = {}
+    for campo in modelo._meta.concrete_fields:
+        valor = registro.get(campo.attname)
+        if valor == '' and campo.null:
+            valor = None
+        elif valor is not None:
+            valor = campo.to_python(valor)
+        valores[campo.attname] = valor
+    return valores
+
+
+def ler_arquivados(tabela, inicio=None, fim=None):
+    """Itera sobre os registros arquivados (dicionários) no intervalo [inicio, fim)"""
+    modelo, campo_data = TABELAS[tabela]
+    dia_atual = None
+    vistos = set()
+    for caminho in arquivos_do_intervalo(tabela, inicio, fim):
+        # Uma execução interrompida entre a exportação e a exclusão pode deixar
+        # o mesmo registro em dois arquivos do dia: ignorar IDs repetidos
+        dia = PADRAO_NOME.match(os.path.basename(caminho)).group('dia')
+        if dia != dia_atual:
+            dia_atual = dia
+            vistos = set()
+
+        for registro in _ler_arquivo(caminho):
+            valores = _converter(modelo, registro)
+            if valores['id'] in vistos:
+                continue
+            vistos.add(valores['id'])
+            data = valores[campo_data]
+            if inicio and data < inicio:
+                continue
+            if fim and data >= fim:
+                continue
+            yield valores
+
+
+def carregar_dataframe(tabela, inicio=None, fim=None):
+    """Registros arquivados do intervalo em um DataFrame do pandas, para relatórios avulsos"""
+    import pandas as pd
+
+    modelo = TABELAS[tabela][0]
+    return pd.DataFrame(list(ler_arquivados(tabela, inicio, fim)), columns=_campos(modelo))
+
+
+def restaurar_arquivados(tabela, inicio=None, fim=None, tamanho_lote=5000):
+    """
+    Recarrega na tabela os registros arquivados do intervalo, preservando os IDs
+    originais (registros já presentes são ignorados). Retorna a quantidade lida.
+    """
+    modelo = TABELAS[tabela][0]
+    quantidade = 0
+    lote = []
+    for valores in ler_arquivados(tabela, inicio, fim):
+        lote.append(modelo(**valores))
+        if len(lote) >= tamanho_lote:
+            modelo.objects.bulk_create(lote, ignore_conflicts=True)
+            quantidade += len(lote)
+            lote = []
+    if lote:
+        modelo.objects.bulk_create(lote, ignore_conflicts=True)
+        quantidade += len(lote)
+    return quantidade
@@ -0,0 +1,186 @@
+"""
+Datas de última atualização do sistema (SistemaAtualizacao) e das páginas
+(PaginaAtualizacao), exibidas no rodapé e nas páginas de termos e LGPD.
+
+Cada avaliação de segurança marcava a atualização com get_or_create + save na
+única linha id=1, e avaliações simultâneas disputavam o lock dessa linha. Agora
+marcar_atualizacao() guarda (data, descrição) no cache e grava no banco no
+máximo uma vez a cada SISTEMA_ATUALIZACAO_INTERVALO segundos (padrão: 60); a
+última marcação do intervalo é gravada pela próxima marcação após o intervalo
+ou pelo comando descarregar_atualizacao. A data exibida nas páginas (context
+processor ultima_atualizacao) é lida do mesmo valor em cache.
+
+Importações e limpezas de dados continuam gravando na hora (gravar_atualizacao,
+usado por SistemaAtualizacao.atualizar_sistema).
+
+As leituras passam por duas camadas: um valor em memória no processo, válido
+por ATUALIZACOES_TTL_LOCAL segundos (padrão: 30), e o cache compartilhado. A
+renderização de uma página pública, portanto, não consulta o banco nem, na
+maior parte das vezes, o cache. Ao gravar, o valor é substituído no cache
+compartilhado e no processo atual; os demais processos o veem em até
+ATUALIZACOES_TTL_LOCAL segundos. As datas das páginas ficam no cache sob uma
+versão (CHAVE_VERSAO_PAGINAS), trocada a cada atualizar_pagina().
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import PaginaAtualizacao, SistemaAtualizacao
+
+logger = logging.getLogger(__name__)
+
+CHAVE_ULTIMA = 'sistema_atualizacao:ultima'
+CHAVE_GRAVADA = 'sistema_atualizacao:gravada'
+CHAVE_VERSAO_PAGINAS = 'pagina_atualizacao_versao'
+CHAVE_PAGINA = 'pagina_atualizacao:{versao}:{nome_pagina}'
+
+# Valores lidos neste processo: {chave: (expira_em, valor)}
+_locais = {}
+
+
+def _ler_local(chave):
+    item = _locais.get(chave)
+    if item is not None and item[0] > time.monotonic():
+        return item[1]
+    return None
+
+
+def _guardar_local(chave, valor):
+    ttl = getattr(settings, 'ATUALIZACOES_TTL_LOCAL', 30)
+    if ttl > 0:
+        _locais[chave] = (time.monotonic() + ttl, valor)
+    return valor
+
+
+def limpar_cache_local():
+    """Descarta os valores em memória deste processo"""
+    _locais.clear()
+
+
+def _gravar(data, descricao):
+    """
+    Grava (data, descrição) na linha id=1 se a data for mais recente que a
+    gravada: um único UPDATE quando a linha existe. Retorna True se gravou.
+    """
+    if SistemaAtualizacao.objects.filter(id=1, data_atualizacao__lt=data).update(
+        data_atualizacao=data, descricao=descricao
+    ):
+        return True
+    _, criada = SistemaAtualizacao.objects.get_or_create(id=1, defaults={'descricao': descricao})
+    return criada
+
+
+def marcar_atualizacao(descricao="Atualização automática"):
+    """Marca uma atualização; a gravação no banco é agrupada por intervalo"""
+    agora = timezone.now()
+    intervalo = getattr(settings, 'SISTEMA_ATUALIZACAO_INTERVALO', 60)
+    _guardar_local(CHAVE_ULTIMA, agora)
+    try:
+        cache.set(CHAVE_ULTIMA, (agora, descricao), None)
+        # Só o primeiro a marcar em cada intervalo grava no banco
+        if not cache.add(CHAVE_GRAVADA, True, intervalo):
+            return agora
+    except Exception as e:
+        # Se o cache não estiver disponível, gravar direto no banco
+        logger.warning('Cache indisponível ao marcar atualização do sistema: %s', str(e))
+    _gravar(agora, descricao)
+    return agora
+
+
+def gravar_atualizacao(descricao="Atualização automática"):
+    """Marca uma atualização gravando-a imediatamente no banco"""
+    agora = timezone.now()
+    _gravar(agora, descricao)
+    _guardar_local(CHAVE_ULTIMA, agora)
+    try:
+        cache.set(CHAVE_ULTIMA, (agora, descricao), None)
+    except Exception:
+        pass
+    return agora
+
+
+def descarregar_atualizacao():
+    """Grava no banco a última atualização marcada no cache. Retorna True se gravou"""
+    valor = cache.get(CHAVE_ULTIMA)
+    if valor is None:
+        return False
+    return _gravar(*valor)
+
+
+def ultima_atualizacao():
+    """Data da última atualização: da memória do processo, do cache ou, na primeira leitura, do banco"""
+    data = _ler_local(CHAVE_ULTIMA)
+    if data is not None:
+        return data
+
+    try:
+        valor = cache.get(CHAVE_ULTIMA)
+    except Exception:
+        valor = None
+    if valor is not None:
+        return _guardar_local(CHAVE_ULTIMA, valor[0])
+
+    obj, _ = SistemaAtualizacao.objects.get_or_create(id=1, defaults={'descricao': 'Inicialização do sistema'})
+    try:
+        # add: não sobrescrever uma marcação feita enquanto o banco era lido
+        cache.add(CHAVE_ULTIMA, (obj.data_atualizacao, obj.descricao), None)
+    except Exception:
+        pass
+    return _guardar_local(CHAVE_ULTIMA, obj.data_atualizacao)
+
+
+def _nova_versao():
+    return int(timezone.now().timestamp() * 1000)
+
+
+def _chave_pagina(nome_pagina):
+    versao = cache.get_or_set(CHAVE_VERSAO_PAGINAS, _nova_versao, None)
+    return CHAVE_PAGINA.format(versao=versao, nome_pagina=nome_pagina)
+
+
+def atualizar_pagina(nome_pagina, descricao=None):
+    """Grava a data de atualização da página e troca a versão do cache. Retorna a data"""
+    descricao = descricao or f'Atualização da página {nome_pagina}'
+    pagina, criada = PaginaAtualizacao.objects.get_or_create(
+        nome_pagina=nome_pagina, defaults={'descricao': descricao}
+    )
+    if not criada:
+        pagina.descricao = descricao
+        pagina.save(update_fields=['descricao', 'data_atualizacao'])
+
+    # Nova versão: as datas das páginas são relidas do banco na próxima leitura
+    try:
+        cache.set(CHAVE_VERSAO_PAGINAS, _nova_versao(), None)
+    except Exception:
+        pass
+    _guardar_local(('pagina', nome_pagina), pagina.data_atualizacao)
+    return pagina.data_atualizacao
+
+
+def ultima_atualizacao_pagina(nome_pagina):
+    """Data da última atualização da página (criando o registro na primeira leitura)"""
+    chave_local = ('pagina', nome_pagina)
+    data = _ler_local(chave_local)
+    if data is not None:
+        return data
+
+    try:
+        chave = _chave_pagina(nome_pagina)
+        data = cache.get(chave)
+    except Exception:
+        chave = data = None
+    if data is not None:
+        return _guardar_local(chave_local, data)
+
+    pagina, _ = PaginaAtualizacao.objects.get_or_create(
+        nome_pagina=nome_pagina, defaults={'descricao': 'Inicialização da página'}
+    )
+    if chave is not None:
+        try:
+            cache.add(chave, pagina.data_atualizacao, None)
+        except Exception:
+            pass
+    return _guardar_local(chave_local, pagina.data_atualizacao)
@@ -0,0 +1,302 @@
+"""
+Médias das avaliações de segurança e cálculo do nível de risco de um trajeto.
+
+A média de cada cidade considera as avaliações dos últimos 3 anos (desde 1º de
+janeiro do ano retrasado). Cada avaliação atualiza, na mesma transação, a soma
+e a quantidade de notas da cidade no ano (AvaliacaoAgregada), então a média
+soma no máximo três linhas. As cidades são identificadas pelo nome
+normalizado (normalizar_nome_cidade: sem acentos, pontuação e diferença de
+maiúsculas), então "São Paulo", "sao paulo" e "SAO PAULO" são a mesma cidade
+e todas as consultas são buscas exatas em índices. Ela fica em cache por 1 hora, sendo descartada
+quando uma nova avaliação da cidade é registrada. As médias de várias cidades
+são obtidas com uma única leitura do cache e uma única consulta para as que
+faltarem (medias_avaliacoes).
+
+O nível de risco compara as posições das cidades no ranking de criminalidade
+(quanto menor a posição, mais violenta a cidade), como fazia a função
+calcularNivelRisco do main.js, agora no servidor para a API /api/risco/.
+"""
+from functools import reduce
+from operator import or_
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .cache_cidades import versao_cidades
+from .models import AvaliacaoAgregada, AvaliacaoSeguranca, Cidade, Estado, get_brasilia_time, normalizar_nome_cidade
+
+CHAVE_MEDIA = 'avaliacao_media_{estado_id}_{cidade}'
+CHAVE_CIDADE = 'risco_cidade:{versao}:{cidade_id}'
+
+TEMPO_MEDIA = 3600
+TEMPO_CIDADE = 24 * 60 * 60
+
+
+def normalizar_cidade(cidade_nome):
+    """Nome da cidade como chave das agregações e do cache ("São Paulo" -> "SAO PAULO")"""
+    return normalizar_nome_cidade(cidade_nome)
+
+
+def chave_media(estado_id, cidade_nome):
+    return CHAVE_MEDIA.format(estado_id=estado_id, cidade=normalizar_cidade(cidade_nome).replace(' ', '_'))
+
+
+def resolver_cidade(estado, cidade_nome):
+    """Cidade cadastrada do estado com o mesmo nome normalizado, ou None"""
+    return Cidade.objects.filter(
+        estado=estado, nome_normalizado=normalizar_cidade(cidade_nome)
+    ).order_by('id').first()
+
+
+def primeiro_ano_avaliacoes(agora=None):
+    """Ano retrasado (horário de Brasília): a média considera os últimos 3 anos"""
+    return timezone.localtime(agora or timezone.now()).year - 2
+
+
+def _aplicar_agregada(estado_id, cidade_nome, ano, soma, quantidade):
+    """Soma (ou subtrai, com valores negativos) uma variação na agregação da cidade no ano"""
+    filtro = {'estado_id': estado_id, 'cidade': normalizar_cidade(cidade_nome), 'ano': ano}
+    if quantidade < 0:
+        # Retirar uma nota nunca cria linha
+        AvaliacaoAgregada.objects.filter(**filtro).update(
+            soma=F('soma') + soma, quantidade=F('quantidade') + quantidade
+        )
+        return
+
+    agregada, criada = AvaliacaoAgregada.objects.get_or_create(
+        **filtro, defaults={'soma': soma, 'quantidade': quantidade}
+    )
+    if not criada:
+        AvaliacaoAgregada.objects.filter(id=agregada.id).update(
+            soma=F('soma') + soma, quantidade=F('quantidade') + quantidade
+        )
+
+
+def registrar_avaliacao(email, estado, cidade_nome, nota):
+    """
+    Cria ou atualiza a avaliação do email para a cidade e ajusta AvaliacaoAgregada
+    na mesma transação: uma nota alterada é retirada do ano em que foi dada e
+    somada ao ano atual. Retorna (avaliacao, created).
+
+    O nome informado é resolvido para a cidade cadastrada sem diferenciar
+    acentos e maiúsculas; quando encontrada, a avaliação é ligada a ela e
+    guardada com o nome cadastrado. A avaliação anterior do email é procurada
+    pela cidade cadastrada ou pelo nome normalizado, para encontrar também as
+    que não estão ligadas (cidade cadastrada depois do voto, ou excluída e
+    importada de novo).
+    """
+    chave_cidade = normalizar_cidade(cidade_nome)
+    cidade = resolver_cidade(estado, cidade_nome)
+    if cidade is not None:
+        cidade_nome = cidade.nome
+
+    with transaction.atomic():
+        # Poucas avaliações por email e estado: comparar os nomes normalizados aqui
+        anteriores = AvaliacaoSeguranca.objects.select_for_update().filter(
+            email=email, estado=estado
+        ).order_by('-data_avaliacao', '-id')
+        avaliacao = next((
+            anterior for anterior in anteriores
+            if (cidade is not None and anterior.cidade_cadastrada_id == cidade.id)
+            or normalizar_cidade(anterior.cidade) == chave_cidade
+        ), None)
+
+        if avaliacao is None:
+            avaliacao = AvaliacaoSeguranca.objects.create(
+                email=email, estado=estado, cidade=cidade_nome, cidade_cadastrada=cidade, nota=nota
+            )
+            created = True
+        else:
+            ano_anterior = timezone.localtime(avaliacao.data_avaliacao).year
+            _aplicar_agregada(estado.id, avaliacao.cidade, ano_anterior, -avaliacao.nota, -1)
+            # Atualizar a nota e a data de avaliação (UTC-3)
+            avaliacao.nota = nota
+            avaliacao.data_avaliacao = get_brasilia_time()
+            if cidade is not None:
+                avaliacao.cidade_cadastrada = cidade
+            avaliacao.save()
+            created = False
+
+        _aplicar_agregada(estado.id, cidade_nome, timezone.localtime(avaliacao.data_avaliacao).year, nota, 1)
+
+    invalidar_media(estado.id, cidade_nome)
+    return avaliacao, created
+
+
+def _resultado_media(soma, quantidade):
+    if not quantidade:
+        return {'success': True, 'tem_avaliacoes': False}
+    return {
+        'success': True,
+        'tem_avaliacoes': True,
+        'media': round(soma / quantidade, 2),
+        'quantidade': quantidade,
+    }
+
+
+def calcular_media(estado_id, cidade_nome):
+    """
+    Média das avaliações da cidade nos últimos 3 anos, sem cache.
+    Levanta Estado.DoesNotExist se o estado não existir.
+    """
+    estado = Estado.objects.get(id=estado_id)
+    resultado = AvaliacaoAgregada.objects.filter(
+        estado=estado,
+        cidade=normalizar_cidade(cidade_nome),
+        ano__gte=primeiro_ano_avaliacoes(),
+    ).aggregate(soma=Sum('soma'), quantidade=Sum('quantidade'))
+    return _resultado_media(resultado['soma'], resultado['quantidade'])
+
+
+def media_avaliacoes(estado_id, cidade_nome):
+    """Média das avaliações da cidade (ver calcular_media), guardada em cache por 1 hora"""
+    chave = chave_media(estado_id, cidade_nome)
+    try:
+        resultado = cache.get(chave)
+    except Exception:
+        # Se o cache não estiver disponível, continuar sem cache
+        resultado = None
+    if resultado is not None:
+        return resultado
+
+    resultado = calcular_media(estado_id, cidade_nome)
+    try:
+        cache.set(chave, resultado, TEMPO_MEDIA)
+    except Exception:
+        pass
+    return resultado
+
+
+def medias_avaliacoes(cidades):
+    """
+    Médias das avaliações de várias cidades, no formato de media_avaliacoes.
+
+    Recebe pares (estado_id, nome da cidade) e retorna {par: média}. Lê todas
+    as médias do cache de uma vez e calcula as que faltam em uma única
+    consulta a AvaliacaoAgregada, guardando-as no cache.
+    """
+    chaves = {chave_media(estado_id, nome): (estado_id, nome) for estado_id, nome in cidades}
+    try:
+        em_cache = cache.get_many(list(chaves))
+    except Exception:
+        # Se o cache não estiver disponível, calcular todas
+        em_cache = {}
+    medias = {chaves[chave]: valor for chave, valor in em_cache.items()}
+
+    faltantes = {chave: par for chave, par in chaves.items() if chave not in em_cache}
+    if faltantes:
+        filtro = reduce(or_, (
+            Q(estado_id=estado_id, cidade=normalizar_cidade(nome)) for estado_id, nome in faltantes.values()
+        ))
+        somas = {}
+        linhas = AvaliacaoAgregada.objects.filter(filtro, ano__gte=primeiro_ano_avaliacoes()).values_list(
+            'estado_id', 'cidade', 'soma', 'quantidade'
+        )
+        # Até três linhas (anos) por cidade
+        for estado_id, cidade, soma_ano, quantidade_ano in linhas:
+            chave = chave_media(estado_id, cidade)
+            soma, quantidade = somas.get(chave, (0, 0))
+            somas[chave] = (soma + soma_ano, quantidade + quantidade_ano)
+
+        novos = {chave: _resultado_media(*somas.get(chave, (0, 0))) for chave in faltantes}
+        try:
+            cache.set_many(novos, TEMPO_MEDIA)
+        except Exception:
+            pass
+        medias.update((faltantes[chave], valor) for chave, valor in novos.items())
+
+    return medias
+
+
+def invalidar_media(estado_id, cidade_nome):
+    """Descarta a média em cache da cidade (chamar após registrar uma avaliação)"""
+    try:
+        cache.delete(chave_media(estado_id, cidade_nome))
+    except Exception:
+        # Se o cache não estiver disponível, continuar sem invalidar
+        pass
+
+
+def calcular_nivel_risco(posicao_origem, posicao_destino):
+    """
+    Nível de risco ao ir da cidade de origem para a de destino.
+
+    Destino com posição maior que a origem (menos violento) reduz o risco.
+    Sem alguma das posições o nível não pode ser calculado (tipo 'indisponivel').
+    """
+    if posicao_origem is None or posicao_destino is None:
+        return {'nivel': None, 'tipo': 'indisponivel'}
+
+    diferenca = posicao_destino - posicao_origem
+    if diferenca > 0:
+        nivel = 'Reduzido'
+    elif diferenca == 0:
+        nivel = 'Inalterado'
+    else:
+        nivel = 'Aumentado'
+    return {'nivel': nivel, 'tipo': 'calculado', 'diferenca': abs(diferenca)}
+
+
+def _dados_cidades(cidade_ids):
+    """Dados das cidades {id: {...}}, em cache até a próxima importação de cidades"""
+    versao = versao_cidades()
+    chaves = {CHAVE_CIDADE.format(versao=versao, cidade_id=cidade_id): cidade_id for cidade_id in cidade_ids}
+    dados = {chaves[chave]: valor for chave, valor in cache.get_many(list(chaves)).items()}
+
+    faltantes = [cidade_id for cidade_id in cidade_ids if cidade_id not in dados]
+    if faltantes:
+        novos = {
+            cidade['id']: {
+                'id': cidade['id'],
+                'nome': cidade['nome'],
+                'estado_id': cidade['estado_id'],
+                'estado': cidade['estado__sigla'],
+                'posicao': cidade['posicao'],
+            }
+            for cidade in Cidade.objects.filter(id__in=faltantes).values(
+                'id', 'nome', 'estado_id', 'estado__sigla', 'posicao'
+            )
+        }
+        cache.set_many(
+            {CHAVE_CIDADE.format(versao=versao, cidade_id=cidade_id): valor for cidade_id, valor in novos.items()},
+            TEMPO_CIDADE,
+        )
+        dados.update(novos)
+    return dados
+
+
+def medias_por_cidade(cidade_ids):
+    """
+    Médias das avaliações por ID de cidade: {cidade_id: {...}} com os dados da
+    cidade (nome, estado, posicao) e media/quantidade_avaliacoes.
+    IDs inexistentes são omitidos.
+    """
+    cidades = _dados_cidades(cidade_ids)
+    medias = medias_avaliacoes([(cidade['estado_id'], cidade['nome']) for cidade in cidades.values()])
+
+    resultado = {}
+    for cidade_id, cidade in cidades.items():
+        media = medias[(cidade['estado_id'], cidade['nome'])]
+        resultado[cidade_id] = dict(
+            cidade, media=media.get('media'), quantidade_avaliacoes=media.get('quantidade', 0)
+        )
+    return resultado
+
+
+def consultar_risco(origem_id, destino_id):
+    """
+    Posições, médias das avaliações e nível de risco do trajeto origem -> destino.
+    Retorna None se alguma das cidades não existir.
+    """
+    cidades = medias_por_cidade([origem_id, destino_id])
+    if origem_id not in cidades or destino_id not in cidades:
+        return None
+
+    return {
+        'success': True,
+        'origem': cidades[origem_id],
+        'destino': cidades[destino_id],
+        'risco': calcular_nivel_risco(cidades[origem_id]['posicao'], cidades[destino_id]['posicao']),
+    }
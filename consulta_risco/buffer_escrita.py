@@ -0,0 +1,142 @@
+"""
+Buffer de escrita por processo para registros de rastreamento.
+
+Em vez de um INSERT por requisição, os objetos são enfileirados em memória e
+gravados em lote (bulk_create) por uma thread em segundo plano quando a fila
+atinge BUFFER_ESCRITA_TAMANHO_LOTE itens ou a cada BUFFER_ESCRITA_INTERVALO
+segundos. A fila é descarregada também no encerramento do worker (atexit e
+hook worker_exit do Gunicorn).
+"""
+import atexit
+import collections
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BufferEscrita:
+    """Fila em memória descarregada em lote por uma thread em segundo plano"""
+
+    def __init__(self, tamanho_lote=None, intervalo=None, tamanho_maximo=None):
+        self.tamanho_lote = tamanho_lote or getattr(settings, 'BUFFER_ESCRITA_TAMANHO_LOTE', 200)
+        self.intervalo = intervalo or getattr(settings, 'BUFFER_ESCRITA_INTERVALO', 5)
+        self.tamanho_maximo = tamanho_maximo or getattr(settings, 'BUFFER_ESCRITA_TAMANHO_MAXIMO', 10000)
+        self._pid = None
+        self._fila = None
+        self._sinal = None
+        self._thread = None
+        self._lock_descarga = threading.Lock()
+        self._lock_inicio = threading.Lock()
+        self.descartados = 0
+
+    def _garantir_thread(self):
+        """
+        Inicia a fila e a thread no processo atual.
+
+        Com preload_app=True o módulo é importado no master do Gunicorn antes do
+        fork, por isso a thread só é criada no primeiro uso dentro de cada worker.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock_inicio:
+            if self._pid == os.getpid():
+                return
+            self._fila = collections.deque()
+            self._sinal = threading.Event()
+            self._thread = threading.Thread(target=self._executar, name='buffer-escrita', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def adicionar(self, objeto):
+        """Enfileira uma instância de modelo (ainda não salva) para gravação em lote"""
+        self._garantir_thread()
+
+        if len(self._fila) >= self.tamanho_maximo:
+            # Banco indisponível ou lento: descartar o mais antigo em vez de crescer sem limite
+            self._fila.popleft()
+            self.descartados += 1
+            if self.descartados % 1000 == 1:
+                logger.warning('Buffer de escrita cheio: %d registro(s) descartado(s)', self.descartados)
+
+        self._fila.append(objeto)
+        if len(self._fila) >= self.tamanho_lote:
+            self._sinal.set()
+
+    def pendentes(self):
+        """Quantidade de registros aguardando gravação neste processo"""
+        if self._pid != os.getpid():
+            return 0
+        return len(self._fila)
+
+    def _executar(self):
+        while True:
+            self._sinal.wait(self.intervalo)
+            self._sinal.clear()
+            try:
+                close_old_connections()
+                self.descarregar()
+            except Exception as e:
+                logger.error('Erro no buffer de escrita: %s', str(e))
+
+    def descarregar(self):
+        """Grava todos os registros pendentes, agrupados por modelo, com bulk_create"""
+        if self._pid != os.getpid():
+            return 0
+
+        with self._lock_descarga:
+            objetos = []
+            while self._fila:
+                try:
+                    objetos.append(self._fila.popleft())
+                except IndexError:
+                    break
+
+            if not objetos:
+                return 0
+
+            por_modelo = collections.defaultdict(list)
+            for objeto in objetos:
+                por_modelo[type(objeto)].append(objeto)
+
+            gravados = 0
+            for modelo, lote in por_modelo.items():
+                try:
+                    modelo.objects.bulk_create(lote, batch_size=self.tamanho_lote)
+                    gravados += len(lote)
+                except Exception as e:
+                    logger.error('Erro ao gravar %d registro(s) de %s em lote: %s', len(lote), modelo.__name__, str(e))
+
+            logger.debug('Buffer de escrita: %d registro(s) gravado(s)', gravados)
+            return gravados
+
+
+buffer_escrita = BufferEscrita()
+
+
+def registrar(objeto):
+    """
+    Registra um objeto de rastreamento conforme REGISTRO_ACESSOS_MODO:
+    'buffer' (padrão) enfileira para gravação em lote; 'direto' salva imediatamente.
+    """
+    if getattr(settings, 'REGISTRO_ACESSOS_MODO', 'buffer') == 'direto':
+        objeto.save()
+    else:
+        buffer_escrita.adicionar(objeto)
+
+
+def descarregar_todos():
+    """Descarrega o buffer do processo atual (usado no encerramento do worker)"""
+    try:
+        gravados = buffer_escrita.descarregar()
+        if gravados:
+            logger.info('Buffer de escrita descarregado no encerramento: %d registro(s)', gravados)
+    except Exception as e:
+        logger.error('Erro ao descarregar buffer de escrita no encerramento: %s', str(e))
+
+
+atexit.register(descarregar_todos)
@@ -0,0 +1,139 @@
+"""
+Busca de cidades por prefixo para o autocompletar (/api/cidades/buscar/).
+
+Os nomes de todas as cidades são normalizados (sem acentos, em maiúsculas e
+sem pontuação) e guardados em uma lista ordenada, uma entrada para o nome
+completo e uma para cada palavra seguinte ("PAULO" encontra "SAO PAULO").
+Cada busca localiza o prefixo com bisect e percorre apenas as entradas que
+o compartilham, sem consultar o banco.
+
+O índice é montado uma vez por processo e remontado quando a versão dos dados
+de cidades muda (ver cache_cidades.regenerar_cidades), verificando a versão
+no máximo a cada CIDADES_INTERVALO_VERIFICACAO segundos.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .cache_cidades import versao_cidades
+from .models import Cidade, normalizar_nome_cidade
+
+logger = logging.getLogger(__name__)
+
+# Palavras curtas demais para iniciar uma busca por palavra ("DE", "DO", "DAS"...)
+TAMANHO_MINIMO_PALAVRA = 3
+
+
+class IndiceCidades:
+    """
+    Entradas (chave normalizada, ordem, índice da cidade) ordenadas por chave.
+
+    A ordem 0 marca o nome completo e 1 as palavras seguintes, para que os
+    nomes que começam com o texto buscado apareçam primeiro.
+    """
+
+    def __init__(self, cidades=()):
+        self._cidades = []
+        entradas = []
+        for cidade in cidades:
+            indice = len(self._cidades)
+            self._cidades.append(cidade)
+            chave = normalizar_nome_cidade(cidade['nome'])
+            entradas.append((chave, 0, indice))
+            palavras = chave.split(' ')
+            for posicao in range(1, len(palavras)):
+                if len(palavras[posicao]) >= TAMANHO_MINIMO_PALAVRA:
+                    entradas.append((' '.join(palavras[posicao:]), 1, indice))
+
+        entradas.sort()
+        self._chaves = [entrada[0] for entrada in entradas]
+        self._ordens = [entrada[1] for entrada in entradas]
+        self._indices = [entrada[2] for entrada in entradas]
+
+    def __len__(self):
+        return len(self._cidades)
+
+    @classmethod
+    def carregar(cls):
+        """Monta o índice com todas as cidades do banco"""
+        return cls(
+            Cidade.objects.order_by('nome').values(
+                'id', 'nome', 'posicao', 'estado_id', 'estado__sigla'
+            )
+        )
+
+    def buscar(self, texto, limite=10, estado_id=None):
+        """Até `limite` cidades cujo nome (ou uma palavra do nome) começa com o texto"""
+        prefixo = normalizar_nome_cidade(texto)
+        if not prefixo or limite <= 0:
+            return []
+
+        inicio = bisect.bisect_left(self._chaves, prefixo)
+        completos = []
+        palavras = []
+        vistos = set()
+        for posicao in range(inicio, len(self._chaves)):
+            if not self._chaves[posicao].startswith(prefixo):
+                break
+            indice = self._indices[posicao]
+            if indice in vistos:
+                continue
+            cidade = self._cidades[indice]
+            if estado_id is not None and cidade['estado_id'] != estado_id:
+                continue
+            vistos.add(indice)
+            (completos if self._ordens[posicao] == 0 else palavras).append(cidade)
+            if len(completos) >= limite:
+                break
+
+        return [
+            {
+                'id': cidade['id'],
+                'nome': cidade['nome'],
+                'estado_id': cidade['estado_id'],
+                'estado': cidade['estado__sigla'],
+                'posicao': cidade['posicao'],
+            }
+            for cidade in (completos + palavras)[:limite]
+        ]
+
+
+_indice = None
+_indice_versao = None
+_ultima_verificacao = 0.0
+_lock = threading.Lock()
+
+
+def obter_indice():
+    """Retorna o índice deste processo, remontando-o se a versão das cidades mudou"""
+    global _indice, _indice_versao, _ultima_verificacao
+
+    intervalo = getattr(settings, 'CIDADES_INTERVALO_VERIFICACAO', 30)
+    agora = time.monotonic()
+    if _indice is not None and agora - _ultima_verificacao < intervalo:
+        return _indice
+
+    with _lock:
+        if _indice is not None and agora - _ultima_verificacao < intervalo:
+            return _indice
+        _ultima_verificacao = agora
+
+        versao = versao_cidades()
+        if versao != _indice_versao:
+            try:
+                _indice = IndiceCidades.carregar()
+                _indice_versao = versao
+                logger.info('Índice de busca de cidades carregado: %d cidades', len(_indice))
+            except Exception as e:
+                logger.error('Erro ao carregar índice de busca de cidades: %s', str(e))
+                if _indice is None:
+                    _indice = IndiceCidades()
+        return _indice
+
+
+def buscar_cidades(texto, limite=10, estado_id=None):
+    """Busca cidades pelo início do nome, sem diferenciar acentos e maiúsculas"""
+    return obter_indice().buscar(texto, limite, estado_id)
@@ -0,0 +1,79 @@
+"""
+JSON pré-serializado das cidades de cada estado para a API /api/cidades/.
+
+A lista de cidades só muda quando importar_dados_criminalidade ou os comandos
+de limpeza de cidades são executados. Por isso o JSON de cada estado é montado
+uma vez e guardado no cache sob um número de versão; esses comandos chamam
+regenerar_cidades(), que troca a versão e remonta todos os estados. A versão
+também compõe o ETag da resposta, e o navegador revalida com If-None-Match
+(resposta 304, sem corpo).
+"""
+import json
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Cidade, Estado
+
+CHAVE_CIDADES = 'cidades_estado:{versao}:{estado_id}'
+CHAVE_VERSAO = 'cidades_estado_versao'
+
+# Blobs de versões antigas expiram sozinhos; os atuais são remontados se expirarem
+TEMPO_BLOB = 7 * 24 * 60 * 60
+
+
+def _nova_versao():
+    return int(timezone.now().timestamp() * 1000)
+
+
+def versao_cidades():
+    """Versão atual dos dados de cidades (muda a cada regenerar_cidades)"""
+    return cache.get_or_set(CHAVE_VERSAO, _nova_versao, None)
+
+
+def _serializar(cidades):
+    return json.dumps(cidades).encode('utf-8')
+
+
+def obter_cidades_json(estado_id):
+    """
+    Retorna (versao, conteúdo JSON em bytes) com as cidades do estado, no
+    formato [{'id', 'nome', 'posicao'}, ...] ordenado por nome.
+    """
+    versao = versao_cidades()
+    chave = CHAVE_CIDADES.format(versao=versao, estado_id=estado_id)
+    conteudo = cache.get(chave)
+    if conteudo is None:
+        cidades = list(
+            Cidade.objects.filter(estado_id=estado_id).order_by('nome').values('id', 'nome', 'posicao')
+        )
+        conteudo = _serializar(cidades)
+        # Estados inexistentes não ocupam o cache
+        if cidades:
+            cache.set(chave, conteudo, TEMPO_BLOB)
+    return versao, conteudo
+
+
+def regenerar_cidades():
+    """
+    Troca a versão e monta o JSON de todos os estados em uma única consulta.
+    Chamar ao final de cada importação ou limpeza de cidades. Retorna a nova versão.
+    """
+    por_estado = defaultdict(list)
+    for cidade in Cidade.objects.order_by('nome').values('id', 'nome', 'posicao', 'estado_id'):
+        estado_id = cidade.pop('estado_id')
+        por_estado[estado_id].append(cidade)
+
+    versao = _nova_versao()
+    cache.set_many(
+        {
+            CHAVE_CIDADES.format(versao=versao, estado_id=estado_id): _serializar(por_estado[estado_id])
+            for estado_id in Estado.objects.values_list('id', flat=True)
+            if por_estado[estado_id]
+        },
+        TEMPO_BLOB,
+    )
+    # A versão só muda depois que os blobs novos existem
+    cache.set(CHAVE_VERSAO, versao, None)
+    return versao
@@ -0,0 +1,69 @@
+"""
+Cache da lista de cupons válidos exibida na página pública /cupons/.
+
+A lista só muda quando um administrador altera cupons/lojas ou quando uma
+data_inicio/data_validade é atingida. Por isso o tempo de expiração do cache
+é o tempo até a próxima dessas datas (limitado a CUPONS_CACHE_TTL_MAXIMO), e
+as views administrativas chamam invalidar_cache_cupons() após cada alteração.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import Cupom
+
+CHAVE_CUPONS_VALIDOS = 'cupons_validos:{versao}'
+CHAVE_VERSAO = 'cupons_validos_versao'
+
+
+def segundos_ate_proxima_mudanca(agora=None):
+    """
+    Segundos até o próximo cupom ativo começar ou um cupom válido expirar,
+    limitados a CUPONS_CACHE_TTL_MAXIMO (padrão: 1 hora).
+    """
+    agora = agora or timezone.now()
+    maximo = getattr(settings, 'CUPONS_CACHE_TTL_MAXIMO', 3600)
+
+    limites = Cupom.objects.filter(ativo=True).aggregate(
+        proximo_inicio=Min('data_inicio', filter=Q(data_inicio__gt=agora)),
+        proxima_validade=Min('data_validade', filter=Q(data_validade__gte=agora)),
+    )
+    proximas = [data for data in limites.values() if data is not None]
+    if not proximas:
+        return maximo
+
+    # Arredondar para baixo: o cache expira no máximo no instante da mudança
+    segundos = int((min(proximas) - agora).total_seconds())
+    return max(1, min(segundos, maximo))
+
+
+def obter_cupons_validos():
+    """Lista de cupons válidos (com tipo_cupom) na ordem de exibição, a partir do cache"""
+    # A chave inclui a versão: uma lista montada durante uma invalidação é
+    # gravada sob a versão antiga e nunca mais lida
+    versao = cache.get_or_set(CHAVE_VERSAO, _nova_versao, None)
+    chave = CHAVE_CUPONS_VALIDOS.format(versao=versao)
+    cupons = cache.get(chave)
+    if cupons is None:
+        agora = timezone.now()
+        cupons = list(
+            Cupom.objects.validos(agora)
+            .select_related('tipo_cupom')
+            .order_by('ordem_exibicao', 'data_criacao')
+        )
+        cache.set(chave, cupons, segundos_ate_proxima_mudanca(agora))
+    return cupons
+
+
+def _nova_versao():
+    return int(timezone.now().timestamp() * 1000)
+
+
+def invalidar_cache_cupons():
+    """Descarta a lista em cache (chamar após criar, editar ou excluir cupons e lojas)"""
+    try:
+        cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        # Versão ainda não existe (ou foi expulsa do cache): qualquer valor novo serve
+        cache.set(CHAVE_VERSAO, _nova_versao(), None)
@@ -0,0 +1,154 @@
+"""
+Exclusão em lote dos acessos filtrados no relatório administrativo.
+
+Em vez de um único DELETE sobre todo o conjunto dentro da requisição HTTP, a
+exclusão é registrada em ExclusaoAcessos e executada em segundo plano por
+lotes de chaves primárias (EXCLUSAO_ACESSOS_TAMANHO_LOTE), cada um em sua
+própria transação curta. O progresso fica gravado no registro da exclusão e
+é consultado pela página do relatório. Exclusões interrompidas (reinício do
+worker, deploy) são retomadas pelo comando processar_exclusoes_acessos e, no
+modo 'thread', também por retomar_abandonadas(), chamada ao solicitar uma nova
+exclusão ou consultar o progresso: uma exclusão ativa sem progresso há
+EXCLUSAO_ACESSOS_INATIVA_MINUTOS minutos (padrão: 10) é considerada abandonada.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .agregacao import descontar_acessos, filtrar_acessos, intervalo_datas
+from .models import AcessoPagina, ExclusaoAcessos
+
+logger = logging.getLogger(__name__)
+
+STATUS_ATIVOS = ('pendente', 'em_andamento')
+
+
+def acessos_da_exclusao(exclusao):
+    """Queryset dos acessos abrangidos pelos filtros de uma exclusão"""
+    inicio, fim = intervalo_datas(exclusao.data_inicio, exclusao.data_fim)
+    acessos = AcessoPagina.objects.filter(id__lte=exclusao.id_maximo)
+    return filtrar_acessos(acessos, inicio, fim, exclusao.estado, exclusao.cidade)
+
+
+def executar_exclusao(exclusao_id, tamanho_lote=None, pausa=None):
+    """
+    Exclui os acessos de uma exclusão em lotes de IDs e registra o progresso.
+    Pode ser chamada novamente para retomar uma exclusão interrompida.
+    """
+    tamanho_lote = tamanho_lote or getattr(settings, 'EXCLUSAO_ACESSOS_TAMANHO_LOTE', 5000)
+    if pausa is None:
+        pausa = getattr(settings, 'EXCLUSAO_ACESSOS_PAUSA', 0.1)
+
+    exclusao = ExclusaoAcessos.objects.get(pk=exclusao_id)
+    if exclusao.status == 'concluida':
+        return exclusao
+
+    exclusao.status = 'em_andamento'
+    exclusao.mensagem_erro = ''
+    exclusao.save(update_fields=['status', 'mensagem_erro', 'data_atualizacao'])
+
+    acessos = acessos_da_exclusao(exclusao)
+    ultimo_id = 0
+    try:
+        while True:
+            ids = list(
+                acessos.filter(id__gt=ultimo_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:tamanho_lote]
+            )
+            if not ids:
+                break
+            ultimo_id = ids[-1]
+
+            excluidos = _excluir_lote(ids)
+
+            exclusao.total_excluidos += excluidos
+            exclusao.save(update_fields=['total_excluidos', 'data_atualizacao'])
+
+            if pausa:
+                # Intervalo entre lotes para não monopolizar o banco
+                time.sleep(pausa)
+    except Exception as e:
+        logger.error('Erro na exclusão de acessos #%s: %s', exclusao.pk, str(e))
+        exclusao.status = 'erro'
+        exclusao.mensagem_erro = str(e)
+        exclusao.save(update_fields=['status', 'mensagem_erro', 'data_atualizacao'])
+        return exclusao
+
+    exclusao.status = 'concluida'
+    exclusao.data_conclusao = timezone.now()
+    exclusao.save(update_fields=['status', 'data_conclusao', 'data_atualizacao'])
+    logger.info('Exclusão de acessos #%s concluída: %d registro(s) excluído(s)', exclusao.pk, exclusao.total_excluidos)
+    return exclusao
+
+
+def _excluir_lote(ids, tentativas=3):
+    """Exclui um lote de IDs em uma transação, repetindo em bloqueios temporários"""
+    for tentativa in range(1, tentativas + 1):
+        try:
+            lote = AcessoPagina.objects.filter(id__in=ids)
+            with transaction.atomic():
+                descontar_acessos(lote)
+                excluidos, _ = lote.delete()
+            return excluidos
+        except OperationalError as e:
+            # Ex.: "database is locked" (SQLite) ou deadlock detectado (PostgreSQL)
+            if tentativa == tentativas:
+                raise
+            logger.warning('Lote de exclusão bloqueado (tentativa %d): %s', tentativa, str(e))
+            time.sleep(tentativa)
+
+
+def _executar_em_thread(exclusao_id):
+    close_old_connections()
+    try:
+        executar_exclusao(exclusao_id)
+    except Exception as e:
+        logger.error('Erro ao executar exclusão de acessos #%s: %s', exclusao_id, str(e))
+    finally:
+        connection.close()
+
+
+def retomar_abandonadas():
+    """
+    No modo 'thread', reinicia as exclusões ativas sem progresso recente (a
+    thread morreu com o worker). Cada exclusão é reservada com um UPDATE
+    condicional, para que só um processo a retome. Retorna os IDs retomados.
+    """
+    if getattr(settings, 'EXCLUSAO_ACESSOS_MODO', 'thread') == 'comando':
+        # O cron (processar_exclusoes_acessos) já retoma as interrompidas
+        return []
+
+    limite = timezone.now() - timedelta(minutes=getattr(settings, 'EXCLUSAO_ACESSOS_INATIVA_MINUTOS', 10))
+    retomadas = []
+    abandonadas = ExclusaoAcessos.objects.filter(status__in=STATUS_ATIVOS, data_atualizacao__lt=limite)
+    for exclusao in abandonadas:
+        reservada = ExclusaoAcessos.objects.filter(
+            pk=exclusao.pk, status__in=STATUS_ATIVOS, data_atualizacao__lt=limite
+        ).update(data_atualizacao=timezone.now())
+        if reservada:
+            logger.warning('Exclusão de acessos #%s sem progresso desde %s: retomando', exclusao.pk, exclusao.data_atualizacao)
+            iniciar_exclusao(exclusao)
+            retomadas.append(exclusao.pk)
+    return retomadas
+
+
+def iniciar_exclusao(exclusao):
+    """
+    Dispara a exclusão em uma thread em segundo plano, conforme EXCLUSAO_ACESSOS_MODO:
+    'thread' (padrão) ou 'comando' (apenas registra; o cron executa
+    processar_exclusoes_acessos).
+    """
+    if getattr(settings, 'EXCLUSAO_ACESSOS_MODO', 'thread') == 'comando':
+        return
+    threading.Thread(
+        target=_executar_em_thread,
+        args=(exclusao.pk,),
+        name=f'exclusao-acessos-{exclusao.pk}',
+        daemon=True,
+    ).start()
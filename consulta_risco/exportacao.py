@@ -0,0 +1,92 @@
+"""
+Exportação em streaming dos acessos às páginas e dos cliques em cupons.
+
+As linhas são lidas com .iterator(chunk_size=...) (cursor no servidor no
+PostgreSQL) e formatadas uma a uma como CSV ou JSON Lines, sem montar o
+resultado em memória. Usado pelas views de exportação do relatório e pelo
+comando exportar_registros.
+"""
+import csv
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from .agregacao import filtrar_acessos
+from .models import AcessoPagina, CliqueCupom
+
+CAMPOS_ACESSOS = [
+    'id', 'data_acesso', 'url', 'nome_pagina', 'ip_address',
+    'estado', 'cidade', 'referer', 'user_agent',
+]
+
+CAMPOS_CLIQUES = [
+    'id', 'data_clique', 'cupom_id', 'cupom__titulo', 'cupom__loja',
+    'ip_address', 'user_agent',
+]
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+}
+
+
+def _tamanho_bloco():
+    return getattr(settings, 'EXPORTACAO_TAMANHO_BLOCO', 2000)
+
+
+def linhas_acessos(inicio=None, fim=None, estado='', cidade=''):
+    """Tuplas (na ordem de CAMPOS_ACESSOS) dos acessos filtrados, em ordem de ID"""
+    acessos = filtrar_acessos(AcessoPagina.objects.all(), inicio, fim, estado, cidade)
+    return acessos.order_by('id').values_list(*CAMPOS_ACESSOS).iterator(chunk_size=_tamanho_bloco())
+
+
+def linhas_cliques(inicio=None, fim=None):
+    """
+    Tuplas (na ordem de CAMPOS_CLIQUES) dos cliques no intervalo, em ordem de ID.
+    Os cliques não têm localização, então apenas o filtro de datas se aplica.
+    """
+    cliques = CliqueCupom.objects.all()
+    if inicio:
+        cliques = cliques.filter(data_clique__gte=inicio)
+    if fim:
+        cliques = cliques.filter(data_clique__lt=fim)
+    return cliques.order_by('id').values_list(*CAMPOS_CLIQUES).iterator(chunk_size=_tamanho_bloco())
+
+
+def _valor(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        # Exportar no horário de Brasília, como exibido no relatório
+        return timezone.localtime(valor).isoformat()
+    return valor
+
+
+class _Eco:
+    """Pseudo-arquivo que apenas devolve o texto escrito (csv.writer em streaming)"""
+
+    def write(self, valor):
+        return valor
+
+
+def formatar_csv(campos, linhas):
+    """Gera o CSV linha a linha, começando pelo cabeçalho"""
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow([campo.replace('__', '_') for campo in campos])
+    for linha in linhas:
+        yield escritor.writerow([_valor(valor) for valor in linha])
+
+
+def formatar_jsonl(campos, linhas):
+    """Gera um objeto JSON por linha (JSON Lines)"""
+    chaves = [campo.replace('__', '_') for campo in campos]
+    for linha in linhas:
+        yield json.dumps(dict(zip(chaves, (_valor(valor) for valor in linha))), ensure_ascii=False) + '\n'
+
+
+def formatar(formato, campos, linhas):
+    if formato == 'jsonl':
+        return formatar_jsonl(campos, linhas)
+    return formatar_csv(campos, linhas)
@@ -0,0 +1,248 @@
+"""
+Geolocalização offline de endereços IP.
+
+A tabela de faixas é gerada pelo comando `atualizar_geoip` a partir de uma base
+pública (DB-IP Lite, GeoLite2 CSV ou MMDB) e gravada como CSV compactado com as
+colunas: inicio, fim, estado, cidade. Cada processo carrega a tabela uma única
+vez em listas ordenadas de inteiros e resolve cada IP com bisect, sem I/O de rede.
+"""
+import bisect
+import csv
+import gzip
+import ipaddress
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+ESTADOS_SIGLAS = {
+    'Acre': 'AC', 'Alagoas': 'AL', 'Amapá': 'AP', 'Amazonas': 'AM',
+    'Bahia': 'BA', 'Ceará': 'CE', 'Distrito Federal': 'DF',
+    'Espírito Santo': 'ES', 'Goiás': 'GO', 'Maranhão': 'MA',
+    'Mato Grosso': 'MT', 'Mato Grosso do Sul': 'MS', 'Minas Gerais': 'MG',
+    'Pará': 'PA', 'Paraíba': 'PB', 'Paraná': 'PR', 'Pernambuco': 'PE',
+    'Piauí': 'PI', 'Rio de Janeiro': 'RJ', 'Rio Grande do Norte': 'RN',
+    'Rio Grande do Sul': 'RS', 'Rondônia': 'RO', 'Roraima': 'RR',
+    'Santa Catarina': 'SC', 'São Paulo': 'SP', 'Sergipe': 'SE',
+    'Tocantins': 'TO'
+}
+
+COLUNAS_TABELA = ['inicio', 'fim', 'estado', 'cidade']
+
+
+def converter_estado_para_sigla(estado_nome):
+    """Converte nome do estado para sigla"""
+    return ESTADOS_SIGLAS.get(estado_nome, estado_nome[:2].upper() if estado_nome else '')
+
+
+def caminho_tabela():
+    """Caminho do arquivo com as faixas de IP (configurável via GEOIP_TABELA)"""
+    return str(getattr(
+        settings,
+        'GEOIP_TABELA',
+        os.path.join(settings.BASE_DIR, 'geoip', 'faixas_ip_brasil.csv.gz')
+    ))
+
+
+def abrir_texto(caminho, modo='rt'):
+    """Abre um arquivo texto, compactado com gzip ou não, conforme a extensão"""
+    if str(caminho).endswith('.gz'):
+        return gzip.open(caminho, modo, encoding='utf-8', newline='')
+    return open(caminho, modo[0], encoding='utf-8', newline='')
+
+
+class TabelaGeoIP:
+    """
+    Faixas de IP ordenadas por endereço inicial.
+
+    As faixas de IPv4 e IPv6 ficam em listas separadas, já que os inteiros dos
+    dois espaços de endereçamento se sobrepõem. As localizações são deduplicadas
+    e referenciadas por índice para reduzir o uso de memória.
+    """
+
+    def __init__(self, faixas=()):
+        agrupadas = {4: [], 6: []}
+        locais = {}
+        for inicio, fim, estado, cidade in faixas:
+            inicio_ip = ipaddress.ip_address(inicio)
+            fim_ip = ipaddress.ip_address(fim)
+            local = locais.setdefault((cidade, estado), len(locais))
+            agrupadas[inicio_ip.version].append((int(inicio_ip), int(fim_ip), local))
+
+        self._locais = [None] * len(locais)
+        for local, indice in locais.items():
+            self._locais[indice] = local
+
+        self._inicios = {}
+        self._fins = {}
+        self._indices = {}
+        for versao, lista in agrupadas.items():
+            lista.sort()
+            self._inicios[versao] = [item[0] for item in lista]
+            self._fins[versao] = [item[1] for item in lista]
+            self._indices[versao] = [item[2] for item in lista]
+
+    def __len__(self):
+        return sum(len(inicios) for inicios in self._inicios.values())
+
+    @classmethod
+    def carregar(cls, caminho):
+        """Carrega a tabela a partir do CSV gerado pelo comando atualizar_geoip"""
+        with abrir_texto(caminho) as arquivo:
+            leitor = csv.DictReader(arquivo)
+            return cls(
+                (linha['inicio'], linha['fim'], linha['estado'], linha['cidade'])
+                for linha in leitor
+            )
+
+    def resolver(self, ip_address):
+        """Retorna (cidade, estado) do IP ou ('', '') quando não encontrado"""
+        try:
+            ip = ipaddress.ip_address(ip_address.strip())
+        except (ValueError, AttributeError):
+            return '', ''
+
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+
+        valor = int(ip)
+        inicios = self._inicios[ip.version]
+        posicao = bisect.bisect_right(inicios, valor) - 1
+        if posicao < 0 or valor > self._fins[ip.version][posicao]:
+            return '', ''
+        return self._locais[self._indices[ip.version][posicao]]
+
+
+_tabela = None
+_tabela_mtime = None
+_ultima_verificacao = 0.0
+_lock = threading.Lock()
+
+
+def obter_tabela():
+    """
+    Retorna a tabela carregada neste processo.
+
+    O arquivo é relido quando sua data de modificação muda (após um novo
+    `atualizar_geoip`), verificando no máximo a cada GEOIP_INTERVALO_VERIFICACAO segundos.
+    """
+    global _tabela, _tabela_mtime, _ultima_verificacao
+
+    intervalo = getattr(settings, 'GEOIP_INTERVALO_VERIFICACAO', 60)
+    agora = time.monotonic()
+    if _tabela is not None and agora - _ultima_verificacao < intervalo:
+        return _tabela
+
+    with _lock:
+        if _tabela is not None and agora - _ultima_verificacao < intervalo:
+            return _tabela
+        _ultima_verificacao = agora
+
+        caminho = caminho_tabela()
+        try:
+            mtime = os.path.getmtime(caminho)
+        except OSError:
+            if _tabela is None:
+                logger.warning('Tabela GeoIP não encontrada em %s. Execute: python manage.py atualizar_geoip <arquivo>', caminho)
+                _tabela = TabelaGeoIP()
+            return _tabela
+
+        if mtime != _tabela_mtime:
+            try:
+                _tabela = TabelaGeoIP.carregar(caminho)
+                _tabela_mtime = mtime
+                logger.info('Tabela GeoIP carregada: %d faixas', len(_tabela))
+            except Exception as e:
+                logger.error('Erro ao carregar tabela GeoIP: %s', str(e))
+                if _tabela is None:
+                    _tabela = TabelaGeoIP()
+        return _tabela
+
+
+def resolver_localizacao(ip_address):
+    """Resolve (cidade, estado) de um IP usando apenas a tabela local"""
+    if not ip_address:
+        return '', ''
+    return obter_tabela().resolver(ip_address)
+
+
+class LimitadorTaxa:
+    """Espaça chamadas para respeitar um limite de requisições por minuto"""
+
+    def __init__(self, requisicoes_por_minuto):
+        self.intervalo = 60.0 / requisicoes_por_minuto if requisicoes_por_minuto else 0.0
+        self._proxima = 0.0
+
+    def aguardar(self):
+        agora = time.monotonic()
+        if agora < self._proxima:
+            time.sleep(self._proxima - agora)
+            agora = self._proxima
+        self._proxima = agora + self.intervalo
+
+
+class ResolvedorLocal:
+    """Resolve pela tabela local de faixas de IP (sem rede, sem limite de taxa)"""
+
+    def resolver(self, ip_address):
+        tabela = obter_tabela()
+        if not len(tabela):
+            # Tabela ausente: não marcar acessos como processados
+            return None
+        return tabela.resolver(ip_address)
+
+
+class ResolvedorIpApi:
+    """
+    Resolve pela API gratuita do ip-api.com (limite: 45 requisições por minuto).
+
+    Retorna None em falhas de rede ou respostas inválidas (não JSON), para que
+    o acesso continue pendente e seja tentado novamente na próxima execução.
+    """
+    URL = 'http://ip-api.com/json/{ip}?fields=status,message,countryCode,regionName,city&lang=pt-BR'
+
+    def __init__(self, requisicoes_por_minuto=45, timeout=5):
+        self.limitador = LimitadorTaxa(requisicoes_por_minuto)
+        self.timeout = timeout
+
+    def resolver(self, ip_address):
+        import requests
+
+        self.limitador.aguardar()
+        try:
+            response = requests.get(self.URL.format(ip=ip_address), timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            logger.debug(f'Erro na requisição de geolocalização - IP: {ip_address}, Erro: {str(e)}')
+            return None
+
+        if response.status_code != 200:
+            logger.debug(f'API de geolocalização retornou HTTP {response.status_code} - IP: {ip_address}')
+            return None
+
+        try:
+            data = response.json()
+        except ValueError:
+            # Página de limite de requisições em HTML, corpo vazio etc.
+            logger.debug(f'API de geolocalização retornou resposta que não é JSON - IP: {ip_address}')
+            return None
+        if not isinstance(data, dict):
+            logger.debug(f'API de geolocalização retornou JSON inesperado - IP: {ip_address}')
+            return None
+
+        if data.get('status') != 'success':
+            logger.debug(f'API retornou erro - IP: {ip_address}, Message: {data.get("message")}')
+            return '', ''
+        if data.get('countryCode') != 'BR':
+            return '', ''
+        return data.get('city', ''), converter_estado_para_sigla(data.get('regionName', ''))
+
+
+RESOLVEDORES = {
+    'local': ResolvedorLocal,
+    'ip-api': ResolvedorIpApi,
+}
@@ -0,0 +1,106 @@
+"""
+Contagem amostrada de impressões dos cupons na página /cupons/.
+
+Apenas uma fração das exibições da página (IMPRESSOES_AMOSTRAGEM, padrão 10%)
+é registrada, e cada exibição amostrada vale 1/IMPRESSOES_AMOSTRAGEM
+impressões. Os totais ficam em contadores no cache, um por cupom e dia, e o
+comando descarregar_impressoes os soma em ImpressaoCupom periodicamente, em
+vez de uma linha por impressão. Com a taxa de cliques (CTR) do dashboard é
+possível distinguir um cupom pouco visto de um cupom pouco clicado.
+
+O comando lê os contadores em outro processo, então é necessário um cache
+compartilhado (Redis em produção); com o LocMemCache do desenvolvimento as
+impressões ficam restritas a cada processo.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Cupom, ImpressaoCupom
+
+CHAVE_IMPRESSOES = 'impressoes_cupom:{dia}:{cupom_id}'
+
+# Os contadores só precisam durar até serem descarregados
+TEMPO_CONTADOR = 2 * 24 * 60 * 60
+
+
+def _chave(dia, cupom_id):
+    return CHAVE_IMPRESSOES.format(dia=dia.isoformat(), cupom_id=cupom_id)
+
+
+def _incrementar(chave, valor):
+    try:
+        cache.incr(chave, valor)
+    except ValueError:
+        # Contador ainda não existe: criar; se outro processo criou antes, incrementar
+        if not cache.add(chave, valor, TEMPO_CONTADOR):
+            cache.incr(chave, valor)
+
+
+def registrar_impressoes(cupom_ids):
+    """
+    Registra (com amostragem) uma exibição dos cupons informados.
+    Retorna True se esta exibição foi amostrada.
+    """
+    taxa = getattr(settings, 'IMPRESSOES_AMOSTRAGEM', 0.1)
+    if taxa <= 0 or not cupom_ids or random.random() >= taxa:
+        return False
+
+    peso = max(1, round(1 / taxa))
+    dia = timezone.localdate()
+    for cupom_id in cupom_ids:
+        _incrementar(_chave(dia, cupom_id), peso)
+    return True
+
+
+def descarregar_impressoes(dias=2):
+    """
+    Soma em ImpressaoCupom os contadores do cache dos últimos `dias` dias
+    (incluindo hoje) e desconta dos contadores o valor gravado.
+    Retorna o total de impressões gravadas.
+    """
+    hoje = timezone.localdate()
+    cupom_ids = list(Cupom.objects.values_list('id', flat=True))
+    total = 0
+
+    for deslocamento in range(dias):
+        dia = hoje - timedelta(days=deslocamento)
+        chaves = {_chave(dia, cupom_id): cupom_id for cupom_id in cupom_ids}
+        valores = {chave: valor for chave, valor in cache.get_many(list(chaves)).items() if valor}
+        if not valores:
+            continue
+
+        with transaction.atomic():
+            for chave, valor in valores.items():
+                atualizados = ImpressaoCupom.objects.filter(cupom_id=chaves[chave], dia=dia).update(
+                    impressoes=F('impressoes') + valor
+                )
+                if not atualizados:
+                    ImpressaoCupom.objects.create(cupom_id=chaves[chave], dia=dia, impressoes=valor)
+
+        # Descontar (em vez de apagar) preserva o que foi contado durante a gravação
+        for chave, valor in valores.items():
+            try:
+                cache.decr(chave, valor)
+            except ValueError:
+                pass
+            total += valor
+
+    return total
+
+
+def impressoes_recentes(dias=30):
+    """Total de impressões por cupom nos últimos `dias` dias (incluindo hoje): {cupom_id: total}"""
+    inicio = timezone.localdate() - timedelta(days=dias - 1)
+    linhas = (
+        ImpressaoCupom.objects.filter(dia__gte=inicio)
+        .values('cupom_id')
+        .annotate(soma=Sum('impressoes'))
+        .order_by()
+    )
+    return {linha['cupom_id']: linha['soma'] for linha in linhas}
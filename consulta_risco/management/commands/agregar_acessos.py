@@ -0,0 +1,81 @@
+"""
+Comando para consolidar os acessos às páginas em agregações horárias e diárias
+
+Por padrão recalcula as últimas 48 horas fechadas, o que também incorpora
+acessos gravados com atraso (buffer de escrita) ou geolocalizados depois
+(comando geolocalizar_acessos). Recomenda-se agendar no cron a cada hora:
+
+    5 * * * * python manage.py agregar_acessos
+
+O relatório lê da tabela bruta os acessos anteriores ao início das agregações,
+então a primeira execução não precisa cobrir todo o histórico; --desde
+(ex.: --desde 2025-01-01) agrega também os acessos mais antigos. Um período
+que começa antes do que já foi agregado é estendido até a meia-noite, para que
+o primeiro dia agregado fique completo. Períodos já arquivados pelo
+arquivar_registros não são recalculados.
+"""
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from consulta_risco.agregacao import agregar_acessos, inicio_agregados, inicio_da_hora, inicio_do_dia, registrar_cobertura
+
+
+class Command(BaseCommand):
+    help = 'Consolida os acessos às páginas em agregações por hora e por dia'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas',
+            type=int,
+            default=48,
+            help='Quantidade de horas fechadas a recalcular (padrão: 48)'
+        )
+        parser.add_argument(
+            '--desde',
+            type=str,
+            help='Recalcular a partir desta data (YYYY-MM-DD), ignorando --horas'
+        )
+        parser.add_argument(
+            '--margem-minutos',
+            type=int,
+            default=10,
+            help='Minutos de margem antes de considerar uma hora fechada (padrão: 10)'
+        )
+
+    def handle(self, *args, **options):
+        agora = timezone.now()
+        fim = inicio_da_hora(agora - timedelta(minutes=options['margem_minutos']))
+
+        if options['desde']:
+            try:
+                inicio = timezone.make_aware(datetime.strptime(options['desde'], '%Y-%m-%d'))
+            except ValueError:
+                self.stdout.write(self.style.ERROR('❌ Data inválida em --desde (use YYYY-MM-DD)'))
+                return
+        else:
+            inicio = fim - timedelta(hours=options['horas'])
+
+        # Antes do início atual das agregações: agregar o primeiro dia inteiro
+        desde = inicio_agregados()
+        if desde is None or inicio < desde:
+            inicio = inicio_do_dia(inicio)
+
+        # Processar em blocos diários para manter as transações curtas
+        total_linhas = 0
+        bloco_inicio = inicio
+        while bloco_inicio < fim:
+            bloco_fim = min(bloco_inicio + timedelta(days=1), fim)
+            total_linhas += agregar_acessos(bloco_inicio, bloco_fim)
+            bloco_inicio = bloco_fim
+
+        registrar_cobertura(fim, inicio)
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Acessos agregados de {timezone.localtime(inicio).strftime("%d/%m/%Y %H:%M")} '
+            f'até {timezone.localtime(fim).strftime("%d/%m/%Y %H:%M")}'
+        ))
+        self.stdout.write(self.style.SUCCESS(f'Linhas horárias geradas: {total_linhas}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
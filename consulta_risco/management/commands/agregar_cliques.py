@@ -0,0 +1,64 @@
+"""
+Comando para consolidar os cliques em cupons em totais diários por cupom
+
+Por padrão recalcula os 2 últimos dias fechados (horário de Brasília), o que
+também incorpora cliques gravados com atraso pelo buffer de escrita. O dia
+atual continua sendo contado na tabela bruta. Recomenda-se agendar no cron
+uma vez por dia, logo após a meia-noite:
+
+    15 0 * * * python manage.py agregar_cliques
+
+Na primeira execução, agregue todo o histórico com --desde (ex.: --desde 2025-01-01).
+Dias já arquivados pelo arquivar_registros não são recalculados.
+"""
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from consulta_risco.agregacao import agregar_cliques, inicio_do_dia
+
+
+class Command(BaseCommand):
+    help = 'Consolida os cliques em cupons em totais diários por cupom'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=2,
+            help='Quantidade de dias fechados a recalcular (padrão: 2)'
+        )
+        parser.add_argument(
+            '--desde',
+            type=str,
+            help='Recalcular a partir desta data (YYYY-MM-DD), ignorando --dias'
+        )
+
+    def handle(self, *args, **options):
+        fim = inicio_do_dia(timezone.now())
+
+        if options['desde']:
+            try:
+                inicio = timezone.make_aware(datetime.strptime(options['desde'], '%Y-%m-%d'))
+            except ValueError:
+                self.stdout.write(self.style.ERROR('❌ Data inválida em --desde (use YYYY-MM-DD)'))
+                return
+        else:
+            inicio = inicio_do_dia(fim - timedelta(days=options['dias'], hours=-1))
+
+        # Processar um dia por vez para manter as transações curtas
+        total_linhas = 0
+        bloco_inicio = inicio_do_dia(inicio)
+        while bloco_inicio < fim:
+            bloco_fim = inicio_do_dia(bloco_inicio + timedelta(days=1, hours=1))
+            total_linhas += agregar_cliques(bloco_inicio, bloco_fim)
+            bloco_inicio = bloco_fim
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Cliques agregados de {timezone.localtime(inicio).strftime("%d/%m/%Y")} '
+            f'até {(timezone.localtime(fim) - timedelta(days=1)).strftime("%d/%m/%Y")}'
+        ))
+        self.stdout.write(self.style.SUCCESS(f'Linhas diárias geradas: {total_linhas}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
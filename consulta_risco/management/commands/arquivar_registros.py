@@ -0,0 +1,95 @@
+"""
+Comando para arquivar os registros de rastreamento antigos
+
+Move os acessos às páginas mais antigos que o período de retenção para
+arquivos compactados particionados por data (ver consulta_risco/arquivamento.py),
+mantendo a tabela principal pequena. Os cliques em cupons não são arquivados,
+pois os totais por cupom do dashboard são contados nos cliques brutos.
+Recomenda-se agendar no cron diariamente:
+
+    30 3 * * * python manage.py arquivar_registros
+
+Execute antes o agregar_acessos, para que os acessos arquivados já estejam
+incluídos nas agregações do relatório.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from consulta_risco.arquivamento import ARQUIVAVEIS, FORMATOS, arquivar
+
+
+class Command(BaseCommand):
+    help = 'Arquiva em arquivos compactados os acessos mais antigos que o período de retenção'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=getattr(settings, 'ARQUIVAMENTO_RETENCAO_DIAS', 180),
+            help='Manter nas tabelas os registros dos últimos N dias (padrão: ARQUIVAMENTO_RETENCAO_DIAS ou 180)'
+        )
+        parser.add_argument(
+            '--tabelas',
+            nargs='+',
+            choices=sorted(ARQUIVAVEIS),
+            default=sorted(ARQUIVAVEIS),
+            help='Tabelas a arquivar (padrão: todas)'
+        )
+        parser.add_argument(
+            '--formato',
+            type=str,
+            choices=sorted(FORMATOS),
+            default=getattr(settings, 'ARQUIVAMENTO_FORMATO', 'csv'),
+            help='Formato dos arquivos: csv (CSV compactado com gzip, padrão) ou parquet (requer pyarrow)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Registros lidos e excluídos por lote (padrão: 5000)'
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Apenas mostrar quantos registros seriam arquivados, sem alterar nada'
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1:
+            self.stdout.write(self.style.ERROR('❌ O período de retenção deve ser de pelo menos 1 dia'))
+            return
+
+        if options['formato'] == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                self.stdout.write(self.style.ERROR('❌ O formato parquet requer o pacote pyarrow (pip install pyarrow)'))
+                return
+
+        antes_de = timezone.now() - timedelta(days=options['dias'])
+        if options['simular']:
+            self.stdout.write(self.style.WARNING('⚠️ MODO SIMULAÇÃO - Nenhum registro será alterado'))
+
+        totais = {}
+        for tabela in options['tabelas']:
+            self.stdout.write(f'Arquivando {tabela} anteriores a {timezone.localtime(antes_de).strftime("%d/%m/%Y")}...')
+            resultado = arquivar(
+                tabela,
+                antes_de,
+                formato=options['formato'],
+                tamanho_lote=options['lote'],
+                simular=options['simular'],
+            )
+            for dia, quantidade, caminho in resultado:
+                self.stdout.write(f'  {timezone.localtime(dia).strftime("%d/%m/%Y")}: {quantidade} registro(s)'
+                                  + (f' -> {caminho}' if caminho else ''))
+            totais[tabela] = sum(quantidade for _, quantidade, _ in resultado)
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        for tabela, total in totais.items():
+            acao = 'a arquivar' if options['simular'] else 'arquivados'
+            self.stdout.write(self.style.SUCCESS(f'✅ {tabela}: {total} registro(s) {acao}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from consulta_risco.cache_cupons import invalidar_cache_cupons
 from consulta_risco.models import Cupom, TipoCupom
 
 
@@ -32,6 +33,9 @@ class Command(BaseCommand):
                     self.style.WARNING(f'Cupom {cupom.id} ({cupom.loja}) não encontrou loja correspondente')
                 )
         
+        if associados:
+            invalidar_cache_cupons()
+        
         self.stdout.write(
             self.style.SUCCESS(f'\nResumo:')
         )
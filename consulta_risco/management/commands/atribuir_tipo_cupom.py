@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from consulta_risco.cache_cupons import invalidar_cache_cupons
 from consulta_risco.models import Cupom, TipoCupom
 
 
@@ -21,6 +22,7 @@ class Command(BaseCommand):
         
         if count > 0:
             cupons_sem_tipo.update(tipo_cupom=tipo_padrao)
+            invalidar_cache_cupons()
             self.stdout.write(
                 self.style.SUCCESS(f'{count} cupom(ns) atualizado(s) com tipo padrão "Desconto".')
             )
@@ -0,0 +1,159 @@
+"""
+Comando para gerar/atualizar a tabela local de geolocalização por IP
+usada pelo AcessoPaginaMiddleware (sem chamadas a APIs externas)
+
+Formatos de origem aceitos:
+  - dbip:    DB-IP Lite City CSV (ip_start, ip_end, continent, country, stateprov, city, ...)
+  - geolite2: GeoLite2-City-Blocks-IPv4/IPv6 CSV + arquivo de locais (--locais)
+  - mmdb:    banco GeoLite2/DB-IP em formato MMDB (requer o pacote maxminddb)
+  - simples: CSV já no formato inicio,fim,estado,cidade
+"""
+import csv
+import ipaddress
+import os
+
+from django.core.management.base import BaseCommand
+
+from consulta_risco.geoip import (
+    COLUNAS_TABELA, abrir_texto, caminho_tabela, converter_estado_para_sigla, TabelaGeoIP
+)
+
+
+class Command(BaseCommand):
+    help = 'Gera a tabela local de faixas de IP do Brasil para geolocalização offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'origem',
+            nargs='+',
+            type=str,
+            help='Arquivo(s) de origem (.csv, .csv.gz ou .mmdb)'
+        )
+        parser.add_argument(
+            '--formato',
+            type=str,
+            choices=['dbip', 'geolite2', 'mmdb', 'simples'],
+            default='dbip',
+            help='Formato do arquivo de origem (padrão: dbip)'
+        )
+        parser.add_argument(
+            '--locais',
+            type=str,
+            help='Arquivo GeoLite2-City-Locations (obrigatório para --formato geolite2)'
+        )
+        parser.add_argument(
+            '--saida',
+            type=str,
+            help=f'Arquivo de saída (padrão: {caminho_tabela()})'
+        )
+
+    def handle(self, *args, **options):
+        formato = options['formato']
+        saida = options['saida'] or caminho_tabela()
+
+        for origem in options['origem']:
+            if not os.path.exists(origem):
+                self.stdout.write(self.style.ERROR(f'❌ Arquivo não encontrado: {origem}'))
+                return
+
+        try:
+            if formato == 'dbip':
+                faixas = self.ler_dbip(options['origem'])
+            elif formato == 'geolite2':
+                if not options['locais']:
+                    self.stdout.write(self.style.ERROR('❌ Informe o arquivo de locais com --locais'))
+                    return
+                faixas = self.ler_geolite2(options['origem'], options['locais'])
+            elif formato == 'mmdb':
+                faixas = self.ler_mmdb(options['origem'])
+            else:
+                faixas = self.ler_simples(options['origem'])
+
+            faixas.sort(key=lambda f: (ipaddress.ip_address(f[0]).version, int(ipaddress.ip_address(f[0]))))
+        except ImportError:
+            self.stdout.write(self.style.ERROR('❌ O formato mmdb requer o pacote maxminddb (pip install maxminddb)'))
+            return
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'❌ Erro ao ler arquivo de origem: {e}'))
+            return
+
+        if not faixas:
+            self.stdout.write(self.style.WARNING('Nenhuma faixa de IP do Brasil encontrada na origem'))
+            return
+
+        # Gravar em arquivo temporário e substituir de forma atômica,
+        # para que os workers nunca leiam uma tabela pela metade
+        os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+        temporario = os.path.join(os.path.dirname(os.path.abspath(saida)), f'.tmp-{os.path.basename(saida)}')
+        with abrir_texto(temporario, 'wt') as arquivo:
+            escritor = csv.writer(arquivo)
+            escritor.writerow(COLUNAS_TABELA)
+            escritor.writerows(faixas)
+        os.replace(temporario, saida)
+
+        # Validar o arquivo gerado carregando-o como os workers farão
+        tabela = TabelaGeoIP.carregar(saida)
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'✅ Tabela GeoIP gerada: {saida}'))
+        self.stdout.write(self.style.SUCCESS(f'Faixas de IP do Brasil: {len(tabela)}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+
+    def ler_dbip(self, origens):
+        """DB-IP Lite City: ip_start, ip_end, continent, country, stateprov, city, ..."""
+        faixas = []
+        for origem in origens:
+            with abrir_texto(origem) as arquivo:
+                for linha in csv.reader(arquivo):
+                    if len(linha) < 6 or linha[3] != 'BR':
+                        continue
+                    estado = converter_estado_para_sigla(linha[4])
+                    faixas.append((linha[0], linha[1], estado, linha[5]))
+        return faixas
+
+    def ler_geolite2(self, origens, arquivo_locais):
+        """GeoLite2 City CSV: blocos (network, geoname_id, ...) + locais por geoname_id"""
+        locais = {}
+        with abrir_texto(arquivo_locais) as arquivo:
+            for linha in csv.DictReader(arquivo):
+                if linha.get('country_iso_code') != 'BR':
+                    continue
+                estado = linha.get('subdivision_1_iso_code') or converter_estado_para_sigla(linha.get('subdivision_1_name', ''))
+                locais[linha['geoname_id']] = (estado, linha.get('city_name', ''))
+
+        faixas = []
+        for origem in origens:
+            with abrir_texto(origem) as arquivo:
+                for linha in csv.DictReader(arquivo):
+                    local = locais.get(linha.get('geoname_id'))
+                    if not local:
+                        continue
+                    rede = ipaddress.ip_network(linha['network'])
+                    faixas.append((str(rede.network_address), str(rede.broadcast_address), local[0], local[1]))
+        return faixas
+
+    def ler_mmdb(self, origens):
+        """Banco MMDB percorrido rede a rede (maxminddb >= 2.4)"""
+        import maxminddb
+
+        faixas = []
+        for origem in origens:
+            with maxminddb.open_database(origem) as leitor:
+                for rede, registro in leitor:
+                    if not registro or registro.get('country', {}).get('iso_code') != 'BR':
+                        continue
+                    subdivisoes = registro.get('subdivisions') or [{}]
+                    estado = subdivisoes[0].get('iso_code', '')
+                    nomes_cidade = registro.get('city', {}).get('names', {})
+                    cidade = nomes_cidade.get('pt-BR') or nomes_cidade.get('en', '')
+                    faixas.append((str(rede.network_address), str(rede.broadcast_address), estado, cidade))
+        return faixas
+
+    def ler_simples(self, origens):
+        """CSV no mesmo formato da tabela gerada (inicio, fim, estado, cidade)"""
+        faixas = []
+        for origem in origens:
+            with abrir_texto(origem) as arquivo:
+                for linha in csv.DictReader(arquivo):
+                    faixas.append((linha['inicio'], linha['fim'], linha['estado'], linha['cidade']))
+        return faixas
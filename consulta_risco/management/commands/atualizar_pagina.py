@@ -10,7 +10,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         pagina = options['pagina']
-        descricao = options.get('descricao', f'Atualização da página {pagina}')
+        descricao = options.get('descricao') or f'Atualização da página {pagina}'
         
         try:
             data_atualizada = PaginaAtualizacao.atualizar_pagina(pagina, descricao)
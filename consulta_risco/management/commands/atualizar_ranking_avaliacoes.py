@@ -0,0 +1,27 @@
+"""
+Comando para remontar o ranking de cidades pelas avaliações dos usuários
+
+As avaliações marcam o ranking como desatualizado e ele é remontado na
+primeira leitura após RANKING_INTERVALO segundos. Este comando o remonta fora
+das requisições, para que as leituras não precisem fazê-lo. Recomenda-se
+agendar no cron a cada 5 minutos:
+
+    */5 * * * * python manage.py atualizar_ranking_avaliacoes
+"""
+from django.core.management.base import BaseCommand
+
+from consulta_risco.ranking_avaliacoes import ESCOPO_BRASIL, atualizar_rankings
+
+
+class Command(BaseCommand):
+    help = 'Remonta no cache o ranking nacional e estadual das cidades pelas avaliações'
+
+    def handle(self, *args, **options):
+        rankings = atualizar_rankings()
+        nacional = rankings[ESCOPO_BRASIL]
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'✅ Ranking atualizado: {nacional["total"]} cidade(s)'))
+        self.stdout.write(self.style.SUCCESS(f'📊 Estados com ranking: {len(rankings) - 1}'))
+        self.stdout.write(self.style.SUCCESS(f'⭐ Média geral das avaliações: {nacional["media_geral"]}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
@@ -0,0 +1,91 @@
+"""
+Comando para consultar ou restaurar um intervalo de registros arquivados
+
+Exemplos:
+    python manage.py consultar_arquivo acessos --inicio 2025-01-01 --fim 2025-01-31
+    python manage.py consultar_arquivo cliques --inicio 2025-01-01 --exportar cliques_jan.csv
+    python manage.py consultar_arquivo acessos --inicio 2025-01-10 --fim 2025-01-10 --restaurar
+"""
+import csv
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from consulta_risco.agregacao import intervalo_datas
+from consulta_risco.arquivamento import TABELAS, ler_arquivados, restaurar_arquivados
+
+
+class Command(BaseCommand):
+    help = 'Consulta, exporta ou restaura registros arquivados por arquivar_registros'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tabela',
+            type=str,
+            choices=sorted(TABELAS),
+            help='Tabela arquivada a consultar'
+        )
+        parser.add_argument(
+            '--inicio',
+            type=str,
+            help='Data inicial (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--fim',
+            type=str,
+            help='Data final, inclusive (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--exportar',
+            type=str,
+            help='Gravar os registros do intervalo neste arquivo CSV'
+        )
+        parser.add_argument(
+            '--restaurar',
+            action='store_true',
+            help='Recarregar os registros do intervalo na tabela de origem'
+        )
+
+    def handle(self, *args, **options):
+        inicio, fim = intervalo_datas(options['inicio'] or '', options['fim'] or '')
+        if (options['inicio'] and inicio is None) or (options['fim'] and fim is None):
+            self.stdout.write(self.style.ERROR('❌ Data inválida (use YYYY-MM-DD)'))
+            return
+
+        tabela = options['tabela']
+        campo_data = TABELAS[tabela][1]
+
+        if options['restaurar']:
+            quantidade = restaurar_arquivados(tabela, inicio, fim)
+            self.stdout.write(self.style.SUCCESS('=' * 60))
+            self.stdout.write(self.style.SUCCESS(f'✅ {quantidade} registro(s) de {tabela} restaurado(s)'))
+            self.stdout.write(self.style.SUCCESS('=' * 60))
+            return
+
+        por_dia = {}
+        quantidade = 0
+        arquivo = None
+        escritor = None
+        try:
+            for registro in ler_arquivados(tabela, inicio, fim):
+                if options['exportar']:
+                    if escritor is None:
+                        arquivo = open(options['exportar'], 'w', encoding='utf-8', newline='')
+                        escritor = csv.DictWriter(arquivo, fieldnames=list(registro))
+                        escritor.writeheader()
+                    escritor.writerow(registro)
+                dia = timezone.localtime(registro[campo_data]).strftime('%d/%m/%Y')
+                por_dia[dia] = por_dia.get(dia, 0) + 1
+                quantidade += 1
+        finally:
+            if arquivo is not None:
+                arquivo.close()
+
+        for dia, total in por_dia.items():
+            self.stdout.write(f'  {dia}: {total} registro(s)')
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'✅ {quantidade} registro(s) de {tabela} no intervalo'))
+        if options['exportar'] and quantidade:
+            self.stdout.write(self.style.SUCCESS(f'📁 Exportado(s) para {options["exportar"]}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
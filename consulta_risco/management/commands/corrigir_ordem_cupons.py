@@ -1,51 +1,23 @@
 from django.core.management.base import BaseCommand
+from consulta_risco.cache_cupons import invalidar_cache_cupons
 from consulta_risco.models import Cupom
+from consulta_risco.ordenacao_cupons import ESPACAMENTO, renormalizar_ordem
 
 
 class Command(BaseCommand):
-    help = 'Corrige a ordem de exibição dos cupons para garantir sequência única'
+    help = 'Renumera a ordem de exibição dos cupons com chaves espaçadas, mantendo a ordem atual'
 
     def handle(self, *args, **options):
-        # Obter todos os cupons ordenados por ordem_exibicao atual
-        cupons = Cupom.objects.all().order_by('ordem_exibicao', 'id')
-        
-        self.stdout.write(f'Encontrados {cupons.count()} cupons para reordenar...')
-        
-        # Reordenar com sequência única
-        for index, cupom in enumerate(cupons, 1):
-            if cupom.ordem_exibicao != index:
-                self.stdout.write(f'Reordenando cupom "{cupom.titulo}" de {cupom.ordem_exibicao} para {index}')
-                cupom.ordem_exibicao = index
-                cupom.save(update_fields=['ordem_exibicao'])
-        
-        self.stdout.write(
-            self.style.SUCCESS('Reordenação concluída com sucesso!')
-        )
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        self.stdout.write(f'Encontrados {Cupom.objects.count()} cupons para reordenar...')
 
+        # Uma única transação com bulk_update (chaves 1024, 2048, 3072...)
+        alterados = renormalizar_ordem()
 
+        invalidar_cache_cupons()
 
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Reordenação concluída com sucesso! {alterados} cupom(ns) renumerado(s) '
+                f'com espaçamento {ESPACAMENTO}.'
+            )
+        )
@@ -0,0 +1,22 @@
+"""
+Comando para gravar no banco a última atualização do sistema marcada no cache
+
+As avaliações e edições de cupons marcam a data de atualização no cache e a
+gravam em SistemaAtualizacao no máximo uma vez por minuto. Este comando grava
+a última marcação pendente. Recomenda-se agendar no cron a cada minuto:
+
+    * * * * * python manage.py descarregar_atualizacao
+"""
+from django.core.management.base import BaseCommand
+
+from consulta_risco.atualizacao_sistema import descarregar_atualizacao
+
+
+class Command(BaseCommand):
+    help = 'Grava em SistemaAtualizacao a última atualização marcada no cache'
+
+    def handle(self, *args, **options):
+        if descarregar_atualizacao():
+            self.stdout.write(self.style.SUCCESS('✅ Data de atualização do sistema gravada'))
+        else:
+            self.stdout.write('Nenhuma atualização pendente')
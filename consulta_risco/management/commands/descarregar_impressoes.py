@@ -0,0 +1,33 @@
+"""
+Comando para gravar no banco os contadores de impressões de cupons do cache
+
+As impressões da página /cupons/ são contadas (com amostragem) no cache e
+somadas em ImpressaoCupom por este comando. Recomenda-se agendar no cron a
+cada 5 minutos:
+
+    */5 * * * * python manage.py descarregar_impressoes
+
+Os contadores expiram do cache em 2 dias; execute ao menos uma vez por dia.
+"""
+from django.core.management.base import BaseCommand
+
+from consulta_risco.impressoes import descarregar_impressoes
+
+
+class Command(BaseCommand):
+    help = 'Grava em ImpressaoCupom as impressões de cupons contadas no cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=2,
+            help='Quantidade de dias (incluindo hoje) a descarregar (padrão: 2)'
+        )
+
+    def handle(self, *args, **options):
+        total = descarregar_impressoes(options['dias'])
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'✅ {total} impressão(ões) gravada(s)'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
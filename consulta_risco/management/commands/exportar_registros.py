@@ -0,0 +1,66 @@
+"""
+Comando para exportar acessos ou cliques para um arquivo CSV ou JSON Lines
+
+Mesmos filtros e formato da exportação do relatório de acessos, sem o limite
+de tempo de uma requisição HTTP. Arquivos terminados em .gz são compactados.
+
+Exemplo:
+    python manage.py exportar_registros acessos acessos_2025.csv.gz --inicio 2025-01-01 --fim 2025-12-31
+"""
+from django.core.management.base import BaseCommand
+
+from consulta_risco.agregacao import intervalo_datas
+from consulta_risco.exportacao import CAMPOS_ACESSOS, CAMPOS_CLIQUES, FORMATOS, formatar, linhas_acessos, linhas_cliques
+from consulta_risco.geoip import abrir_texto
+
+
+class Command(BaseCommand):
+    help = 'Exporta os acessos às páginas ou os cliques em cupons para CSV ou JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tabela',
+            type=str,
+            choices=['acessos', 'cliques'],
+            help='Registros a exportar'
+        )
+        parser.add_argument(
+            'saida',
+            type=str,
+            help='Arquivo de saída (.gz para compactar)'
+        )
+        parser.add_argument(
+            '--formato',
+            type=str,
+            choices=sorted(FORMATOS),
+            default='csv',
+            help='Formato do arquivo (padrão: csv)'
+        )
+        parser.add_argument('--inicio', type=str, help='Data inicial (YYYY-MM-DD)')
+        parser.add_argument('--fim', type=str, help='Data final, inclusive (YYYY-MM-DD)')
+        parser.add_argument('--estado', type=str, default='', help='Sigla do estado (apenas acessos)')
+        parser.add_argument('--cidade', type=str, default='', help='Nome da cidade (apenas acessos)')
+
+    def handle(self, *args, **options):
+        inicio, fim = intervalo_datas(options['inicio'] or '', options['fim'] or '')
+        if (options['inicio'] and inicio is None) or (options['fim'] and fim is None):
+            self.stdout.write(self.style.ERROR('❌ Data inválida (use YYYY-MM-DD)'))
+            return
+
+        if options['tabela'] == 'acessos':
+            campos = CAMPOS_ACESSOS
+            linhas = linhas_acessos(inicio, fim, options['estado'], options['cidade'])
+        else:
+            campos = CAMPOS_CLIQUES
+            linhas = linhas_cliques(inicio, fim)
+
+        quantidade = -1 if options['formato'] == 'csv' else 0  # o CSV inclui o cabeçalho
+        with abrir_texto(options['saida'], 'wt') as arquivo:
+            for texto in formatar(options['formato'], campos, linhas):
+                arquivo.write(texto)
+                quantidade += 1
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'✅ {quantidade} registro(s) de {options["tabela"]} exportado(s)'))
+        self.stdout.write(self.style.SUCCESS(f'📁 Arquivo: {options["saida"]}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
@@ -0,0 +1,149 @@
+"""
+Comando para geolocalizar em lote os acessos gravados apenas com o IP
+
+Processa os registros de AcessoPagina com geolocalizado=False em lotes,
+resolvendo cada IP distinto uma única vez por lote e gravando o resultado
+com bulk_update. Pode ser agendado no cron ou executado com --continuo.
+"""
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from consulta_risco.geoip import RESOLVEDORES, ResolvedorIpApi, ResolvedorLocal
+from consulta_risco.models import AcessoPagina
+
+
+class Command(BaseCommand):
+    help = 'Geolocaliza em lote os acessos às páginas ainda sem localização'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--resolvedor',
+            type=str,
+            choices=sorted(RESOLVEDORES),
+            default='local',
+            help='Fonte da geolocalização: tabela local (padrão) ou API externa ip-api'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Quantidade de acessos processados por lote (padrão: 1000)'
+        )
+        parser.add_argument(
+            '--requisicoes-por-minuto',
+            type=int,
+            default=45,
+            help='Limite de requisições por minuto ao resolvedor externo (padrão: 45)'
+        )
+        parser.add_argument(
+            '--desde',
+            type=str,
+            help='Processar apenas acessos a partir desta data (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--reprocessar-sem-localizacao',
+            action='store_true',
+            help='Incluir acessos já processados que ficaram sem localização (backfill do histórico)'
+        )
+        parser.add_argument(
+            '--max-lotes',
+            type=int,
+            default=0,
+            help='Número máximo de lotes nesta execução (padrão: sem limite)'
+        )
+        parser.add_argument(
+            '--continuo',
+            action='store_true',
+            help='Continuar executando e aguardar novos acessos quando a fila esvaziar'
+        )
+        parser.add_argument(
+            '--espera',
+            type=int,
+            default=30,
+            help='Segundos de espera entre varreduras no modo contínuo (padrão: 30)'
+        )
+
+    def handle(self, *args, **options):
+        if options['resolvedor'] == 'ip-api':
+            resolvedor = ResolvedorIpApi(requisicoes_por_minuto=options['requisicoes_por_minuto'])
+        else:
+            resolvedor = ResolvedorLocal()
+
+        if options['reprocessar_sem_localizacao']:
+            pendentes = AcessoPagina.objects.filter(Q(geolocalizado=False) | Q(estado=''))
+        else:
+            pendentes = AcessoPagina.objects.filter(geolocalizado=False)
+        if options['desde']:
+            try:
+                desde = timezone.make_aware(datetime.strptime(options['desde'], '%Y-%m-%d'))
+            except ValueError:
+                self.stdout.write(self.style.ERROR('❌ Data inválida em --desde (use YYYY-MM-DD)'))
+                return
+            pendentes = pendentes.filter(data_acesso__gte=desde)
+
+        total_processados = 0
+        total_localizados = 0
+        lotes = 0
+        ultimo_id = 0
+
+        while True:
+            lote = list(
+                pendentes.filter(id__gt=ultimo_id)
+                .order_by('id')
+                .only('id', 'ip_address', 'cidade', 'estado', 'geolocalizado')[:options['lote']]
+            )
+
+            if not lote:
+                if not options['continuo']:
+                    break
+                time.sleep(options['espera'])
+                ultimo_id = 0
+                continue
+
+            ultimo_id = lote[-1].id
+            processados, localizados = self.processar_lote(lote, resolvedor)
+            total_processados += processados
+            total_localizados += localizados
+            lotes += 1
+
+            self.stdout.write(
+                f'Lote {lotes}: {processados} acesso(s) processado(s), '
+                f'{localizados} com localização (total: {total_processados})'
+            )
+
+            if options['max_lotes'] and lotes >= options['max_lotes']:
+                break
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'✅ Acessos processados: {total_processados}'))
+        self.stdout.write(self.style.SUCCESS(f'📍 Com localização identificada: {total_localizados}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+
+    def processar_lote(self, lote, resolvedor):
+        """Resolve cada IP distinto do lote uma única vez e grava com bulk_update"""
+        localizacoes = {}
+        for ip in {acesso.ip_address for acesso in lote if acesso.ip_address}:
+            localizacoes[ip] = resolvedor.resolver(ip)
+
+        atualizados = []
+        localizados = 0
+        for acesso in lote:
+            if acesso.ip_address:
+                localizacao = localizacoes.get(acesso.ip_address)
+                if localizacao is None:
+                    # Falha temporária do resolvedor: manter pendente para nova tentativa
+                    continue
+                cidade, estado = localizacao
+                if cidade or estado:
+                    acesso.cidade = cidade
+                    acesso.estado = estado
+                    localizados += 1
+            acesso.geolocalizado = True
+            atualizados.append(acesso)
+
+        AcessoPagina.objects.bulk_update(atualizados, ['cidade', 'estado', 'geolocalizado'], batch_size=500)
+        return len(atualizados), localizados
@@ -1,5 +1,6 @@
 import pandas as pd
 from django.core.management.base import BaseCommand
+from consulta_risco.cache_cidades import regenerar_cidades
 from consulta_risco.models import Estado, Cidade, SistemaAtualizacao, PaginaAtualizacao
 import os
 import unicodedata
@@ -157,6 +158,9 @@ class Command(BaseCommand):
                 'Atualização dos dados de criminalidade das cidades'
             )
             
+            # Remontar o JSON de cidades por estado servido em /api/cidades/
+            regenerar_cidades()
+            
             self.stdout.write(
                 self.style.SUCCESS(
                     f'\nImportação concluída!\n'
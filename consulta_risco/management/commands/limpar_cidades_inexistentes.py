@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from consulta_risco.cache_cidades import regenerar_cidades
 from consulta_risco.models import Estado, Cidade, SistemaAtualizacao, PaginaAtualizacao
 import pandas as pd
 import os
@@ -113,6 +114,7 @@ class Command(BaseCommand):
                         'home',
                         'Limpeza de cidades que não estão mais no arquivo de criminalidade'
                     )
+                    regenerar_cidades()
                 
                 self.stdout.write(
                     self.style.SUCCESS(
@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from consulta_risco.cache_cidades import regenerar_cidades
 from consulta_risco.models import Estado, Cidade
 from django.db.models import Count
 
@@ -54,6 +55,9 @@ class Command(BaseCommand):
                     f'  🗑️ Removidas {count_removidas} duplicatas de {nome} - {estado.sigla}'
                 )
         
+        if cidades_removidas > 0:
+            regenerar_cidades()
+        
         # Estatísticas finais
         total_estados = Estado.objects.count()
         total_cidades = Cidade.objects.count()
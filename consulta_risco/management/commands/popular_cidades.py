@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from consulta_risco.cache_cidades import regenerar_cidades
 from consulta_risco.models import Estado, Cidade
 
 
@@ -97,6 +98,9 @@ class Command(BaseCommand):
             except Estado.DoesNotExist:
                 self.stdout.write(f'  ✗ Estado não encontrado: {sigla}')
 
+        if total_cidades > 0:
+            regenerar_cidades()
+
         self.stdout.write(
             self.style.SUCCESS(
                 f'\n✅ População do banco concluída!\n'
@@ -0,0 +1,72 @@
+"""
+Comando para executar ou retomar exclusões de acessos solicitadas no relatório
+
+Processa as exclusões pendentes e as que ficaram "em andamento" sem progresso
+recente (worker reiniciado durante a exclusão). Necessário no cron quando
+EXCLUSAO_ACESSOS_MODO = 'comando':
+
+    */5 * * * * python manage.py processar_exclusoes_acessos
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from consulta_risco.exclusao_acessos import executar_exclusao
+from consulta_risco.models import ExclusaoAcessos
+
+
+class Command(BaseCommand):
+    help = 'Executa ou retoma as exclusões de acessos em lote pendentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Quantidade de acessos excluídos por transação (padrão: 5000)'
+        )
+        parser.add_argument(
+            '--pausa',
+            type=float,
+            default=0.1,
+            help='Segundos de pausa entre lotes (padrão: 0.1)'
+        )
+        parser.add_argument(
+            '--inativa-minutos',
+            type=int,
+            default=10,
+            help='Minutos sem progresso para considerar uma exclusão em andamento como interrompida (padrão: 10)'
+        )
+        parser.add_argument(
+            '--incluir-com-erro',
+            action='store_true',
+            help='Tentar novamente as exclusões que terminaram com erro'
+        )
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(minutes=options['inativa_minutos'])
+        filtro = Q(status='pendente') | Q(status='em_andamento', data_atualizacao__lt=limite)
+        if options['incluir_com_erro']:
+            filtro |= Q(status='erro')
+
+        exclusoes = list(ExclusaoAcessos.objects.filter(filtro).order_by('data_criacao'))
+        if not exclusoes:
+            self.stdout.write('Nenhuma exclusão pendente.')
+            return
+
+        total_excluidos = 0
+        for exclusao in exclusoes:
+            self.stdout.write(f'Processando exclusão #{exclusao.id} ({exclusao.get_status_display()})...')
+            exclusao = executar_exclusao(exclusao.id, tamanho_lote=options['lote'], pausa=options['pausa'])
+            if exclusao.status == 'erro':
+                self.stdout.write(self.style.ERROR(f'❌ Exclusão #{exclusao.id} com erro: {exclusao.mensagem_erro}'))
+            else:
+                self.stdout.write(f'Exclusão #{exclusao.id}: {exclusao.total_excluidos} registro(s) excluído(s)')
+            total_excluidos += exclusao.total_excluidos
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'✅ Exclusões processadas: {len(exclusoes)}'))
+        self.stdout.write(self.style.SUCCESS(f'🗑️ Registros excluídos: {total_excluidos}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
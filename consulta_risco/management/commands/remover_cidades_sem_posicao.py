@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from consulta_risco.cache_cidades import regenerar_cidades
 from consulta_risco.models import Cidade
 
 
@@ -22,6 +23,7 @@ class Command(BaseCommand):
                 cidades_removidas += 1
             
             total_depois = Cidade.objects.count()
+            regenerar_cidades()
             
             self.stdout.write(
                 self.style.SUCCESS(
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:22
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def marcar_acessos_ja_geolocalizados(apps, schema_editor):
+    """Acessos que já têm estado foram geolocalizados na própria requisição"""
+    AcessoPagina = apps.get_model('consulta_risco', 'AcessoPagina')
+    AcessoPagina.objects.exclude(estado='').update(geolocalizado=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta_risco', '0022_adicionar_acesso_pagina'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='paginaatualizacao',
+            options={'verbose_name': 'Atualização de Página', 'verbose_name_plural': 'Atualizações de Páginas'},
+        ),
+        migrations.AddField(
+            model_name='acessopagina',
+            name='geolocalizado',
+            field=models.BooleanField(default=False, help_text='Se a localização do IP já foi processada (ver comando geolocalizar_acessos)'),
+        ),
+        migrations.RunPython(marcar_acessos_ja_geolocalizados, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='acessopagina',
+            name='data_acesso',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Data e hora do acesso'),
+        ),
+        migrations.AddIndex(
+            model_name='acessopagina',
+            index=models.Index(condition=models.Q(('geolocalizado', False)), fields=['id'], name='acesso_pendente_geo_idx'),
+        ),
+    ]
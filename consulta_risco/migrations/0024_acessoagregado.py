@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta_risco', '0023_acessopagina_geolocalizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AcessoAgregado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularidade', models.CharField(choices=[('hora', 'Hora'), ('dia', 'Dia')], help_text='Tamanho do período agregado', max_length=4)),
+                ('periodo', models.DateTimeField(help_text='Início do período (hora ou dia no horário de Brasília)')),
+                ('url', models.CharField(help_text='URL da página acessada', max_length=500)),
+                ('nome_pagina', models.CharField(blank=True, help_text='Nome amigável da página', max_length=200)),
+                ('estado', models.CharField(blank=True, help_text='Estado (UF) do usuário', max_length=2)),
+                ('cidade', models.CharField(blank=True, help_text='Cidade do usuário', max_length=100)),
+                ('total', models.PositiveIntegerField(default=0, help_text='Quantidade de acessos no período')),
+            ],
+            options={
+                'verbose_name': 'Acesso Agregado',
+                'verbose_name_plural': 'Acessos Agregados',
+                'ordering': ['-periodo'],
+                'indexes': [models.Index(fields=['granularidade', 'periodo'], name='agregado_gran_periodo_idx')],
+                'unique_together': {('granularidade', 'periodo', 'url', 'estado', 'cidade')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta_risco', '0024_acessoagregado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='acessopagina',
+            index=models.Index(fields=['data_acesso', 'id'], name='acesso_data_id_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='acessopagina',
+            name='acesso_data_idx',
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta_risco', '0025_acessopagina_indice_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExclusaoAcessos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_inicio', models.CharField(blank=True, help_text='Filtro de data inicial (YYYY-MM-DD)', max_length=10)),
+                ('data_fim', models.CharField(blank=True, help_text='Filtro de data final (YYYY-MM-DD)', max_length=10)),
+                ('estado', models.CharField(blank=True, help_text='Filtro de estado (UF)', max_length=2)),
+                ('cidade', models.CharField(blank=True, help_text='Filtro de cidade', max_length=100)),
+                ('id_maximo', models.BigIntegerField(help_text='Maior ID de acesso existente ao solicitar a exclusão (acessos posteriores são preservados)')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('em_andamento', 'Em andamento'), ('concluida', 'Concluída'), ('erro', 'Erro')], default='pendente', help_text='Situação da exclusão', max_length=20)),
+                ('total_estimado', models.PositiveIntegerField(default=0, help_text='Quantidade estimada de acessos a excluir')),
+                ('total_excluidos', models.PositiveIntegerField(default=0, help_text='Quantidade de acessos já excluídos')),
+                ('mensagem_erro', models.TextField(blank=True, help_text='Detalhes do erro, se houver')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, help_text='Data da solicitação')),
+                ('data_atualizacao', models.DateTimeField(auto_now=True, help_text='Data do último progresso registrado')),
+                ('data_conclusao', models.DateTimeField(blank=True, help_text='Data de término da exclusão', null=True)),
+                ('solicitado_por', models.ForeignKey(blank=True, help_text='Administrador que solicitou a exclusão', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exclusoes_acessos', to='consulta_risco.adminuser')),
+            ],
+            options={
+                'verbose_name': 'Exclusão de Acessos',
+                'verbose_name_plural': 'Exclusões de Acessos',
+                'ordering': ['-data_criacao'],
+            },
+        ),
+    ]
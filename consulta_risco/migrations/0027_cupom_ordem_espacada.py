@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:36
+
+from django.db import migrations, models
+
+
+def espacar_ordem_cupons(apps, schema_editor):
+    """Renumera a ordem atual dos cupons (1, 2, 3...) para chaves espaçadas (1024, 2048...)"""
+    Cupom = apps.get_model('consulta_risco', 'Cupom')
+    cupons = list(Cupom.objects.order_by('ordem_exibicao', 'id'))
+    for posicao, cupom in enumerate(cupons, 1):
+        cupom.ordem_exibicao = posicao * 1024
+    Cupom.objects.bulk_update(cupons, ['ordem_exibicao'], batch_size=500)
+
+
+def compactar_ordem_cupons(apps, schema_editor):
+    """Volta à numeração sequencial (1, 2, 3...)"""
+    Cupom = apps.get_model('consulta_risco', 'Cupom')
+    cupons = list(Cupom.objects.order_by('ordem_exibicao', 'id'))
+    for posicao, cupom in enumerate(cupons, 1):
+        cupom.ordem_exibicao = posicao
+    Cupom.objects.bulk_update(cupons, ['ordem_exibicao'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta_risco', '0026_exclusaoacessos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cupom',
+            name='ordem_exibicao',
+            field=models.IntegerField(default=1, help_text='Chave de ordenação (menor número aparece primeiro), espaçada entre cupons para reposicionar com uma única escrita'),
+        ),
+        migrations.RunPython(espacar_ordem_cupons, compactar_ordem_cupons),
+    ]
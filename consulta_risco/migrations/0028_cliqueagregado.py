@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta_risco', '0027_cupom_ordem_espacada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CliqueAgregado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(help_text='Dia dos cliques (horário de Brasília)')),
+                ('cliques', models.PositiveIntegerField(default=0, help_text='Quantidade de cliques no dia')),
+                ('ips_unicos', models.PositiveIntegerField(default=0, help_text='Quantidade de IPs distintos que clicaram no dia')),
+                ('cupom', models.ForeignKey(help_text='Cupom clicado', on_delete=django.db.models.deletion.CASCADE, related_name='cliques_agregados', to='consulta_risco.cupom')),
+            ],
+            options={
+                'verbose_name': 'Clique Agregado',
+                'verbose_name_plural': 'Cliques Agregados',
+                'ordering': ['-dia'],
+                'indexes': [models.Index(fields=['dia'], name='clique_agregado_dia_idx')],
+                'unique_together': {('cupom', 'dia')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta_risco', '0028_cliqueagregado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImpressaoCupom',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(help_text='Dia das impressões (horário de Brasília)')),
+                ('impressoes', models.PositiveIntegerField(default=0, help_text='Quantidade estimada de impressões no dia (extrapolada da amostragem)')),
+                ('cupom', models.ForeignKey(help_text='Cupom exibido', on_delete=django.db.models.deletion.CASCADE, related_name='impressoes', to='consulta_risco.cupom')),
+            ],
+            options={
+                'verbose_name': 'Impressão de Cupom',
+                'verbose_name_plural': 'Impressões de Cupons',
+                'ordering': ['-dia'],
+                'indexes': [models.Index(fields=['dia'], name='impressao_dia_idx')],
+                'unique_together': {('cupom', 'dia')},
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:46
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def agregar_avaliacoes_existentes(apps, schema_editor):
+    """Preenche a soma e a quantidade por cidade e ano com as avaliações já registradas"""
+    AvaliacaoSeguranca = apps.get_model('consulta_risco', 'AvaliacaoSeguranca')
+    AvaliacaoAgregada = apps.get_model('consulta_risco', 'AvaliacaoAgregada')
+
+    totais = defaultdict(lambda: [0, 0])
+    avaliacoes = AvaliacaoSeguranca.objects.values_list('estado_id', 'cidade', 'nota', 'data_avaliacao')
+    for estado_id, cidade, nota, data_avaliacao in avaliacoes.iterator():
+        chave = (estado_id, cidade.strip().lower(), timezone.localtime(data_avaliacao).year)
+        totais[chave][0] += nota
+        totais[chave][1] += 1
+
+    AvaliacaoAgregada.objects.bulk_create([
+        AvaliacaoAgregada(estado_id=estado_id, cidade=cidade, ano=ano, soma=soma, quantidade=quantidade)
+        for (estado_id, cidade, ano), (soma, quantidade) in totais.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta_risco', '0029_impressaocupom'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvaliacaoAgregada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cidade', models.CharField(help_text='Nome da cidade avaliada, em minúsculas', max_length=100)),
+                ('ano', models.PositiveSmallIntegerField(help_text='Ano das avaliações (horário de Brasília)')),
+                ('soma', models.PositiveIntegerField(default=0, help_text='Soma das notas do ano')),
+                ('quantidade', models.PositiveIntegerField(default=0, help_text='Quantidade de avaliações do ano')),
+                ('estado', models.ForeignKey(help_text='Estado da cidade avaliada', on_delete=django.db.models.deletion.CASCADE, related_name='avaliacoes_agregadas', to='consulta_risco.estado')),
+            ],
+            options={
+                'verbose_name': 'Avaliação Agregada',
+                'verbose_name_plural': 'Avaliações Agregadas',
+                'ordering': ['estado', 'cidade', '-ano'],
+                'unique_together': {('estado', 'cidade', 'ano')},
+            },
+        ),
+        migrations.RunPython(agregar_avaliacoes_existentes, migrations.RunPython.noop),
+    ]
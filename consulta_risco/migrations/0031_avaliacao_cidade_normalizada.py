@@ -0,0 +1,115 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:48
+
+from collections import defaultdict
+import re
+import unicodedata
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def normalizar(nome):
+    """Cópia de models.normalizar_nome_cidade, para a migração não depender do código atual"""
+    nome = unicodedata.normalize('NFKD', nome or '')
+    nome = ''.join(c for c in nome if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^0-9A-Za-z]+', ' ', nome).upper().split())
+
+
+def reagregar(apps, chave_cidade):
+    """Refaz AvaliacaoAgregada a partir das avaliações, agrupando as cidades por chave_cidade(nome)"""
+    AvaliacaoSeguranca = apps.get_model('consulta_risco', 'AvaliacaoSeguranca')
+    AvaliacaoAgregada = apps.get_model('consulta_risco', 'AvaliacaoAgregada')
+
+    totais = defaultdict(lambda: [0, 0])
+    avaliacoes = AvaliacaoSeguranca.objects.values_list('estado_id', 'cidade', 'nota', 'data_avaliacao')
+    for estado_id, cidade, nota, data_avaliacao in avaliacoes.iterator():
+        chave = (estado_id, chave_cidade(cidade), timezone.localtime(data_avaliacao).year)
+        totais[chave][0] += nota
+        totais[chave][1] += 1
+
+    AvaliacaoAgregada.objects.all().delete()
+    AvaliacaoAgregada.objects.bulk_create([
+        AvaliacaoAgregada(estado_id=estado_id, cidade=cidade, ano=ano, soma=soma, quantidade=quantidade)
+        for (estado_id, cidade, ano), (soma, quantidade) in totais.items()
+    ], batch_size=1000)
+
+
+def normalizar_avaliacoes(apps, schema_editor):
+    """
+    Preenche Cidade.nome_normalizado, mantém só a avaliação mais recente de
+    cada email para variações do mesmo nome ("São Paulo" / "sao paulo"), liga
+    as avaliações à cidade cadastrada e refaz as agregações com o nome
+    normalizado.
+    """
+    Cidade = apps.get_model('consulta_risco', 'Cidade')
+    AvaliacaoSeguranca = apps.get_model('consulta_risco', 'AvaliacaoSeguranca')
+
+    cidades = list(Cidade.objects.only('id', 'nome', 'estado_id'))
+    for cidade in cidades:
+        cidade.nome_normalizado = normalizar(cidade.nome)
+    Cidade.objects.bulk_update(cidades, ['nome_normalizado'], batch_size=1000)
+
+    # Mais recente primeiro: a primeira de cada (email, estado, nome normalizado) fica
+    vistas = set()
+    duplicadas = []
+    avaliacoes = AvaliacaoSeguranca.objects.order_by('-data_avaliacao', '-id').values_list(
+        'id', 'email', 'estado_id', 'cidade'
+    )
+    for avaliacao_id, email, estado_id, cidade in avaliacoes.iterator():
+        chave = (email, estado_id, normalizar(cidade))
+        if chave in vistas:
+            duplicadas.append(avaliacao_id)
+        else:
+            vistas.add(chave)
+    for inicio in range(0, len(duplicadas), 500):
+        AvaliacaoSeguranca.objects.filter(id__in=duplicadas[inicio:inicio + 500]).delete()
+
+    # Mesma regra de avaliacoes.resolver_cidade: a de menor id entre nomes iguais
+    ids_cidades = {}
+    for cidade in sorted(cidades, key=lambda cidade: cidade.id):
+        ids_cidades.setdefault((cidade.estado_id, cidade.nome_normalizado), cidade.id)
+    avaliacoes = []
+    for avaliacao in AvaliacaoSeguranca.objects.only('id', 'estado_id', 'cidade').iterator():
+        cidade_id = ids_cidades.get((avaliacao.estado_id, normalizar(avaliacao.cidade)))
+        if cidade_id:
+            avaliacao.cidade_cadastrada_id = cidade_id
+            avaliacoes.append(avaliacao)
+    AvaliacaoSeguranca.objects.bulk_update(avaliacoes, ['cidade_cadastrada'], batch_size=1000)
+
+    reagregar(apps, normalizar)
+
+
+def desfazer_normalizacao(apps, schema_editor):
+    """Volta as agregações à chave anterior (nome em minúsculas)"""
+    reagregar(apps, lambda nome: nome.strip().lower())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta_risco', '0030_avaliacaoagregada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='avaliacaoseguranca',
+            name='cidade_cadastrada',
+            field=models.ForeignKey(blank=True, help_text='Cidade cadastrada correspondente ao nome informado (sem diferenciar acentos e maiúsculas)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='avaliacoes', to='consulta_risco.cidade'),
+        ),
+        migrations.AddField(
+            model_name='cidade',
+            name='nome_normalizado',
+            field=models.CharField(blank=True, editable=False, help_text='Nome sem acentos e pontuação, em maiúsculas (preenchido ao salvar)', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='avaliacaoagregada',
+            name='cidade',
+            field=models.CharField(help_text='Nome normalizado da cidade avaliada (sem acentos e pontuação, em maiúsculas)', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='cidade',
+            index=models.Index(fields=['estado', 'nome_normalizado'], name='cidade_est_nome_norm_idx'),
+        ),
+        migrations.RunPython(normalizar_avaliacoes, desfazer_normalizacao),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.utils import timezone
 import pytz
+import re
+import unicodedata
 from django.db.models import DateTimeField
 
 
@@ -53,6 +55,13 @@ def get_brasilia_time():
     return brasilia_time
 
 
+def normalizar_nome_cidade(nome):
+    """Remove acentos e pontuação e converte para maiúsculas: "Embu-Guaçu" -> "EMBU GUACU" """
+    nome = unicodedata.normalize('NFKD', nome or '')
+    nome = ''.join(c for c in nome if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^0-9A-Za-z]+', ' ', nome).upper().split())
+
+
 class TipoCupom(models.Model):
     nome = models.CharField(max_length=50, unique=True, help_text="Nome da loja")
     cor_fundo = models.CharField(max_length=7, help_text="Cor de fundo em formato hexadecimal")
@@ -87,6 +96,7 @@ class Estado(models.Model):
 
 class Cidade(models.Model):
     nome = models.CharField(max_length=100)
+    nome_normalizado = models.CharField(max_length=100, blank=True, editable=False, help_text="Nome sem acentos e pontuação, em maiúsculas (preenchido ao salvar)")
     estado = models.ForeignKey(Estado, on_delete=models.CASCADE, related_name='cidades')
     posicao = models.IntegerField(null=True, blank=True, help_text="Posição no ranking de criminalidade")
     latitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True, help_text="Latitude da cidade")
@@ -97,11 +107,58 @@ class Cidade(models.Model):
         unique_together = ['nome', 'estado']
         verbose_name = 'Cidade'
         verbose_name_plural = 'Cidades'
+        indexes = [
+            models.Index(fields=['estado', 'nome_normalizado'], name='cidade_est_nome_norm_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.nome_normalizado = normalizar_nome_cidade(self.nome)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nome' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'nome_normalizado'}
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.nome} - {self.estado.sigla}"
 
 
+class CupomQuerySet(models.QuerySet):
+    """
+    Filtros de validade dos cupons executados no banco de dados.
+    Seguem a mesma regra de Cupom.esta_valido(): ativo, já iniciado e ainda não expirado.
+    """
+    
+    @staticmethod
+    def _vigente(agora):
+        return (
+            (models.Q(data_inicio__isnull=True) | models.Q(data_inicio__lte=agora))
+            & (models.Q(data_validade__isnull=True) | models.Q(data_validade__gte=agora))
+        )
+    
+    def validos(self, agora=None):
+        """Cupons ativos dentro do período de validade"""
+        return self.filter(models.Q(ativo=True) & self._vigente(agora or timezone.now()))
+    
+    def expirados(self, agora=None):
+        """Cupons ativos cuja data de validade já passou"""
+        return self.filter(ativo=True, data_validade__lt=agora or timezone.now())
+    
+    def agendados(self, agora=None):
+        """Cupons ativos cuja data de início ainda não chegou"""
+        return self.filter(ativo=True, data_inicio__gt=agora or timezone.now())
+    
+    def inativos(self):
+        """Cupons desativados manualmente"""
+        return self.filter(ativo=False)
+    
+    def fora_da_validade(self, agora=None):
+        """Cupons ativos que não estão válidos (expirados ou agendados)"""
+        agora = agora or timezone.now()
+        return self.filter(models.Q(ativo=True) & (
+            models.Q(data_inicio__gt=agora) | models.Q(data_validade__lt=agora)
+        ))
+
+
 class Cupom(models.Model):
     loja = models.CharField(max_length=100, help_text="Nome da loja onde o cupom é válido")
     tipo_cupom = models.ForeignKey(TipoCupom, on_delete=models.CASCADE, help_text="Tipo de cupom com cor predefinida", null=True, blank=True)
@@ -112,12 +169,14 @@ class Cupom(models.Model):
     ativo = models.BooleanField(default=True, help_text="Se o cupom está ativo")
     data_inicio = models.DateTimeField(null=True, blank=True, help_text="Data de início da validade do cupom")
     data_validade = models.DateTimeField(null=True, blank=True, help_text="Data de validade do cupom (deixar em branco para cupom sem prazo)")
-    ordem_exibicao = models.IntegerField(default=1, help_text="Ordem de exibição (menor número aparece primeiro)")
+    ordem_exibicao = models.IntegerField(default=1, help_text="Chave de ordenação (menor número aparece primeiro), espaçada entre cupons para reposicionar com uma única escrita")
     data_criacao = models.DateTimeField(auto_now_add=True)
     data_atualizacao = models.DateTimeField(auto_now=True)
     criado_por = models.ForeignKey('AdminUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='cupons_criados')
     modificado_por = models.ForeignKey('AdminUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='cupons_modificados')
     
+    objects = CupomQuerySet.as_manager()
+    
     class Meta:
         ordering = ['ordem_exibicao', 'data_criacao']
         verbose_name = 'Cupom'
@@ -126,46 +185,36 @@ class Cupom(models.Model):
     def __str__(self):
         return f"{self.titulo} - {self.codigo}"
     
-    def esta_valido(self):
-        """Verifica se o cupom está válido baseado nas datas"""
-        from django.utils import timezone
-        import pytz
+    def esta_valido(self, agora=None):
+        """
+        Verifica se o cupom está válido baseado nas datas
         
-        agora = timezone.now()
-        brasilia_tz = pytz.timezone('America/Sao_Paulo')
+        Mesma regra de Cupom.objects.validos(); as datas são timezone-aware,
+        então a comparação não depende do fuso em que estão representadas.
+        """
+        agora = agora or timezone.now()
         
         # Se não está ativo manualmente, não está válido
         if not self.ativo:
             return False
         
         # Se tem data de início e ainda não chegou
-        if self.data_inicio:
-            if timezone.is_aware(self.data_inicio):
-                data_inicio_brasilia = self.data_inicio.astimezone(brasilia_tz)
-            else:
-                utc_tz = pytz.timezone('UTC')
-                data_inicio_utc = utc_tz.localize(self.data_inicio)
-                data_inicio_brasilia = data_inicio_utc.astimezone(brasilia_tz)
-            
-            agora_brasilia = agora.astimezone(brasilia_tz)
-            if agora_brasilia < data_inicio_brasilia:
-                return False
+        if self.data_inicio and agora < self._data_aware(self.data_inicio):
+            return False
         
         # Se tem data de validade e já passou
-        if self.data_validade:
-            if timezone.is_aware(self.data_validade):
-                data_validade_brasilia = self.data_validade.astimezone(brasilia_tz)
-            else:
-                utc_tz = pytz.timezone('UTC')
-                data_validade_utc = utc_tz.localize(self.data_validade)
-                data_validade_brasilia = data_validade_utc.astimezone(brasilia_tz)
-            
-            agora_brasilia = agora.astimezone(brasilia_tz)
-            if agora_brasilia > data_validade_brasilia:
-                return False
+        if self.data_validade and agora > self._data_aware(self.data_validade):
+            return False
         
         return True
     
+    @staticmethod
+    def _data_aware(data):
+        """Datas sem timezone são tratadas como UTC (mesmo critério anterior)"""
+        if timezone.is_naive(data):
+            return timezone.make_aware(data, pytz.utc)
+        return data
+    
     def get_status_validade(self):
         """Retorna o status de validade do cupom"""
         from django.utils import timezone
@@ -209,12 +258,23 @@ class Cupom(models.Model):
         
         return "Válido sem prazo"
     
+    def get_posicao_exibicao(self):
+        """Posição do cupom (1, 2, 3...) na ordem de exibição"""
+        return Cupom.objects.filter(
+            models.Q(ordem_exibicao__lt=self.ordem_exibicao)
+            | models.Q(ordem_exibicao=self.ordem_exibicao, id__lt=self.id)
+        ).count() + 1
+    
     def get_total_cliques(self):
-        """Retorna o total de cliques neste cupom"""
+        """Retorna o total de cliques neste cupom (usa a anotação num_cliques, se presente)"""
+        if hasattr(self, 'num_cliques'):
+            return self.num_cliques
         return self.cliques.count()
     
     def foi_clicado(self):
         """Verifica se o cupom foi clicado pelo menos uma vez"""
+        if hasattr(self, 'num_cliques'):
+            return self.num_cliques > 0
         return self.cliques.exists()
 
 
@@ -283,6 +343,7 @@ class AvaliacaoSeguranca(models.Model):
     email = models.EmailField(help_text="Email do usuário que fez a avaliação")
     estado = models.ForeignKey(Estado, on_delete=models.CASCADE, help_text="Estado da cidade avaliada")
     cidade = models.CharField(max_length=100, help_text="Nome da cidade avaliada")
+    cidade_cadastrada = models.ForeignKey(Cidade, on_delete=models.SET_NULL, null=True, blank=True, related_name='avaliacoes', help_text="Cidade cadastrada correspondente ao nome informado (sem diferenciar acentos e maiúsculas)")
     nota = models.IntegerField(help_text="Nota de 1 a 10 para o nível de segurança")
     data_avaliacao = BrasiliaDateTimeField(default=get_brasilia_time, help_text="Data e hora da avaliação em UTC-3 (Brasília)")
     
@@ -313,6 +374,28 @@ class AvaliacaoSeguranca(models.Model):
             raise ValidationError('A nota deve estar entre 1 e 10.')
 
 
+class AvaliacaoAgregada(models.Model):
+    """
+    Soma e quantidade das notas por cidade e ano, mantidas a cada avaliação
+    (ver avaliacoes.registrar_avaliacao). A média dos últimos 3 anos de uma
+    cidade soma no máximo três linhas, qualquer que seja o número de votos.
+    """
+    estado = models.ForeignKey(Estado, on_delete=models.CASCADE, related_name='avaliacoes_agregadas', help_text="Estado da cidade avaliada")
+    cidade = models.CharField(max_length=100, help_text="Nome normalizado da cidade avaliada (sem acentos e pontuação, em maiúsculas)")
+    ano = models.PositiveSmallIntegerField(help_text="Ano das avaliações (horário de Brasília)")
+    soma = models.PositiveIntegerField(default=0, help_text="Soma das notas do ano")
+    quantidade = models.PositiveIntegerField(default=0, help_text="Quantidade de avaliações do ano")
+    
+    class Meta:
+        ordering = ['estado', 'cidade', '-ano']
+        unique_together = ['estado', 'cidade', 'ano']
+        verbose_name = 'Avaliação Agregada'
+        verbose_name_plural = 'Avaliações Agregadas'
+    
+    def __str__(self):
+        return f"{self.cidade}/{self.estado.sigla} {self.ano}: {self.quantidade} avaliação(ões)"
+
+
 class SistemaAtualizacao(models.Model):
     """Modelo para controlar a data de última atualização do sistema"""
     data_atualizacao = models.DateTimeField(auto_now=True, help_text="Data da última atualização dos dados")
@@ -340,24 +423,21 @@ class SistemaAtualizacao(models.Model):
     
     @classmethod
     def get_ultima_atualizacao(cls):
-        """Retorna a data da última atualização ou cria uma nova entrada"""
-        obj, created = cls.objects.get_or_create(
-            id=1,
-            defaults={'descricao': 'Inicialização do sistema'}
-        )
-        return obj.data_atualizacao
+        """Retorna a data da última atualização (em cache, ver atualizacao_sistema) ou cria uma nova entrada"""
+        from .atualizacao_sistema import ultima_atualizacao
+        return ultima_atualizacao()
     
     @classmethod
     def atualizar_sistema(cls, descricao="Atualização automática"):
-        """Atualiza a data do sistema"""
-        obj, created = cls.objects.get_or_create(
-            id=1,
-            defaults={'descricao': descricao}
-        )
-        if not created:
-            obj.descricao = descricao
-            obj.save()
-        return obj.data_atualizacao
+        """Atualiza a data do sistema gravando imediatamente no banco"""
+        from .atualizacao_sistema import gravar_atualizacao
+        return gravar_atualizacao(descricao)
+    
+    @classmethod
+    def marcar_atualizacao(cls, descricao="Atualização automática"):
+        """Atualiza a data do sistema com gravação agrupada (para caminhos frequentes)"""
+        from .atualizacao_sistema import marcar_atualizacao
+        return marcar_atualizacao(descricao)
 
 
 class PaginaAtualizacao(models.Model):
@@ -372,6 +452,18 @@ class PaginaAtualizacao(models.Model):
     
     def __str__(self):
         return f"{self.nome_pagina} - {self.data_atualizacao.strftime('%d/%m/%Y %H:%M')}"
+    
+    @classmethod
+    def get_ultima_atualizacao(cls, nome_pagina):
+        """Retorna a data da última atualização da página (em cache, ver atualizacao_sistema) ou cria uma nova entrada"""
+        from .atualizacao_sistema import ultima_atualizacao_pagina
+        return ultima_atualizacao_pagina(nome_pagina)
+    
+    @classmethod
+    def atualizar_pagina(cls, nome_pagina, descricao=None):
+        """Atualiza a data da página e invalida as datas de páginas em cache"""
+        from .atualizacao_sistema import atualizar_pagina
+        return atualizar_pagina(nome_pagina, descricao)
 
 
 class AcessoPagina(models.Model):
@@ -384,6 +476,7 @@ class AcessoPagina(models.Model):
     user_agent = models.TextField(blank=True, help_text="User agent do navegador")
     referer = models.URLField(blank=True, help_text="Página de origem (referer)")
     data_acesso = models.DateTimeField(default=timezone.now, help_text="Data e hora do acesso")
+    geolocalizado = models.BooleanField(default=False, help_text="Se a localização do IP já foi processada (ver comando geolocalizar_acessos)")
     
     class Meta:
         ordering = ['-data_acesso']
@@ -391,8 +484,11 @@ class AcessoPagina(models.Model):
         verbose_name_plural = 'Acessos às Páginas'
         indexes = [
             models.Index(fields=['url', 'data_acesso'], name='acesso_url_data_idx'),
-            models.Index(fields=['data_acesso'], name='acesso_data_idx'),
+            # Composto com id para a paginação por cursor (data_acesso, id) do relatório
+            models.Index(fields=['data_acesso', 'id'], name='acesso_data_id_idx'),
             models.Index(fields=['estado', 'cidade'], name='acesso_estado_cidade_idx'),
+            # Índice parcial: apenas os acessos ainda pendentes de geolocalização
+            models.Index(fields=['id'], name='acesso_pendente_geo_idx', condition=models.Q(geolocalizado=False)),
         ]
     
     def get_data_acesso_brasilia(self):
@@ -417,12 +513,124 @@ class AcessoPagina(models.Model):
         return f"{self.nome_pagina or self.url} - {localizacao} - {self.data_acesso.strftime('%d/%m/%Y %H:%M')}"
 
 
+class AcessoAgregado(models.Model):
+    """
+    Totais de acessos pré-agregados por período, página e localização.
+    Mantido pelo comando agregar_acessos e usado pelo relatório de acessos,
+    que assim não precisa varrer a tabela bruta de AcessoPagina.
+    """
+    GRANULARIDADE_CHOICES = [
+        ('hora', 'Hora'),
+        ('dia', 'Dia'),
+    ]
+    
+    granularidade = models.CharField(max_length=4, choices=GRANULARIDADE_CHOICES, help_text="Tamanho do período agregado")
+    periodo = models.DateTimeField(help_text="Início do período (hora ou dia no horário de Brasília)")
+    url = models.CharField(max_length=500, help_text="URL da página acessada")
+    nome_pagina = models.CharField(max_length=200, blank=True, help_text="Nome amigável da página")
+    estado = models.CharField(max_length=2, blank=True, help_text="Estado (UF) do usuário")
+    cidade = models.CharField(max_length=100, blank=True, help_text="Cidade do usuário")
+    total = models.PositiveIntegerField(default=0, help_text="Quantidade de acessos no período")
+    
+    class Meta:
+        ordering = ['-periodo']
+        unique_together = ['granularidade', 'periodo', 'url', 'estado', 'cidade']
+        verbose_name = 'Acesso Agregado'
+        verbose_name_plural = 'Acessos Agregados'
+        indexes = [
+            models.Index(fields=['granularidade', 'periodo'], name='agregado_gran_periodo_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.nome_pagina or self.url} - {self.get_granularidade_display()} {self.periodo.strftime('%d/%m/%Y %H:%M')}: {self.total}"
 
 
+class CliqueAgregado(models.Model):
+    """
+    Totais diários de cliques por cupom. Mantido pelo comando agregar_cliques
+    e usado nas séries temporais de cliques, que assim não precisam varrer
+    CliqueCupom (nem perdem os dias já arquivados).
+    """
+    cupom = models.ForeignKey(Cupom, on_delete=models.CASCADE, related_name='cliques_agregados', help_text="Cupom clicado")
+    dia = models.DateField(help_text="Dia dos cliques (horário de Brasília)")
+    cliques = models.PositiveIntegerField(default=0, help_text="Quantidade de cliques no dia")
+    ips_unicos = models.PositiveIntegerField(default=0, help_text="Quantidade de IPs distintos que clicaram no dia")
+    
+    class Meta:
+        ordering = ['-dia']
+        unique_together = ['cupom', 'dia']
+        verbose_name = 'Clique Agregado'
+        verbose_name_plural = 'Cliques Agregados'
+        indexes = [
+            models.Index(fields=['dia'], name='clique_agregado_dia_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.cupom.titulo} - {self.dia.strftime('%d/%m/%Y')}: {self.cliques}"
 
 
+class ImpressaoCupom(models.Model):
+    """
+    Total diário estimado de impressões (exibições na página /cupons/) por cupom.
+    As impressões são amostradas e contadas no cache; o comando
+    descarregar_impressoes soma os contadores nesta tabela periodicamente.
+    """
+    cupom = models.ForeignKey(Cupom, on_delete=models.CASCADE, related_name='impressoes', help_text="Cupom exibido")
+    dia = models.DateField(help_text="Dia das impressões (horário de Brasília)")
+    impressoes = models.PositiveIntegerField(default=0, help_text="Quantidade estimada de impressões no dia (extrapolada da amostragem)")
+    
+    class Meta:
+        ordering = ['-dia']
+        unique_together = ['cupom', 'dia']
+        verbose_name = 'Impressão de Cupom'
+        verbose_name_plural = 'Impressões de Cupons'
+        indexes = [
+            models.Index(fields=['dia'], name='impressao_dia_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.cupom.titulo} - {self.dia.strftime('%d/%m/%Y')}: {self.impressoes}"
 
 
-
-
-
+class ExclusaoAcessos(models.Model):
+    """
+    Exclusão em lote dos acessos que correspondem aos filtros do relatório.
+    Executada em segundo plano, por lotes de chaves primárias, para não manter
+    a requisição HTTP (e os locks do banco) abertos durante toda a exclusão.
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('em_andamento', 'Em andamento'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+    
+    data_inicio = models.CharField(max_length=10, blank=True, help_text="Filtro de data inicial (YYYY-MM-DD)")
+    data_fim = models.CharField(max_length=10, blank=True, help_text="Filtro de data final (YYYY-MM-DD)")
+    estado = models.CharField(max_length=2, blank=True, help_text="Filtro de estado (UF)")
+    cidade = models.CharField(max_length=100, blank=True, help_text="Filtro de cidade")
+    id_maximo = models.BigIntegerField(help_text="Maior ID de acesso existente ao solicitar a exclusão (acessos posteriores são preservados)")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente', help_text="Situação da exclusão")
+    total_estimado = models.PositiveIntegerField(default=0, help_text="Quantidade estimada de acessos a excluir")
+    total_excluidos = models.PositiveIntegerField(default=0, help_text="Quantidade de acessos já excluídos")
+    mensagem_erro = models.TextField(blank=True, help_text="Detalhes do erro, se houver")
+    solicitado_por = models.ForeignKey('AdminUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='exclusoes_acessos', help_text="Administrador que solicitou a exclusão")
+    data_criacao = models.DateTimeField(auto_now_add=True, help_text="Data da solicitação")
+    data_atualizacao = models.DateTimeField(auto_now=True, help_text="Data do último progresso registrado")
+    data_conclusao = models.DateTimeField(null=True, blank=True, help_text="Data de término da exclusão")
+    
+    class Meta:
+        ordering = ['-data_criacao']
+        verbose_name = 'Exclusão de Acessos'
+        verbose_name_plural = 'Exclusões de Acessos'
+    
+    def __str__(self):
+        return f"Exclusão #{self.pk} ({self.get_status_display()}): {self.total_excluidos} acesso(s)"
+    
+    def get_progresso(self):
+        """Percentual concluído (estimado), entre 0 e 100"""
+        if self.status == 'concluida':
+            return 100
+        if not self.total_estimado:
+            return 0
+        return min(99, int(self.total_excluidos * 100 / self.total_estimado))
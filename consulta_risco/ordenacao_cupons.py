@@ -0,0 +1,99 @@
+"""
+Ordenação dos cupons com chaves espaçadas.
+
+Cupom.ordem_exibicao guarda uma chave de ordenação com intervalos de
+ESPACAMENTO entre cupons vizinhos (1024, 2048, 3072...). Para mover um cupom
+para uma posição basta gravar nele uma chave entre as dos novos vizinhos, com
+uma única escrita. Apenas quando não resta espaço entre os vizinhos todas as
+chaves são renumeradas, de uma vez, com bulk_update (renormalizar_ordem).
+
+Para os administradores a ordem continua sendo exibida e informada como
+posição: 1, 2, 3...
+"""
+from django.db import transaction
+
+from .models import Cupom
+
+ESPACAMENTO = 1024
+
+
+def _ordenados(excluir_id=None):
+    cupons = Cupom.objects.order_by('ordem_exibicao', 'id')
+    if excluir_id is not None:
+        cupons = cupons.exclude(id=excluir_id)
+    return cupons
+
+
+def posicoes_cupons():
+    """Dicionário {id do cupom: posição de exibição (1, 2, 3...)} em uma única consulta"""
+    return {
+        cupom_id: posicao
+        for posicao, cupom_id in enumerate(_ordenados().values_list('id', flat=True), 1)
+    }
+
+
+def _chave_entre(anterior, proximo):
+    """Chave entre as dos vizinhos, ou None se não houver espaço"""
+    if anterior is None and proximo is None:
+        return ESPACAMENTO
+    if anterior is None:
+        return proximo - ESPACAMENTO
+    if proximo is None:
+        return anterior + ESPACAMENTO
+    if proximo - anterior > 1:
+        return (anterior + proximo) // 2
+    return None
+
+
+def chave_para_posicao(posicao, excluir_id=None):
+    """
+    Chave de ordenação que coloca um cupom na posição informada (1 = primeiro),
+    considerando os demais cupons. Renormaliza as chaves se não houver espaço.
+    """
+    indice = max(0, posicao - 1)
+    for _ in range(2):
+        cupons = _ordenados(excluir_id)
+        if indice == 0:
+            anterior = None
+            proximo = cupons.values_list('ordem_exibicao', flat=True).first()
+        else:
+            vizinhos = list(cupons.values_list('ordem_exibicao', flat=True)[indice - 1:indice + 1])
+            if not vizinhos:
+                # Posição além do fim da lista: colocar depois do último
+                anterior = cupons.values_list('ordem_exibicao', flat=True).last()
+                proximo = None
+            else:
+                anterior = vizinhos[0]
+                proximo = vizinhos[1] if len(vizinhos) > 1 else None
+
+        chave = _chave_entre(anterior, proximo)
+        if chave is not None:
+            return chave
+        renormalizar_ordem()
+
+    raise RuntimeError('Não foi possível calcular a chave de ordenação do cupom')
+
+
+def mover_cupom(cupom, posicao):
+    """Move o cupom para a posição informada gravando apenas a sua chave de ordenação"""
+    with transaction.atomic():
+        cupom.ordem_exibicao = chave_para_posicao(posicao, excluir_id=cupom.id)
+        Cupom.objects.filter(id=cupom.id).update(ordem_exibicao=cupom.ordem_exibicao)
+    return cupom.ordem_exibicao
+
+
+def renormalizar_ordem():
+    """
+    Renumera as chaves de todos os cupons com o espaçamento padrão, mantendo a
+    ordem atual, em uma transação com bulk_update. Retorna quantos mudaram.
+    """
+    with transaction.atomic():
+        cupons = list(_ordenados().select_for_update().only('id', 'ordem_exibicao'))
+        alterados = []
+        for posicao, cupom in enumerate(cupons, 1):
+            chave = posicao * ESPACAMENTO
+            if cupom.ordem_exibicao != chave:
+                cupom.ordem_exibicao = chave
+                alterados.append(cupom)
+        Cupom.objects.bulk_update(alterados, ['ordem_exibicao'], batch_size=500)
+    return len(alterados)
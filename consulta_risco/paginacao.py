@@ -0,0 +1,142 @@
+"""
+Paginação por cursor (keyset) e contagem aproximada para tabelas grandes.
+
+O Paginator do Django executa COUNT(*) sobre o conjunto filtrado e navega com
+OFFSET, que fica mais lento a cada página. Aqui cada página é buscada a partir
+do último registro da anterior, com filtro (data, id) < (data_cursor, id_cursor)
+atendido pelo índice composto, e o total é estimado pelas estatísticas do
+planejador quando o banco é PostgreSQL.
+"""
+import base64
+import json
+import logging
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+
+def codificar_cursor(data, id):
+    """Codifica a posição (data, id) de um registro em um token seguro para URL"""
+    valor = f'{data.isoformat()}|{id}'
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(token):
+    """Decodifica o token gerado por codificar_cursor; retorna None se inválido"""
+    if not token:
+        return None
+    try:
+        valor = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        data_texto, id_texto = valor.rsplit('|', 1)
+        data = parse_datetime(data_texto)
+        if data is None:
+            return None
+        return data, int(id_texto)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class PaginaCursor:
+    """Uma página da paginação por cursor, com a mesma interface usada nos templates"""
+
+    def __init__(self, itens, proximo_cursor=None, cursor_anterior=None):
+        self.object_list = itens
+        self.next_cursor = proximo_cursor
+        self.previous_cursor = cursor_anterior
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginar_por_cursor(queryset, campo='data_acesso', tamanho=20, apos=None, antes=None):
+    """
+    Retorna uma PaginaCursor do queryset em ordem decrescente de (campo, id).
+
+    `apos` busca a página seguinte ao cursor (registros mais antigos) e `antes`
+    a página anterior (registros mais recentes). Sem cursor, retorna a primeira.
+    """
+    posicao_apos = decodificar_cursor(apos)
+    posicao_antes = decodificar_cursor(antes) if posicao_apos is None else None
+
+    if posicao_antes is not None:
+        data, id = posicao_antes
+        itens = list(
+            queryset.filter(Q(**{f'{campo}__gt': data}) | Q(**{campo: data, 'id__gt': id}))
+            .order_by(campo, 'id')[:tamanho + 1]
+        )
+        tem_mais_recentes = len(itens) > tamanho
+        itens = itens[:tamanho]
+        itens.reverse()
+        tem_mais_antigos = True
+    else:
+        if posicao_apos is not None:
+            data, id = posicao_apos
+            queryset = queryset.filter(Q(**{f'{campo}__lt': data}) | Q(**{campo: data, 'id__lt': id}))
+        itens = list(queryset.order_by(f'-{campo}', '-id')[:tamanho + 1])
+        tem_mais_antigos = len(itens) > tamanho
+        itens = itens[:tamanho]
+        tem_mais_recentes = posicao_apos is not None
+
+    if not itens:
+        return PaginaCursor(itens)
+
+    primeiro, ultimo = itens[0], itens[-1]
+    return PaginaCursor(
+        itens,
+        proximo_cursor=codificar_cursor(getattr(ultimo, campo), ultimo.id) if tem_mais_antigos else None,
+        cursor_anterior=codificar_cursor(getattr(primeiro, campo), primeiro.id) if tem_mais_recentes else None,
+    )
+
+
+def contar_aproximado(queryset, limite_exato=10000):
+    """
+    Estima a quantidade de registros do queryset sem percorrer a tabela.
+
+    No PostgreSQL usa pg_class.reltuples (tabela inteira) ou a estimativa de
+    linhas do EXPLAIN (com filtros). Estimativas abaixo de `limite_exato` e
+    outros bancos usam COUNT(*), que nesses casos é barato ou a única opção.
+    Retorna (total, aproximado).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count(), False
+
+    estimativa = None
+    try:
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table]
+                )
+                linha = cursor.fetchone()
+            # reltuples = -1 indica tabela ainda não analisada (VACUUM/ANALYZE)
+            if linha and linha[0] >= 0:
+                estimativa = int(linha[0])
+        else:
+            plano = json.loads(queryset.order_by().explain(format='json'))
+            estimativa = int(plano[0]['Plan']['Plan Rows'])
+    except Exception as e:
+        logger.warning('Erro ao estimar contagem de %s: %s', queryset.model.__name__, str(e))
+
+    if estimativa is None or estimativa < limite_exato:
+        return queryset.count(), False
+    return estimativa, True
@@ -0,0 +1,158 @@
+"""
+Proteção do registro de cliques em cupons contra duplicados e robôs.
+
+Antes de chegar ao banco, cada clique passa por duas verificações no cache:
+  - janela de duplicados por (IP, cupom): cliques repetidos do mesmo IP no
+    mesmo cupom dentro de CLIQUES_JANELA_DUPLICADOS segundos são descartados
+    (duplo clique, recarregamento);
+  - limite por IP em balde de fichas (token bucket): cada IP tem até
+    CLIQUES_LIMITE_RAJADA fichas, repostas à razão de CLIQUES_POR_MINUTO por
+    minuto; sem fichas, o clique é recusado.
+
+Os cliques descartados são contados por motivo e dia no cache e exibidos no
+dashboard (cliques_suprimidos).
+"""
+import ipaddress
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+CHAVE_DUPLICADO = 'clique_dedup:{ip}:{cupom_id}'
+CHAVE_BALDE = 'clique_balde:{ip}'
+CHAVE_SUPRIMIDOS = 'cliques_suprimidos:{motivo}:{dia}'
+
+MOTIVOS = {
+    'duplicado': 'Cliques repetidos',
+    'limite': 'Limite por IP excedido',
+}
+
+# Contadores de suprimidos guardados por alguns dias para o dashboard
+TEMPO_CONTADOR = 3 * 24 * 60 * 60
+
+
+def _ip_valido(valor):
+    """Normaliza o IP; retorna None se não for um IP válido"""
+    try:
+        return str(ipaddress.ip_address((valor or '').strip()))
+    except ValueError:
+        return None
+
+
+def _proxy_confiavel(remoto):
+    """
+    Indica se a conexão vem de um proxy confiável. PROXIES_CONFIAVEIS aceita
+    IPs e faixas CIDR, em lista ou separados por vírgula (ex.: a rede do
+    docker-compose, em que o nginx roda em outro contêiner).
+    """
+    ip = _ip_valido(remoto)
+    if ip is None:
+        return False
+    proxies = getattr(settings, 'PROXIES_CONFIAVEIS', ('127.0.0.1', '::1'))
+    if isinstance(proxies, str):
+        proxies = proxies.split(',')
+    ip = ipaddress.ip_address(ip)
+    for proxy in proxies:
+        try:
+            if ip in ipaddress.ip_network(proxy.strip(), strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def ip_do_cliente(request):
+    """
+    Obtém o IP real do cliente atrás do proxy.
+
+    Os cabeçalhos só são considerados quando a conexão vem de um proxy
+    confiável (PROXIES_CONFIAVEIS, padrão: o nginx local). Nesse caso vale o
+    X-Real-IP, que o nginx define como $remote_addr, ou o último IP de
+    X-Forwarded-For, o único acrescentado pelo próprio proxy: os anteriores vêm
+    do cliente e podem ser forjados a cada requisição para escapar do limite
+    por IP. Valores que não são um IP válido são ignorados, pois seriam
+    recusados pelo GenericIPAddressField e fariam falhar o lote inteiro do
+    buffer de escrita.
+    """
+    remoto = request.META.get('REMOTE_ADDR')
+    if not _proxy_confiavel(remoto):
+        return remoto
+
+    ip = _ip_valido(request.META.get('HTTP_X_REAL_IP'))
+    if ip:
+        return ip
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = _ip_valido(x_forwarded_for.split(',')[-1])
+        if ip:
+            return ip
+    return remoto
+
+
+def _consumir_ficha(ip):
+    """
+    Retira uma ficha do balde do IP. Retorna False se o balde estiver vazio.
+
+    O estado (fichas, instante) é lido e gravado sem trava; requisições
+    simultâneas do mesmo IP podem passar alguns cliques a mais, o que basta
+    para conter robôs sem custo de coordenação.
+    """
+    capacidade = getattr(settings, 'CLIQUES_LIMITE_RAJADA', 10)
+    por_segundo = getattr(settings, 'CLIQUES_POR_MINUTO', 20) / 60
+    chave = CHAVE_BALDE.format(ip=ip)
+    agora = time.time()
+
+    fichas, instante = cache.get(chave, (capacidade, agora))
+    fichas = min(capacidade, fichas + (agora - instante) * por_segundo)
+    permitido = fichas >= 1
+    if permitido:
+        fichas -= 1
+
+    # Após este tempo o balde estaria cheio de novo: a chave pode expirar
+    tempo = int((capacidade - fichas) / por_segundo) + 1 if por_segundo > 0 else None
+    cache.set(chave, (fichas, agora), tempo)
+    return permitido
+
+
+def _contar_suprimido(motivo):
+    chave = CHAVE_SUPRIMIDOS.format(motivo=motivo, dia=timezone.localdate().isoformat())
+    try:
+        cache.incr(chave)
+    except ValueError:
+        if not cache.add(chave, 1, TEMPO_CONTADOR):
+            cache.incr(chave)
+
+
+def verificar_clique(ip, cupom_id):
+    """
+    Decide se um clique deve ser registrado.
+    Retorna None se sim, ou o motivo da supressão ('duplicado' ou 'limite').
+    """
+    ip = ip or 'desconhecido'
+    janela = getattr(settings, 'CLIQUES_JANELA_DUPLICADOS', 10)
+
+    motivo = None
+    if janela > 0 and not cache.add(CHAVE_DUPLICADO.format(ip=ip, cupom_id=cupom_id), 1, janela):
+        motivo = 'duplicado'
+    elif not _consumir_ficha(ip):
+        motivo = 'limite'
+
+    if motivo:
+        _contar_suprimido(motivo)
+    return motivo
+
+
+def cliques_suprimidos(dias=1):
+    """Cliques suprimidos por motivo nos últimos `dias` dias (incluindo hoje): {motivo: total}"""
+    hoje = timezone.localdate()
+    chaves = {
+        CHAVE_SUPRIMIDOS.format(motivo=motivo, dia=(hoje - timedelta(days=deslocamento)).isoformat()): motivo
+        for motivo in MOTIVOS
+        for deslocamento in range(dias)
+    }
+    totais = dict.fromkeys(MOTIVOS, 0)
+    for chave, valor in cache.get_many(list(chaves)).items():
+        totais[chaves[chave]] += valor
+    return totais
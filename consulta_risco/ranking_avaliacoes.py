@@ -0,0 +1,183 @@
+"""
+Ranking das cidades mais e menos seguras segundo as avaliações dos usuários.
+
+A nota de cada cidade é a média bayesiana das avaliações dos últimos 3 anos:
+
+    (soma + PESO * media_geral) / (quantidade + PESO)
+
+com PESO = RANKING_PESO_BAYES (padrão: 10). Cidades com poucas avaliações
+ficam próximas da média geral em vez de ocupar os extremos com uma única nota.
+Só entram cidades cadastradas com ao menos RANKING_MINIMO_AVALIACOES
+avaliações (padrão: 3).
+
+As listas (melhores e piores RANKING_TAMANHO cidades, padrão: 100) são
+montadas para o Brasil e para cada estado a partir de AvaliacaoAgregada, em
+uma consulta para as somas e outra para as cidades, e guardadas no cache.
+
+Uma avaliação apenas marca o ranking como desatualizado (marcar_desatualizado,
+uma escrita no cache, sem consultar o banco). A primeira leitura feita
+RANKING_INTERVALO segundos (padrão: 300) depois da marcação remonta o ranking,
+assim como o comando atualizar_ranking_avaliacoes; as leituras dentro do
+intervalo recebem a versão anterior. Se o cache estiver indisponível, o
+ranking é calculado a cada leitura.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .avaliacoes import primeiro_ano_avaliacoes
+from .models import AvaliacaoAgregada, Cidade
+
+CHAVE_RANKING = 'ranking_avaliacoes:{escopo}'
+CHAVE_ESCOPOS = 'ranking_avaliacoes_escopos'
+CHAVE_DESATUALIZADO = 'ranking_avaliacoes_desatualizado'
+CHAVE_REMONTANDO = 'ranking_avaliacoes_remontando'
+
+# Escopo do ranking nacional; os estaduais usam a sigla do estado
+ESCOPO_BRASIL = 'BR'
+
+TIPOS = ('melhores', 'piores')
+
+# As listas são remontadas bem antes de expirar
+TEMPO_RANKING = 7 * 24 * 60 * 60
+
+# Tempo máximo de uma remontagem; evita que várias leituras remontem ao mesmo tempo
+TEMPO_REMONTANDO = 60
+
+
+def _listas(cidades, tamanho):
+    """Melhores e piores `tamanho` cidades (já com nota), com a posição de cada uma"""
+    ordenadas = sorted(cidades, key=lambda cidade: (-cidade['nota'], -cidade['quantidade'], cidade['nome']))
+    piores = sorted(cidades, key=lambda cidade: (cidade['nota'], -cidade['quantidade'], cidade['nome']))
+    return {
+        'melhores': [dict(cidade, posicao=posicao) for posicao, cidade in enumerate(ordenadas[:tamanho], 1)],
+        'piores': [dict(cidade, posicao=posicao) for posicao, cidade in enumerate(piores[:tamanho], 1)],
+    }
+
+
+def calcular_rankings():
+    """Monta os rankings {escopo: {...}} do Brasil e de cada estado com avaliações"""
+    minimo = getattr(settings, 'RANKING_MINIMO_AVALIACOES', 3)
+    peso = getattr(settings, 'RANKING_PESO_BAYES', 10)
+    tamanho = getattr(settings, 'RANKING_TAMANHO', 100)
+
+    totais = (
+        AvaliacaoAgregada.objects.filter(ano__gte=primeiro_ano_avaliacoes())
+        .values('estado_id', 'cidade')
+        .annotate(soma_total=Sum('soma'), quantidade_total=Sum('quantidade'))
+        .order_by()
+    )
+    totais = {(linha['estado_id'], linha['cidade']): (linha['soma_total'], linha['quantidade_total']) for linha in totais}
+
+    soma_geral = sum(soma for soma, _ in totais.values())
+    quantidade_geral = sum(quantidade for _, quantidade in totais.values())
+    media_geral = soma_geral / quantidade_geral if quantidade_geral else 0
+
+    candidatas = {chave: valor for chave, valor in totais.items() if valor[1] >= minimo}
+    cidades = []
+    if candidatas:
+        registros = Cidade.objects.filter(
+            estado_id__in={estado_id for estado_id, _ in candidatas},
+            nome_normalizado__in={nome for _, nome in candidatas},
+        ).order_by('id').values('id', 'nome', 'nome_normalizado', 'estado_id', 'estado__sigla')
+        vistas = set()
+        for registro in registros:
+            chave = (registro['estado_id'], registro['nome_normalizado'])
+            if chave not in candidatas or chave in vistas:
+                continue
+            vistas.add(chave)
+            soma, quantidade = candidatas[chave]
+            cidades.append({
+                'id': registro['id'],
+                'nome': registro['nome'],
+                'estado': registro['estado__sigla'],
+                'media': round(soma / quantidade, 2),
+                'nota': round((soma + peso * media_geral) / (quantidade + peso), 2),
+                'quantidade': quantidade,
+            })
+
+    por_estado = defaultdict(list)
+    for cidade in cidades:
+        por_estado[cidade['estado']].append(cidade)
+
+    atualizado_em = timezone.now().isoformat()
+    rankings = {}
+    for escopo, lista in [(ESCOPO_BRASIL, cidades)] + list(por_estado.items()):
+        rankings[escopo] = dict(
+            _listas(lista, tamanho),
+            total=len(lista),
+            media_geral=round(media_geral, 2),
+            atualizado_em=atualizado_em,
+        )
+    return rankings
+
+
+def atualizar_rankings():
+    """Remonta todos os rankings e os guarda no cache. Retorna {escopo: {...}}"""
+    marcado_em = cache.get(CHAVE_DESATUALIZADO)
+    rankings = calcular_rankings()
+    cache.set_many(
+        {CHAVE_RANKING.format(escopo=escopo): ranking for escopo, ranking in rankings.items()},
+        TEMPO_RANKING,
+    )
+    # Estados sem cidades no ranking não podem manter listas antigas
+    anteriores = cache.get(CHAVE_ESCOPOS) or []
+    removidos = [escopo for escopo in anteriores if escopo not in rankings]
+    if removidos:
+        cache.delete_many([CHAVE_RANKING.format(escopo=escopo) for escopo in removidos])
+    cache.set(CHAVE_ESCOPOS, list(rankings), TEMPO_RANKING)
+
+    # Uma avaliação registrada durante a remontagem mantém a marcação
+    if marcado_em is not None and cache.get(CHAVE_DESATUALIZADO) == marcado_em:
+        cache.delete(CHAVE_DESATUALIZADO)
+    return rankings
+
+
+def marcar_desatualizado():
+    """Chamar após registrar uma avaliação; guarda o instante da primeira avaliação pendente"""
+    try:
+        cache.add(CHAVE_DESATUALIZADO, time.time(), None)
+    except Exception:
+        # Se o cache não estiver disponível, o ranking é calculado a cada leitura
+        pass
+
+
+def obter_ranking(escopo=ESCOPO_BRASIL):
+    """
+    Ranking do escopo ('BR' ou a sigla de um estado). Retorna None para
+    estados sem cidades no ranking.
+
+    Remonta todos os rankings se a lista do escopo não estiver no cache ou se
+    a marcação de desatualizado tiver mais de RANKING_INTERVALO segundos.
+    """
+    chave = CHAVE_RANKING.format(escopo=escopo)
+    try:
+        valores = cache.get_many([chave, CHAVE_ESCOPOS, CHAVE_DESATUALIZADO])
+    except Exception:
+        # Se o cache não estiver disponível, calcular sem cache
+        return calcular_rankings().get(escopo)
+
+    ranking = valores.get(chave)
+    escopos = valores.get(CHAVE_ESCOPOS)
+    marcado_em = valores.get(CHAVE_DESATUALIZADO)
+
+    # Sem a lista de escopos, ou com a lista do escopo removida do cache, não há o que servir
+    ausente = escopos is None or (ranking is None and escopo in escopos)
+    vencido = marcado_em is not None and time.time() - marcado_em >= getattr(settings, 'RANKING_INTERVALO', 300)
+    if not ausente and not vencido:
+        return ranking
+
+    try:
+        # Só uma leitura remonta; as demais recebem a versão anterior enquanto isso
+        if not cache.add(CHAVE_REMONTANDO, True, TEMPO_REMONTANDO) and not ausente:
+            return ranking
+        try:
+            return atualizar_rankings().get(escopo)
+        finally:
+            cache.delete(CHAVE_REMONTANDO)
+    except Exception:
+        return calcular_rankings().get(escopo)
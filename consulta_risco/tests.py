@@ -0,0 +1,226 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .agregacao import cobertura_agregados, estatisticas_acessos, inicio_do_dia
+from .arquivamento import arquivar
+from .avaliacoes import media_avaliacoes, registrar_avaliacao
+from .exclusao_acessos import retomar_abandonadas
+from .models import AcessoAgregado, AcessoPagina, AvaliacaoAgregada, AvaliacaoSeguranca, Cidade, Estado, ExclusaoAcessos
+from .protecao_cliques import ip_do_cliente, verificar_clique
+from .ranking_avaliacoes import CHAVE_RANKING, marcar_desatualizado, obter_ranking
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes'}}
+
+
+@override_settings(
+    CACHES=LOCMEM,
+    PROXIES_CONFIAVEIS=('127.0.0.1',),
+    CLIQUES_LIMITE_RAJADA=3,
+    CLIQUES_POR_MINUTO=0,
+    CLIQUES_JANELA_DUPLICADOS=0,
+)
+class ProtecaoCliquesTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def _request(self, x_forwarded_for, remote_addr='127.0.0.1', x_real_ip=None):
+        meta = {'REMOTE_ADDR': remote_addr, 'HTTP_X_FORWARDED_FOR': x_forwarded_for}
+        if x_real_ip:
+            meta['HTTP_X_REAL_IP'] = x_real_ip
+        return self.factory.get('/c/1/', **meta)
+
+    def test_ip_forjado_em_x_forwarded_for_e_ignorado(self):
+        # O nginx acrescenta o IP real ao final do cabeçalho enviado pelo cliente
+        request = self._request('1.2.3.4, 200.1.1.1')
+        self.assertEqual(ip_do_cliente(request), '200.1.1.1')
+
+    def test_x_real_ip_tem_prioridade(self):
+        request = self._request('1.2.3.4, 200.1.1.1', x_real_ip='200.1.1.1')
+        self.assertEqual(ip_do_cliente(request), '200.1.1.1')
+
+    def test_cabecalhos_ignorados_fora_do_proxy(self):
+        request = self._request('1.2.3.4', remote_addr='200.9.9.9', x_real_ip='5.6.7.8')
+        self.assertEqual(ip_do_cliente(request), '200.9.9.9')
+
+    @override_settings(PROXIES_CONFIAVEIS='127.0.0.1, 172.28.0.0/16')
+    def test_proxy_em_faixa_cidr(self):
+        # nginx em outro contêiner do docker-compose
+        request = self._request('1.2.3.4, 200.1.1.1', remote_addr='172.28.0.5')
+        self.assertEqual(ip_do_cliente(request), '200.1.1.1')
+        request = self._request('1.2.3.4', remote_addr='172.29.0.5')
+        self.assertEqual(ip_do_cliente(request), '172.29.0.5')
+
+    def test_trocar_ip_forjado_nao_escapa_do_limite(self):
+        motivos = []
+        for numero in range(5):
+            request = self._request(f'10.0.0.{numero}, 200.1.1.1', x_real_ip='200.1.1.1')
+            motivos.append(verificar_clique(ip_do_cliente(request), 1))
+        self.assertEqual(motivos, [None, None, None, 'limite', 'limite'])
+
+
+@override_settings(CACHES=LOCMEM, RANKING_MINIMO_AVALIACOES=3, RANKING_INTERVALO=300)
+class RankingAvaliacoesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.estado = Estado.objects.create(nome='Teste', sigla='ZZ')
+        for nome in ('Alfa', 'Beta'):
+            Cidade.objects.create(nome=nome, estado=self.estado)
+
+    def _votar(self):
+        for numero in range(4):
+            for nome, nota in (('Alfa', 9), ('Beta', 2)):
+                registrar_avaliacao(f'u{numero}@teste.com', self.estado, nome, nota)
+                marcar_desatualizado()
+
+    def test_votos_entram_no_ranking_apos_o_intervalo(self):
+        self.assertEqual(obter_ranking()['total'], 0)
+        self._votar()
+
+        with mock.patch('consulta_risco.ranking_avaliacoes.time.time', return_value=10 ** 12):
+            ranking = obter_ranking()
+        self.assertEqual(ranking['total'], 2)
+        self.assertEqual([cidade['nome'] for cidade in ranking['melhores']], ['Alfa', 'Beta'])
+
+    def test_escopo_removido_do_cache_e_remontado(self):
+        self._votar()
+        obter_ranking()
+        cache.delete(CHAVE_RANKING.format(escopo='ZZ'))
+        self.assertEqual(obter_ranking('ZZ')['total'], 2)
+
+    def test_cache_indisponivel(self):
+        self._votar()
+        with mock.patch('consulta_risco.ranking_avaliacoes.cache.get_many', side_effect=ConnectionError):
+            response = self.client.get('/api/ranking-avaliacoes/?estado=ZZ')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 2)
+
+
+@override_settings(CACHES=LOCMEM)
+class RegistrarAvaliacaoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.estado = Estado.objects.create(nome='Teste', sigla='ZZ')
+
+    def _agregadas(self):
+        return list(
+            AvaliacaoAgregada.objects.filter(estado=self.estado)
+            .order_by('ano').values_list('cidade', 'ano', 'soma', 'quantidade')
+        )
+
+    def test_variacoes_do_nome_atualizam_o_mesmo_voto(self):
+        cidade = Cidade.objects.create(nome='São Paulo', estado=self.estado)
+        avaliacao, criada = registrar_avaliacao('a@teste.com', self.estado, 'sao paulo', 8)
+        self.assertTrue(criada)
+        self.assertEqual((avaliacao.cidade, avaliacao.cidade_cadastrada), ('São Paulo', cidade))
+
+        _, criada = registrar_avaliacao('a@teste.com', self.estado, 'SÃO-PAULO', 4)
+        self.assertFalse(criada)
+        self.assertEqual(media_avaliacoes(self.estado.id, 'São Paulo')['quantidade'], 1)
+
+    def test_cidade_cadastrada_depois_do_voto(self):
+        registrar_avaliacao('a@teste.com', self.estado, 'São Paulo', 8)
+        cidade = Cidade.objects.create(nome='São Paulo', estado=self.estado)
+
+        avaliacao, criada = registrar_avaliacao('a@teste.com', self.estado, 'São Paulo', 6)
+        self.assertFalse(criada)
+        self.assertEqual(avaliacao.cidade_cadastrada, cidade)
+        self.assertEqual(AvaliacaoSeguranca.objects.count(), 1)
+        self.assertEqual(media_avaliacoes(self.estado.id, 'São Paulo')['media'], 6)
+
+    def test_cidade_excluida_e_importada_de_novo(self):
+        Cidade.objects.create(nome='São Paulo', estado=self.estado)
+        registrar_avaliacao('a@teste.com', self.estado, 'sao paulo', 8)
+        Cidade.objects.filter(estado=self.estado).delete()
+        nova = Cidade.objects.create(nome='São Paulo', estado=self.estado)
+
+        avaliacao, criada = registrar_avaliacao('a@teste.com', self.estado, 'São Paulo', 3)
+        self.assertFalse(criada)
+        self.assertEqual(avaliacao.cidade_cadastrada, nova)
+        self.assertEqual(AvaliacaoSeguranca.objects.count(), 1)
+
+    def test_nota_alterada_muda_de_ano(self):
+        avaliacao, _ = registrar_avaliacao('a@teste.com', self.estado, 'Santos', 8)
+        ano = timezone.localtime(avaliacao.data_avaliacao).year
+        # Simular um voto dado no ano anterior
+        data_anterior = avaliacao.data_avaliacao - timedelta(days=400)
+        AvaliacaoSeguranca.objects.filter(id=avaliacao.id).update(data_avaliacao=data_anterior)
+        ano_anterior = timezone.localtime(data_anterior).year
+        AvaliacaoAgregada.objects.filter(estado=self.estado).update(ano=ano_anterior)
+
+        registrar_avaliacao('a@teste.com', self.estado, 'Santos', 5)
+        self.assertEqual(self._agregadas(), [('SANTOS', ano_anterior, 0, 0), ('SANTOS', ano, 5, 1)])
+
+
+class ArquivamentoTests(SimpleTestCase):
+    def test_cliques_nao_sao_arquivados(self):
+        # Os totais de cliques do dashboard são contados nos cliques brutos
+        with self.assertRaises(ValueError):
+            arquivar('cliques', timezone.now())
+
+
+@override_settings(CACHES=LOCMEM)
+class AgregacaoAcessosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        agora = timezone.now()
+        self.hoje = inicio_do_dia(agora)
+        datas = [
+            agora - timedelta(days=10),
+            self.hoje - timedelta(hours=20),
+            self.hoje + timedelta(minutes=5),
+            agora - timedelta(hours=3),
+        ]
+        for data in datas:
+            AcessoPagina.objects.create(url='/', nome_pagina='Home', estado='SP', cidade='Santos', data_acesso=data)
+
+    def test_acessos_anteriores_as_agregacoes_continuam_no_relatorio(self):
+        call_command('agregar_acessos', horas=2, stdout=StringIO())
+        self.assertTrue(AcessoAgregado.objects.exists())
+        self.assertEqual(estatisticas_acessos()['total_acessos'], 4)
+        self.assertEqual(estatisticas_acessos(inicio=self.hoje - timedelta(days=2))['total_acessos'], 3)
+
+    def test_primeiro_dia_agregado_fica_completo(self):
+        call_command('agregar_acessos', horas=2, stdout=StringIO())
+        esperado = AcessoPagina.objects.filter(
+            data_acesso__gte=self.hoje, data_acesso__lt=cobertura_agregados()
+        ).count()
+        diarias = AcessoAgregado.objects.filter(granularidade='dia', periodo=self.hoje)
+        self.assertEqual(sum(diaria.total for diaria in diarias), esperado)
+
+
+@override_settings(EXCLUSAO_ACESSOS_MODO='thread', EXCLUSAO_ACESSOS_INATIVA_MINUTOS=10)
+class ExclusaoAbandonadaTests(TestCase):
+    def _exclusao(self, minutos_sem_progresso):
+        exclusao = ExclusaoAcessos.objects.create(id_maximo=0, status='em_andamento')
+        ExclusaoAcessos.objects.filter(pk=exclusao.pk).update(
+            data_atualizacao=timezone.now() - timedelta(minutes=minutos_sem_progresso)
+        )
+        return exclusao
+
+    def test_exclusao_abandonada_e_retomada_uma_vez(self):
+        exclusao = self._exclusao(30)
+        with mock.patch('consulta_risco.exclusao_acessos.iniciar_exclusao') as iniciar:
+            self.assertEqual(retomar_abandonadas(), [exclusao.pk])
+            # Reservada pela primeira chamada: outro processo não a retoma de novo
+            self.assertEqual(retomar_abandonadas(), [])
+        iniciar.assert_called_once()
+
+    def test_exclusao_com_progresso_recente_nao_e_retomada(self):
+        self._exclusao(2)
+        with mock.patch('consulta_risco.exclusao_acessos.iniciar_exclusao') as iniciar:
+            self.assertEqual(retomar_abandonadas(), [])
+        iniciar.assert_not_called()
+
+    @override_settings(EXCLUSAO_ACESSOS_MODO='comando')
+    def test_modo_comando_fica_com_o_cron(self):
+        self._exclusao(30)
+        with mock.patch('consulta_risco.exclusao_acessos.iniciar_exclusao') as iniciar:
+            self.assertEqual(retomar_abandonadas(), [])
+        iniciar.assert_not_called()
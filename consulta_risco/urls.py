@@ -10,10 +10,15 @@ urlpatterns = [
     path('maintenance/', views.maintenance, name='maintenance'),
     path('cupons/', views.cupons, name='cupons'),
     path('api/cidades/', views.get_cidades, name='get_cidades'),
+    path('api/cidades/buscar/', views.buscar_cidades_api, name='buscar_cidades'),
     path('api/cidades-acessos/', views.get_cidades_acessos, name='get_cidades_acessos'),
     path('api/avaliar-seguranca/', views.avaliar_seguranca, name='avaliar_seguranca'),
     path('api/media-avaliacoes/', views.obter_media_avaliacoes, name='obter_media_avaliacoes'),
+    path('api/media-avaliacoes/lote/', views.medias_avaliacoes_lote, name='medias_avaliacoes_lote'),
+    path('api/risco/', views.risco_trajeto, name='risco_trajeto'),
+    path('api/ranking-avaliacoes/', views.ranking_avaliacoes, name='ranking_avaliacoes'),
     path('api/registrar-clique-cupom/', views.registrar_clique_cupom, name='registrar_clique_cupom'),
+    path('c/<int:cupom_id>/', views.redirecionar_cupom, name='redirecionar_cupom'),
     path('mapa-seguranca/', views.mapa_seguranca, name='mapa_seguranca'),
     
             # URLs do sistema administrativo (alteradas para evitar conflito com Django admin)
@@ -25,9 +30,12 @@ urlpatterns = [
             path('painel/relatorio-acessos/', views.admin_relatorio_acessos, name='admin_relatorio_acessos'),
             path('painel/acesso/excluir/<int:acesso_id>/', views.excluir_acesso_pagina, name='excluir_acesso_pagina'),
             path('painel/acesso/excluir-todos-filtrados/', views.excluir_todos_acessos_filtrados, name='excluir_todos_acessos_filtrados'),
+            path('painel/acesso/exclusoes/<int:exclusao_id>/', views.status_exclusao_acessos, name='status_exclusao_acessos'),
+            path('painel/relatorio-acessos/exportar/<str:tabela>/', views.exportar_registros, name='exportar_registros'),
             path('painel/cupom/edit/', views.admin_cupom_edit, name='admin_cupom_edit'),
             path('painel/cupom/edit/<int:cupom_id>/', views.admin_cupom_edit, name='admin_cupom_edit'),
             path('painel/cupom/delete/<int:cupom_id>/', views.admin_cupom_delete, name='admin_cupom_delete'),
+            path('painel/cupom/<int:cupom_id>/cliques/', views.serie_cliques_cupom, name='serie_cliques_cupom'),
             
             # URLs para gerenciamento de usuários administrativos
             path('painel/usuarios/', views.admin_users_list, name='admin_users_list'),
@@ -1,18 +1,19 @@
 import logging
 from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 from django.utils.timezone import localtime
+from django.utils.http import parse_etags
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.urls import reverse
 from django.core.mail import send_mail
-from django.core.paginator import Paginator
 import hashlib
 import json
 import secrets
@@ -23,7 +24,16 @@ import folium
 from folium.plugins import HeatMap, MarkerCluster
 import unicodedata
 from datetime import datetime, timedelta
-from .models import Estado, Cidade, Cupom, AdminUser, TipoCupom, AvaliacaoSeguranca, SistemaAtualizacao, CliqueCupom, AcessoPagina
+from urllib.parse import urlencode
+from .avaliacoes import consultar_risco, media_avaliacoes, medias_por_cidade, registrar_avaliacao
+from .buffer_escrita import registrar
+from .cache_cidades import obter_cidades_json, versao_cidades
+from .cache_cupons import invalidar_cache_cupons, obter_cupons_validos
+from .impressoes import registrar_impressoes
+from .protecao_cliques import ip_do_cliente, verificar_clique
+from .ranking_avaliacoes import ESCOPO_BRASIL, TIPOS, marcar_desatualizado, obter_ranking
+from .ordenacao_cupons import chave_para_posicao, mover_cupom, posicoes_cupons
+from .models import Estado, Cidade, Cupom, AdminUser, TipoCupom, AvaliacaoSeguranca, SistemaAtualizacao, CliqueCupom, AcessoPagina, ExclusaoAcessos
 
 logger = logging.getLogger(__name__)
 
@@ -44,33 +54,6 @@ def formatar_data_brasil(datetime_obj):
     return data_local.strftime('%d/%m/%Y %H:%M')
 
 
-def reordenar_cupons(cupom_atualizado, nova_ordem, cupom_id=None):
-    """
-    Reordena automaticamente os cupons quando a ordem de um cupom é alterada.
-    
-    Args:
-        cupom_atualizado: Instância do cupom sendo editado (None se for novo)
-        nova_ordem: Nova ordem de exibição
-        cupom_id: ID do cupom sendo editado (None se for novo)
-    """
-    # Obter todos os cupons ordenados por ordem_exibicao
-    cupons = list(Cupom.objects.all().order_by('ordem_exibicao', 'id'))
-    
-    # Remover o cupom sendo editado da lista original (se existir)
-    if cupom_id is not None:
-        cupons = [c for c in cupons if c.id != cupom_id]
-    
-    # Inserir o cupom na posição correta
-    posicao_inserir = min(nova_ordem - 1, len(cupons))
-    cupons.insert(posicao_inserir, cupom_atualizado)
-    
-    # Reordenar todos os cupons com ordem sequencial
-    for index, cupom in enumerate(cupons, 1):
-        if cupom.ordem_exibicao != index:
-            cupom.ordem_exibicao = index
-            cupom.save(update_fields=['ordem_exibicao'])
-
-
 def home(request):
     """View principal do site"""
     estados = Estado.objects.all().order_by('nome')
@@ -104,23 +87,21 @@ def maintenance(request):
 
 def cupons(request):
     """View para página de cupons"""
-    # Obter todos os cupons ativos
-    cupons = Cupom.objects.select_related('tipo_cupom').filter(ativo=True).order_by('ordem_exibicao', 'data_criacao')
-    
-    # Filtrar apenas cupons válidos baseado nas datas
-    cupons_validos = []
-    agora = timezone.now()
-    
-    for cupom in cupons:
-        # Verificar se o cupom está válido usando o método do modelo
-        if cupom.esta_valido():
-            cupons_validos.append(cupom)
+    # Apenas cupons válidos (ativos e dentro do período), do cache
+    cupons_validos = obter_cupons_validos()
     
     # Filtro por loja
     loja_pesquisa = request.GET.get('loja', '').strip()
     if loja_pesquisa:
         cupons_validos = [c for c in cupons_validos if loja_pesquisa.lower() in c.loja.lower()]
     
+    # Contar impressões (amostradas, em contadores no cache)
+    try:
+        registrar_impressoes([c.id for c in cupons_validos])
+    except Exception as e:
+        # Não interromper a página se houver erro no rastreamento
+        logger.error('Erro ao registrar impressões de cupons: %s', str(e))
+    
     return render(request, 'consulta_risco/cupons.html', {
         'cupons': cupons_validos,
         'loja_pesquisa': loja_pesquisa
@@ -128,13 +109,53 @@ def cupons(request):
 
 
 def get_cidades(request):
-    """API para buscar cidades de um estado específico"""
-    estado_id = request.GET.get('estado_id')
-    if estado_id:
-        cidades = Cidade.objects.filter(estado_id=estado_id).order_by('nome')
-        data = [{'id': cidade.id, 'nome': cidade.nome, 'posicao': cidade.posicao} for cidade in cidades]
-        return JsonResponse(data, safe=False)
-    return JsonResponse([], safe=False)
+    """
+    API para buscar cidades de um estado específico
+    
+    Serve o JSON pré-serializado do estado (ver cache_cidades), com ETag ligado
+    à versão dos dados de cidades; If-None-Match correspondente recebe 304.
+    """
+    estado_id = request.GET.get('estado_id', '')
+    if not estado_id.isdigit():
+        return JsonResponse([], safe=False)
+    
+    # Revalidação só com a versão: o conteúdo não é lido para responder 304
+    etag = f'"cidades-{versao_cidades()}-{estado_id}"'
+    etags_cliente = {
+        valor[2:] if valor.startswith('W/') else valor
+        for valor in parse_etags(request.headers.get('If-None-Match', ''))
+    }
+    
+    if etag in etags_cliente or '*' in etags_cliente:
+        response = HttpResponseNotModified()
+    else:
+        versao, conteudo = obter_cidades_json(int(estado_id))
+        etag = f'"cidades-{versao}-{estado_id}"'
+        response = HttpResponse(conteudo, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'CIDADES_CACHE_MAX_AGE', 300)}"
+    return response
+
+
+def buscar_cidades_api(request):
+    """
+    API de autocompletar cidades: /api/cidades/buscar/?q=sao pa
+    
+    Busca pelo início do nome (ou de uma palavra do nome), sem diferenciar
+    acentos e maiúsculas, em todos os estados ou apenas em estado_id.
+    Respondida pelo índice em memória de busca_cidades, sem consultar o banco.
+    """
+    from .busca_cidades import buscar_cidades
+    
+    texto = request.GET.get('q', '').strip()
+    try:
+        limite = min(max(int(request.GET.get('limite', 10)), 1), 50)
+    except ValueError:
+        limite = 10
+    estado_id = request.GET.get('estado_id', '')
+    estado_id = int(estado_id) if estado_id.isdigit() else None
+    
+    return JsonResponse(buscar_cidades(texto, limite, estado_id), safe=False)
 
 
 @csrf_exempt
@@ -192,33 +213,14 @@ def avaliar_seguranca(request):
         except Estado.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Estado não encontrado'})
         
-        # Usar get_or_create para atualizar se já existir
-        avaliacao, created = AvaliacaoSeguranca.objects.get_or_create(
-            email=email,
-            estado=estado,
-            cidade=cidade_nome,
-            defaults={'nota': nota}
-        )
-        
-        if not created:
-            # Se já existe, atualizar a nota e a data de avaliação
-            avaliacao.nota = nota
-            # Usar função do modelo para garantir UTC-3
-            from .models import get_brasilia_time
-            avaliacao.data_avaliacao = get_brasilia_time()
-            avaliacao.save()
-        
-        # Invalidar cache da média de avaliações para esta cidade (se cache estiver disponível)
-        try:
-            from django.core.cache import cache
-            cache_key = f'avaliacao_media_{estado_id}_{cidade_nome.lower()}'
-            cache.delete(cache_key)
-        except Exception:
-            # Se o cache não estiver disponível, continuar sem invalidar
-            pass
+        # Criar ou atualizar a avaliação e a agregação por ano da cidade (invalida a média em cache)
+        avaliacao, created = registrar_avaliacao(email, estado, cidade_nome, nota)
         
         # Atualizar data do sistema
-        SistemaAtualizacao.atualizar_sistema(f"Avaliação de segurança para {cidade_nome} recebida")
+        SistemaAtualizacao.marcar_atualizacao(f"Avaliação de segurança para {cidade_nome} recebida")
+        
+        # Marcar o ranking de avaliações para ser remontado (ver ranking_avaliacoes)
+        marcar_desatualizado()
         
         # Mensagem personalizada baseada se foi criada ou atualizada
         if created:
@@ -256,23 +258,61 @@ def registrar_clique_cupom(request):
             return JsonResponse({'success': False, 'error': 'Cupom não encontrado'}, status=404)
         
         # Obter informações do usuário
-        ip_address = request.META.get('REMOTE_ADDR')
+        ip_address = ip_do_cliente(request)
         user_agent = request.META.get('HTTP_USER_AGENT', '')
         
-        # Registrar o clique
-        CliqueCupom.objects.create(
+        # Descartar cliques repetidos e limitar cliques por IP antes do banco
+        motivo = verificar_clique(ip_address, cupom.id)
+        if motivo == 'limite':
+            return JsonResponse({'success': False, 'error': 'Muitos cliques em pouco tempo'}, status=429)
+        if motivo == 'duplicado':
+            return JsonResponse({'success': True, 'message': 'Clique já registrado', 'registrado': False})
+        
+        # Registrar o clique (enfileirado para gravação em lote, ver buffer_escrita)
+        registrar(CliqueCupom(
             cupom=cupom,
             ip_address=ip_address,
             user_agent=user_agent
-        )
+        ))
         
-        return JsonResponse({'success': True, 'message': 'Clique registrado com sucesso'})
+        return JsonResponse({'success': True, 'message': 'Clique registrado com sucesso', 'registrado': True})
     
     except Exception as e:
         logger.error('Erro ao registrar clique no cupom: %s', str(e))
         return JsonResponse({'success': False, 'error': 'Erro ao registrar clique'}, status=500)
 
 
+@never_cache
+def redirecionar_cupom(request, cupom_id):
+    """
+    Registra o clique no cupom e redireciona (302) para o link da loja, em uma
+    única requisição. O clique vai para o buffer de escrita, então o redirecionamento
+    não espera o INSERT.
+    """
+    # Cupons válidos vêm da lista em cache da página /cupons/, sem consulta ao banco
+    link = next((c.link_acesso for c in obter_cupons_validos() if c.id == cupom_id), None)
+    if link is None:
+        # Cupom fora da lista (expirado, inativo...): ainda redireciona se existir
+        link = Cupom.objects.filter(id=cupom_id).values_list('link_acesso', flat=True).first()
+        if link is None:
+            raise Http404('Cupom não encontrado')
+
+    # Cliques repetidos ou acima do limite por IP redirecionam sem registrar
+    try:
+        ip_address = ip_do_cliente(request)
+        if verificar_clique(ip_address, cupom_id) is None:
+            registrar(CliqueCupom(
+                cupom_id=cupom_id,
+                ip_address=ip_address,
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            ))
+    except Exception as e:
+        # Não impedir o redirecionamento se houver erro no rastreamento
+        logger.error('Erro ao registrar clique no cupom: %s', str(e))
+
+    return HttpResponseRedirect(link)
+
+
 @csrf_exempt
 def obter_media_avaliacoes(request):
     """View para obter a média das avaliações de uma cidade (últimos 3 anos)"""
@@ -283,95 +323,97 @@ def obter_media_avaliacoes(request):
         if not estado_id or not cidade_nome:
             return JsonResponse({'success': False, 'error': 'Estado e cidade são obrigatórios'})
         
-        # Tentar obter do cache (se disponível)
-        cached_result = None
-        try:
-            from django.core.cache import cache
-            cache_key = f'avaliacao_media_{estado_id}_{cidade_nome.lower()}'
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                return JsonResponse(cached_result)
-        except Exception:
-            # Se o cache não estiver disponível, continuar sem cache
-            pass
-        
-        # Buscar o estado
+        # Média dos últimos 3 anos, em cache por 1 hora (ver avaliacoes)
         try:
-            estado = Estado.objects.get(id=estado_id)
-        except Estado.DoesNotExist:
+            return JsonResponse(media_avaliacoes(estado_id, cidade_nome))
+        except (Estado.DoesNotExist, ValueError):
             return JsonResponse({'success': False, 'error': 'Estado não encontrado'})
-        
-        # Calcular data limite (ano corrente - 2 anos = últimos 3 anos)
-        from datetime import datetime, timedelta
-        from .models import get_brasilia_time
-        import pytz
-        
-        # Obter data atual em Brasília
-        brasilia_tz = pytz.timezone('America/Sao_Paulo')
-        data_atual = datetime.now(brasilia_tz)
-        
-        # Data limite: 1º de janeiro do ano há 2 anos atrás
-        ano_limite = data_atual.year - 2
-        data_limite = datetime(ano_limite, 1, 1, tzinfo=brasilia_tz)
-        # Remover timezone para comparar com campo que não tem timezone
-        data_limite = data_limite.replace(tzinfo=None)
-        
-        # Buscar avaliações da cidade dos últimos 3 anos (usando índice para otimizar)
-        avaliacoes = AvaliacaoSeguranca.objects.filter(
-            estado=estado,
-            cidade__iexact=cidade_nome,
-            data_avaliacao__gte=data_limite
-        ).only('nota')  # Selecionar apenas o campo necessário para otimizar
-        
-        if avaliacoes.exists():
-            # Calcular média usando aggregate (mais eficiente)
-            from django.db.models import Avg, Count
-            resultado = avaliacoes.aggregate(
-                media=Avg('nota'),
-                quantidade=Count('id')
-            )
-            
-            media = resultado['media']
-            quantidade = resultado['quantidade']
-            
-            response_data = {
-                'success': True,
-                'tem_avaliacoes': True,
-                'media': round(media, 2),
-                'quantidade': quantidade
-            }
-            
-            # Armazenar no cache por 1 hora (se cache estiver disponível)
-            try:
-                from django.core.cache import cache
-                cache_key = f'avaliacao_media_{estado_id}_{cidade_nome.lower()}'
-                cache.set(cache_key, response_data, 3600)
-            except Exception:
-                # Se o cache não estiver disponível, continuar sem cache
-                pass
-            
-            return JsonResponse(response_data)
-        else:
-            response_data = {
-                'success': True,
-                'tem_avaliacoes': False
-            }
-            
-            # Armazenar no cache por 1 hora mesmo quando não há avaliações (se cache estiver disponível)
-            try:
-                from django.core.cache import cache
-                cache_key = f'avaliacao_media_{estado_id}_{cidade_nome.lower()}'
-                cache.set(cache_key, response_data, 3600)
-            except Exception:
-                # Se o cache não estiver disponível, continuar sem cache
-                pass
-            
-            return JsonResponse(response_data)
             
     except Exception as e:
         return JsonResponse({'success': False, 'error': f'Erro interno: {str(e)}'})
 
 
+def medias_avaliacoes_lote(request):
+    """
+    API com as médias das avaliações de várias cidades: /api/media-avaliacoes/lote/?cidades=1,2,3
+    
+    Retorna {cidade_id: {nome, estado, posicao, media, quantidade_avaliacoes}}
+    com uma leitura do cache e uma consulta agrupada para as médias que faltarem.
+    """
+    ids = [parte.strip() for parte in request.GET.get('cidades', '').split(',') if parte.strip()]
+    if not ids or not all(parte.isdigit() for parte in ids):
+        return JsonResponse({'success': False, 'error': 'Informe os IDs das cidades separados por vírgula'}, status=400)
+    
+    limite = getattr(settings, 'MEDIAS_AVALIACOES_LIMITE_LOTE', 200)
+    ids = list(dict.fromkeys(int(parte) for parte in ids))
+    if len(ids) > limite:
+        return JsonResponse({'success': False, 'error': f'Máximo de {limite} cidades por consulta'}, status=400)
+    
+    medias = medias_por_cidade(ids)
+    return JsonResponse({
+        'success': True,
+        'cidades': {str(cidade_id): dados for cidade_id, dados in medias.items()},
+    })
+
+
+def risco_trajeto(request):
+    """
+    API da consulta de risco: /api/risco/?origem=<cidade_id>&destino=<cidade_id>
+    
+    Retorna em uma única chamada as posições das duas cidades no ranking, as
+    médias das avaliações (em cache) e o nível de risco calculado no servidor.
+    """
+    origem = request.GET.get('origem', '')
+    destino = request.GET.get('destino', '')
+    if not origem.isdigit() or not destino.isdigit():
+        return JsonResponse({'success': False, 'error': 'Cidades de origem e destino são obrigatórias'}, status=400)
+    
+    resultado = consultar_risco(int(origem), int(destino))
+    if resultado is None:
+        return JsonResponse({'success': False, 'error': 'Cidade não encontrada'}, status=404)
+    return JsonResponse(resultado)
+
+
+def ranking_avaliacoes(request):
+    """
+    API do ranking de cidades pelas avaliações dos usuários:
+    /api/ranking-avaliacoes/?estado=SP&tipo=melhores&pagina=1&por_pagina=20
+    
+    Sem estado, retorna o ranking nacional. As listas vêm do cache
+    (ver ranking_avaliacoes) e são paginadas aqui.
+    """
+    escopo = request.GET.get('estado', '').strip().upper() or ESCOPO_BRASIL
+    tipo = request.GET.get('tipo', 'melhores')
+    if tipo not in TIPOS:
+        return JsonResponse({'success': False, 'error': 'Tipo deve ser "melhores" ou "piores"'}, status=400)
+    
+    try:
+        pagina = max(1, int(request.GET.get('pagina', 1)))
+        por_pagina = int(request.GET.get('por_pagina', 20))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Página inválida'}, status=400)
+    por_pagina = min(max(1, por_pagina), getattr(settings, 'RANKING_POR_PAGINA_MAXIMO', 50))
+    
+    if escopo != ESCOPO_BRASIL and not Estado.objects.filter(sigla=escopo).exists():
+        return JsonResponse({'success': False, 'error': 'Estado não encontrado'}, status=404)
+    
+    ranking = obter_ranking(escopo) or {}
+    cidades = ranking.get(tipo, [])
+    inicio = (pagina - 1) * por_pagina
+    return JsonResponse({
+        'success': True,
+        'escopo': escopo,
+        'tipo': tipo,
+        'pagina': pagina,
+        'por_pagina': por_pagina,
+        'total': len(cidades),
+        'tem_proxima': inicio + por_pagina < len(cidades),
+        'media_geral': ranking.get('media_geral'),
+        'atualizado_em': ranking.get('atualizado_em'),
+        'cidades': cidades[inicio:inicio + por_pagina],
+    })
+
+
 # Sistema de Autenticação Simples
 def hash_password(password):
     """Função simples para hash de senha"""
@@ -427,8 +469,10 @@ def admin_required(view_func):
 @admin_required
 def admin_dashboard(request):
     """Dashboard do administrador"""
-    cupons_qs = Cupom.objects.select_related('criado_por', 'modificado_por', 'tipo_cupom').all().order_by('ordem_exibicao', 'data_criacao')
-    cupons_todos = list(cupons_qs)
+    # Total de cliques anotado na própria consulta (evita um COUNT por cupom)
+    cupons_qs = Cupom.objects.select_related('criado_por', 'modificado_por', 'tipo_cupom').annotate(
+        num_cliques=Count('cliques')
+    ).order_by('ordem_exibicao', 'data_criacao')
     
     # Filtro por loja
     loja_pesquisa = request.GET.get('loja', '').strip()
@@ -479,31 +523,52 @@ def admin_dashboard(request):
         except ValueError:
             pass
 
-    cupons_todos = list(cupons_qs)
+    # Filtro por cliques (no banco, sobre o total anotado)
+    filtro_cliques = request.GET.get('filtro_cliques', 'todos')
+    if filtro_cliques == 'com_cliques':
+        cupons_qs = cupons_qs.filter(num_cliques__gt=0)
+    elif filtro_cliques == 'sem_cliques':
+        cupons_qs = cupons_qs.filter(num_cliques=0)
 
-    # Filtro por status (validos, expirados, inativos, todos)
+    # Filtro por status (validos, expirados, inativos, todos), no banco.
+    # "Expirados" inclui os agendados: ativos, mas fora do período de validade
+    agora = timezone.now()
     status_filtro = request.GET.get('status', 'todos')
-    cupons = cupons_todos
     if status_filtro == 'validos':
-        cupons = [c for c in cupons_todos if c.esta_valido()]
+        cupons_qs = cupons_qs.validos(agora)
     elif status_filtro == 'expirados':
-        cupons = [c for c in cupons_todos if not c.esta_valido() and c.ativo]
+        cupons_qs = cupons_qs.fora_da_validade(agora)
     elif status_filtro == 'inativos':
-        cupons = [c for c in cupons_todos if not c.ativo]
-
-    # Filtro por cliques
-    filtro_cliques = request.GET.get('filtro_cliques', 'todos')
-    if filtro_cliques == 'com_cliques':
-        cupons = [c for c in cupons if c.foi_clicado()]
-    elif filtro_cliques == 'sem_cliques':
-        cupons = [c for c in cupons if not c.foi_clicado()]
+        cupons_qs = cupons_qs.inativos()
+
+    cupons = list(cupons_qs)
+
+    # Posição de cada cupom na ordem de exibição geral (1, 2, 3...), cliques
+    # dos últimos 30 dias (das agregações diárias, sem varrer os cliques brutos)
+    # e a taxa de cliques (CTR) sobre as impressões amostradas do mesmo período
+    from .agregacao import cliques_recentes
+    from .impressoes import impressoes_recentes
+    posicoes = posicoes_cupons()
+    recentes = cliques_recentes(30)
+    impressoes = impressoes_recentes(30)
+    for cupom in cupons:
+        cupom.posicao = posicoes.get(cupom.id)
+        cupom.cliques_30_dias = recentes.get(cupom.id, 0)
+        cupom.impressoes_30_dias = impressoes.get(cupom.id, 0)
+        cupom.ctr_30_dias = (
+            100 * cupom.cliques_30_dias / cupom.impressoes_30_dias if cupom.impressoes_30_dias else None
+        )
 
     # Estatísticas baseadas nos cupons filtrados (refletem os filtros aplicados)
-    cupons_validos = [c for c in cupons if c.esta_valido()]
-    cupons_expirados = [c for c in cupons if not c.esta_valido() and c.ativo]
+    cupons_validos = [c for c in cupons if c.esta_valido(agora)]
+    cupons_expirados = [c for c in cupons if c.ativo and not c.esta_valido(agora)]
     cupons_inativos = [c for c in cupons if not c.ativo]
     total_cliques = sum(c.get_total_cliques() for c in cupons)
     
+    # Cliques descartados hoje (duplicados ou acima do limite por IP)
+    from .protecao_cliques import cliques_suprimidos
+    suprimidos = cliques_suprimidos()
+    
     # Contar lojas únicas nos cupons filtrados
     lojas_unicas = set()
     for cupom in cupons:
@@ -527,6 +592,8 @@ def admin_dashboard(request):
         'cupons_expirados': len(cupons_expirados),
         'cupons_inativos': len(cupons_inativos),
         'total_cliques': total_cliques,
+        'cliques_suprimidos': sum(suprimidos.values()),
+        'cliques_suprimidos_por_motivo': suprimidos,
         'lojas_ativas': lojas_ativas,
         'admin_user': admin_user,
         'loja_pesquisa': loja_pesquisa,
@@ -544,72 +611,26 @@ def admin_relatorio_acessos(request):
     """
     Relatório de acessos às páginas do site
     
-    IMPORTANTE: Todas as estatísticas são recalculadas do banco de dados a cada requisição.
-    Após exclusão de registros, quando a página recarregar, as estatísticas serão
-    automaticamente atualizadas refletindo os dados reais do banco de dados.
+    As estatísticas (páginas, estados, cidades e total) vêm das agregações
+    horárias/diárias de AcessoAgregado, complementadas pelos acessos brutos
+    ainda não agregados (ver consulta_risco/agregacao.py). Assim o custo não
+    cresce com o tamanho da tabela de acessos.
     """
-    from django.db.models import Count, Q
-    from collections import Counter
+    from .agregacao import estatisticas_acessos, filtrar_acessos, intervalo_datas
+    from .paginacao import contar_aproximado, paginar_por_cursor
     
     # Filtros
     data_inicio = request.GET.get('data_inicio', '').strip()
     data_fim = request.GET.get('data_fim', '').strip()
     estado_filtro = request.GET.get('estado', '').strip()
     cidade_filtro = request.GET.get('cidade', '').strip()
+    inicio_dt, fim_dt = intervalo_datas(data_inicio, data_fim)
     
-    # Query base - sempre busca do banco de dados atual
-    acessos = AcessoPagina.objects.all()
-    
-    # Filtro por data
-    if data_inicio:
-        try:
-            data_inicio_dt = datetime.strptime(data_inicio, '%Y-%m-%d')
-            data_inicio_dt = timezone.make_aware(data_inicio_dt)
-            acessos = acessos.filter(data_acesso__gte=data_inicio_dt)
-        except ValueError:
-            pass
-    
-    if data_fim:
-        try:
-            data_fim_dt = datetime.strptime(data_fim, '%Y-%m-%d')
-            data_fim_dt = data_fim_dt + timedelta(days=1) - timedelta(seconds=1)
-            data_fim_dt = timezone.make_aware(data_fim_dt)
-            acessos = acessos.filter(data_acesso__lte=data_fim_dt)
-        except ValueError:
-            pass
+    # Registros individuais filtrados (apenas para a listagem paginada)
+    acessos = filtrar_acessos(AcessoPagina.objects.all(), inicio_dt, fim_dt, estado_filtro, cidade_filtro)
     
-    # Filtro por estado
-    if estado_filtro:
-        acessos = acessos.filter(estado__iexact=estado_filtro)
-    
-    # Filtro por cidade
-    if cidade_filtro:
-        acessos = acessos.filter(cidade__icontains=cidade_filtro)
-    
-    # Estatísticas: Páginas mais visitadas
-    # NOTA: Estas estatísticas são recalculadas do banco de dados a cada requisição
-    # Após exclusão de registros, estas estatísticas refletirão os dados reais do banco
-    paginas_mais_visitadas = acessos.values('url', 'nome_pagina').annotate(
-        total=Count('id')
-    ).order_by('-total')[:20]
-    
-    # Estatísticas: Acessos por estado
-    # Recalculado do banco de dados atual
-    acessos_por_estado = acessos.exclude(estado='').values('estado').annotate(
-        total=Count('id')
-    ).order_by('-total')
-    
-    # Estatísticas: Acessos por cidade
-    # Recalculado do banco de dados atual
-    acessos_por_cidade = acessos.exclude(cidade='').exclude(estado='').values(
-        'cidade', 'estado'
-    ).annotate(
-        total=Count('id')
-    ).order_by('-total')[:50]
-    
-    # Total de acessos - sempre conta do banco de dados atual
-    # Após exclusão, este número será automaticamente reduzido
-    total_acessos = acessos.count()
+    # Estatísticas: páginas mais visitadas, acessos por estado/cidade e total
+    estatisticas = estatisticas_acessos(inicio_dt, fim_dt, estado_filtro, cidade_filtro)
     
     # Obter informações do usuário atual
     admin_user_id = request.session.get('admin_user_id')
@@ -628,20 +649,37 @@ def admin_relatorio_acessos(request):
             estado__iexact=estado_filtro
         ).exclude(cidade='').values_list('cidade', flat=True).distinct().order_by('cidade')
     
-    # Paginação dos registros individuais (limitado para performance)
-    acessos_ordenados = acessos.order_by('-data_acesso')
-    paginator = Paginator(acessos_ordenados, 20)  # 20 registros por página para melhor performance
-    page_number = request.GET.get('page', 1)
-    try:
-        acessos_paginados = paginator.page(page_number)
-    except:
-        acessos_paginados = paginator.page(1)
+    # Paginação por cursor (data_acesso, id): sem COUNT(*) nem OFFSET,
+    # o custo de cada página não depende de quão longe se navega
+    acessos_paginados = paginar_por_cursor(
+        acessos,
+        tamanho=20,
+        apos=request.GET.get('apos', '').strip(),
+        antes=request.GET.get('antes', '').strip(),
+    )
+    
+    # Total exibido: das agregações (padrão) ou estimado pelo planejador do banco
+    total_acessos = estatisticas['total_acessos']
+    total_aproximado = False
+    if getattr(settings, 'RELATORIO_ACESSOS_CONTAGEM', 'agregada') == 'aproximada':
+        total_acessos, total_aproximado = contar_aproximado(acessos)
+    
+    # Filtros atuais, repassados nos links de navegação entre páginas
+    filtros_query = urlencode({
+        chave: valor for chave, valor in (
+            ('data_inicio', data_inicio),
+            ('data_fim', data_fim),
+            ('estado', estado_filtro),
+            ('cidade', cidade_filtro),
+        ) if valor
+    })
     
     return render(request, 'consulta_risco/admin_relatorio_acessos.html', {
-        'paginas_mais_visitadas': paginas_mais_visitadas,
-        'acessos_por_estado': acessos_por_estado,
-        'acessos_por_cidade': acessos_por_cidade,
+        'paginas_mais_visitadas': estatisticas['paginas_mais_visitadas'],
+        'acessos_por_estado': estatisticas['acessos_por_estado'],
+        'acessos_por_cidade': estatisticas['acessos_por_cidade'],
         'total_acessos': total_acessos,
+        'total_aproximado': total_aproximado,
         'admin_user': admin_user,
         'data_inicio': data_inicio,
         'data_fim': data_fim,
@@ -649,6 +687,7 @@ def admin_relatorio_acessos(request):
         'cidade_filtro': cidade_filtro,
         'estados_disponiveis': estados_disponiveis,
         'cidades_disponiveis': cidades_disponiveis,
+        'filtros_query': filtros_query,
         'acessos_paginados': acessos_paginados,
     })
 
@@ -665,8 +704,12 @@ def excluir_acesso_pagina(request, acesso_id):
         # Armazenar informações para log antes de excluir
         acesso_info = f"ID: {acesso.id}, URL: {acesso.url}, Data: {acesso.data_acesso}"
         
-        # Excluir do banco de dados (DELETE SQL será executado)
-        acesso.delete()
+        # Excluir do banco de dados (DELETE SQL será executado),
+        # descontando o acesso das agregações do relatório
+        from .agregacao import descontar_acessos
+        with transaction.atomic():
+            descontar_acessos(AcessoPagina.objects.filter(id=acesso.id))
+            acesso.delete()
         
         # Verificar se realmente foi excluído (garantir que não existe mais)
         try:
@@ -699,7 +742,17 @@ def excluir_acesso_pagina(request, acesso_id):
 @csrf_exempt
 @require_POST
 def excluir_todos_acessos_filtrados(request):
-    """API para excluir todos os registros de acesso que correspondem aos filtros aplicados"""
+    """
+    API para excluir todos os registros de acesso que correspondem aos filtros aplicados
+    
+    A exclusão não é feita dentro da requisição: é registrada em ExclusaoAcessos
+    e executada em segundo plano, por lotes de IDs (ver exclusao_acessos.py).
+    O progresso é consultado em status_exclusao_acessos.
+    """
+    from .agregacao import filtrar_acessos, intervalo_datas
+    from .exclusao_acessos import STATUS_ATIVOS, iniciar_exclusao, retomar_abandonadas
+    from .paginacao import contar_aproximado
+    
     try:
         # Obter filtros da requisição
         data_inicio = request.POST.get('data_inicio', '').strip()
@@ -707,94 +760,54 @@ def excluir_todos_acessos_filtrados(request):
         estado_filtro = request.POST.get('estado', '').strip()
         cidade_filtro = request.POST.get('cidade', '').strip()
         
-        # Query base (mesma lógica da view admin_relatorio_acessos)
-        acessos = AcessoPagina.objects.all()
-        
-        # Filtro por data
-        if data_inicio:
-            try:
-                data_inicio_dt = datetime.strptime(data_inicio, '%Y-%m-%d')
-                data_inicio_dt = timezone.make_aware(data_inicio_dt)
-                acessos = acessos.filter(data_acesso__gte=data_inicio_dt)
-            except ValueError:
-                pass
-        
-        if data_fim:
-            try:
-                data_fim_dt = datetime.strptime(data_fim, '%Y-%m-%d')
-                data_fim_dt = data_fim_dt + timedelta(days=1) - timedelta(seconds=1)
-                data_fim_dt = timezone.make_aware(data_fim_dt)
-                acessos = acessos.filter(data_acesso__lte=data_fim_dt)
-            except ValueError:
-                pass
-        
-        # Filtro por estado
-        if estado_filtro:
-            acessos = acessos.filter(estado__iexact=estado_filtro)
-        
-        # Filtro por cidade
-        if cidade_filtro:
-            acessos = acessos.filter(cidade__icontains=cidade_filtro)
+        # Apenas uma exclusão por vez, para que lotes concorrentes não
+        # descontem os mesmos acessos das agregações. Uma exclusão abandonada
+        # (worker reiniciado) é retomada em vez de bloquear indefinidamente
+        retomar_abandonadas()
+        em_andamento = ExclusaoAcessos.objects.filter(status__in=STATUS_ATIVOS).first()
+        if em_andamento:
+            return JsonResponse({
+                'success': False,
+                'error': 'Já existe uma exclusão de registros em andamento. Aguarde a conclusão.',
+                'exclusao_id': em_andamento.id,
+                'status_url': reverse('status_exclusao_acessos', args=[em_andamento.id]),
+            }, status=409)
         
-        # Contar quantos registros serão excluídos ANTES da exclusão
-        total_excluir = acessos.count()
+        # Query base (mesma lógica da view admin_relatorio_acessos)
+        inicio_dt, fim_dt = intervalo_datas(data_inicio, data_fim)
+        acessos = filtrar_acessos(AcessoPagina.objects.all(), inicio_dt, fim_dt, estado_filtro, cidade_filtro)
         
         # Verificar se há registros para excluir
-        if total_excluir == 0:
+        id_maximo = acessos.order_by('-id').values_list('id', flat=True).first()
+        if id_maximo is None:
             return JsonResponse({
                 'success': False,
                 'error': 'Nenhum registro encontrado para excluir com os filtros aplicados'
             }, status=400)
         
-        # Obter IDs dos registros que serão excluídos (para verificação)
-        ids_para_excluir = list(acessos.values_list('id', flat=True)[:100])  # Limitar para log
-        
-        # Excluir todos os registros filtrados do banco de dados
-        # IMPORTANTE: .delete() em queryset executa DELETE SQL diretamente no banco
-        # Isso é mais eficiente e realmente remove os dados do banco de dados
-        # Retorna uma tupla: (total_excluidos, {modelo: quantidade_por_modelo})
-        resultado_exclusao = acessos.delete()
-        
-        # Extrair o total de registros excluídos
-        # resultado_exclusao[0] = total de objetos excluídos
-        # resultado_exclusao[1] = dicionário com quantidade por modelo
-        if isinstance(resultado_exclusao, tuple):
-            total_realmente_excluido = resultado_exclusao[0]
-            detalhes_por_modelo = resultado_exclusao[1]
-        else:
-            # Fallback se retornar apenas número
-            total_realmente_excluido = resultado_exclusao
-        
-        # Verificar se a exclusão foi bem-sucedida
-        if total_realmente_excluido != total_excluir:
-            logger.warning(f'Aviso: Esperado excluir {total_excluir} registros, mas {total_realmente_excluido} foram excluídos')
-        
-        # Verificar se os registros realmente foram excluídos do banco de dados
-        # (amostra de verificação para garantir que o DELETE SQL foi executado)
-        if len(ids_para_excluir) > 0:
-            registros_restantes = AcessoPagina.objects.filter(id__in=ids_para_excluir[:10]).count()
-            if registros_restantes > 0:
-                logger.error(f'ERRO: {registros_restantes} registros ainda existem no banco após exclusão')
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Erro: Alguns registros não foram excluídos do banco de dados'
-                }, status=500)
-        
-        # Log detalhado da exclusão
-        logger.info(f'Excluídos {total_realmente_excluido} registros de acesso do banco de dados')
-        if isinstance(resultado_exclusao, tuple):
-            logger.info(f'Detalhes por modelo: {detalhes_por_modelo}')
-        
-        # Verificar o total de registros restantes no banco (para confirmar redução)
-        total_restante = AcessoPagina.objects.count()
-        logger.info(f'Total de registros restantes no banco após exclusão: {total_restante}')
+        # Acessos registrados depois da solicitação (id maior) são preservados
+        total_estimado, _ = contar_aproximado(acessos)
+        admin_user_id = request.session.get('admin_user_id')
+        exclusao = ExclusaoAcessos.objects.create(
+            data_inicio=data_inicio,
+            data_fim=data_fim,
+            estado=estado_filtro,
+            cidade=cidade_filtro,
+            id_maximo=id_maximo,
+            total_estimado=total_estimado,
+            solicitado_por=AdminUser.objects.filter(id=admin_user_id).first() if admin_user_id else None,
+        )
+        transaction.on_commit(lambda: iniciar_exclusao(exclusao))
+        
+        logger.info(f'Exclusão de acessos #{exclusao.id} solicitada: ~{total_estimado} registro(s)')
         
         return JsonResponse({
             'success': True,
-            'message': f'{total_realmente_excluido} registro(s) excluído(s) do banco de dados com sucesso. Total restante: {total_restante}',
-            'total_excluidos': total_realmente_excluido,
-            'total_restante': total_restante
-        })
+            'message': f'Exclusão de aproximadamente {total_estimado} registro(s) iniciada.',
+            'exclusao_id': exclusao.id,
+            'total_estimado': total_estimado,
+            'status_url': reverse('status_exclusao_acessos', args=[exclusao.id]),
+        }, status=202)
     except Exception as e:
         logger.error('Erro ao excluir registros de acesso filtrados: %s', str(e))
         return JsonResponse({
@@ -803,6 +816,100 @@ def excluir_todos_acessos_filtrados(request):
         }, status=500)
 
 
+@admin_required
+def status_exclusao_acessos(request, exclusao_id):
+    """API para consultar o progresso de uma exclusão de acessos em segundo plano"""
+    from .exclusao_acessos import retomar_abandonadas
+    
+    retomar_abandonadas()
+    exclusao = get_object_or_404(ExclusaoAcessos, id=exclusao_id)
+    return JsonResponse({
+        'success': True,
+        'exclusao_id': exclusao.id,
+        'status': exclusao.status,
+        'status_display': exclusao.get_status_display(),
+        'total_estimado': exclusao.total_estimado,
+        'total_excluidos': exclusao.total_excluidos,
+        'progresso': exclusao.get_progresso(),
+        'concluida': exclusao.status == 'concluida',
+        'erro': exclusao.mensagem_erro,
+    })
+
+
+@admin_required
+def serie_cliques_cupom(request, cupom_id):
+    """
+    API com a série diária de cliques de um cupom (padrão: últimos 30 dias)
+    
+    Parâmetros GET opcionais: data_inicio e data_fim (YYYY-MM-DD, inclusive).
+    Servida a partir das agregações diárias (CliqueAgregado).
+    """
+    from .agregacao import intervalo_datas, serie_cliques
+    
+    cupom = get_object_or_404(Cupom, id=cupom_id)
+    
+    inicio, fim = intervalo_datas(request.GET.get('data_inicio', ''), request.GET.get('data_fim', ''))
+    fim = timezone.localdate(fim) if fim else timezone.localdate() + timedelta(days=1)
+    inicio = timezone.localdate(inicio) if inicio else fim - timedelta(days=30)
+    if inicio >= fim or (fim - inicio).days > 366:
+        return JsonResponse({'success': False, 'error': 'Intervalo inválido (máximo de 366 dias)'}, status=400)
+    
+    serie = serie_cliques(cupom.id, inicio, fim)
+    return JsonResponse({
+        'success': True,
+        'cupom_id': cupom.id,
+        'titulo': cupom.titulo,
+        'total_cliques': sum(ponto['cliques'] for ponto in serie),
+        'serie': [
+            {'dia': ponto['dia'].isoformat(), 'cliques': ponto['cliques'], 'ips_unicos': ponto['ips_unicos']}
+            for ponto in serie
+        ],
+    })
+
+
+@admin_required
+def exportar_registros(request, tabela):
+    """
+    Exporta em streaming (CSV ou JSON Lines) os acessos ou cliques com os filtros do relatório
+    
+    As linhas são lidas em blocos com cursor no servidor e enviadas à medida que
+    são formatadas, com memória constante. Com workers síncronos do Gunicorn a
+    exportação precisa terminar dentro do timeout; para volumes muito grandes,
+    use o comando exportar_registros.
+    """
+    from .agregacao import intervalo_datas
+    from .exportacao import CAMPOS_ACESSOS, CAMPOS_CLIQUES, FORMATOS, formatar, linhas_acessos, linhas_cliques
+    
+    formato = request.GET.get('formato', 'csv').strip().lower()
+    if formato not in FORMATOS or tabela not in ('acessos', 'cliques'):
+        return JsonResponse({
+            'success': False,
+            'error': 'Exportação inválida: use acessos ou cliques, no formato csv ou jsonl'
+        }, status=400)
+    
+    # Mesmos filtros da view admin_relatorio_acessos
+    data_inicio = request.GET.get('data_inicio', '').strip()
+    data_fim = request.GET.get('data_fim', '').strip()
+    inicio_dt, fim_dt = intervalo_datas(data_inicio, data_fim)
+    
+    if tabela == 'acessos':
+        campos = CAMPOS_ACESSOS
+        linhas = linhas_acessos(
+            inicio_dt, fim_dt,
+            request.GET.get('estado', '').strip(),
+            request.GET.get('cidade', '').strip(),
+        )
+    else:
+        campos = CAMPOS_CLIQUES
+        linhas = linhas_cliques(inicio_dt, fim_dt)
+    
+    content_type, extensao = FORMATOS[formato]
+    nome_arquivo = f'{tabela}_{timezone.localtime().strftime("%Y%m%d_%H%M")}.{extensao}'
+    response = StreamingHttpResponse(formatar(formato, campos, linhas), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response
+
+
 @admin_required
 def admin_cupom_edit(request, cupom_id=None):
     """View para editar ou criar cupom"""
@@ -825,9 +932,9 @@ def admin_cupom_edit(request, cupom_id=None):
             
             
             if cupom:
-                # Editar cupom existente
-                ordem_anterior = cupom.ordem_exibicao
-                nova_ordem = int(request.POST.get('ordem_exibicao', 1))
+                # Editar cupom existente (a ordem é informada como posição: 1, 2, 3...)
+                posicao_anterior = cupom.get_posicao_exibicao()
+                nova_posicao = int(request.POST.get('ordem_exibicao', 1))
                 loja_nome = request.POST.get('loja', '').strip()
                 
                 # Buscar o TipoCupom correspondente à loja selecionada
@@ -879,17 +986,17 @@ def admin_cupom_edit(request, cupom_id=None):
                 cupom.modificado_por = admin_user
                 cupom.save()
                 
-                # Reordenar cupons se a ordem foi alterada
-                if ordem_anterior != nova_ordem:
-                    reordenar_cupons(cupom, nova_ordem, cupom.id)
+                # Reposicionar o cupom se a ordem foi alterada (uma única escrita)
+                if posicao_anterior != nova_posicao:
+                    mover_cupom(cupom, nova_posicao)
                 
                 # Atualizar data do sistema
-                SistemaAtualizacao.atualizar_sistema(f"Cupom '{cupom.titulo}' atualizado")
+                SistemaAtualizacao.marcar_atualizacao(f"Cupom '{cupom.titulo}' atualizado")
                 
                 messages.success(request, 'Cupom atualizado com sucesso!')
             else:
                 # Criar novo cupom
-                nova_ordem = int(request.POST.get('ordem_exibicao', 1))
+                nova_posicao = int(request.POST.get('ordem_exibicao', 1))
                 loja_nome = request.POST.get('loja', '').strip()
                 
                 # Buscar o TipoCupom correspondente à loja selecionada
@@ -939,19 +1046,17 @@ def admin_cupom_edit(request, cupom_id=None):
                     ativo=request.POST.get('ativo') == 'on',
                     data_inicio=data_inicio,
                     data_validade=data_validade,
-                    ordem_exibicao=nova_ordem,
+                    ordem_exibicao=chave_para_posicao(nova_posicao),
                     criado_por=admin_user,
                     modificado_por=admin_user
                 )
                 
-                # Reordenar cupons para o novo cupom
-                reordenar_cupons(cupom, nova_ordem, None)
-                
                 # Atualizar data do sistema
-                SistemaAtualizacao.atualizar_sistema(f"Novo cupom '{cupom.titulo}' criado")
+                SistemaAtualizacao.marcar_atualizacao(f"Novo cupom '{cupom.titulo}' criado")
                 
                 messages.success(request, 'Cupom criado com sucesso!')
             
+            invalidar_cache_cupons()
             return redirect('admin_dashboard')
         except Exception as e:
             messages.error(request, f'Erro ao salvar cupom: {str(e)}')
@@ -1079,6 +1184,8 @@ def admin_loja_edit(request, loja_id=None):
                 )
                 messages.success(request, 'Loja criada com sucesso!')
             
+            # Cor e status da loja aparecem nos cupons exibidos
+            invalidar_cache_cupons()
             return redirect('admin_lojas_list')
         except Exception as e:
             messages.error(request, f'Erro ao salvar loja: {str(e)}')
@@ -1102,6 +1209,7 @@ def admin_cupom_delete(request, cupom_id):
     cupom = get_object_or_404(Cupom, id=cupom_id)
     if request.method == 'POST':
         cupom.delete()
+        invalidar_cache_cupons()
         messages.success(request, 'Cupom deletado com sucesso!')
         return redirect('admin_dashboard')
     
@@ -1122,6 +1230,7 @@ def admin_loja_delete(request, loja_id):
     if request.method == 'POST':
         loja_nome = loja.nome
         loja.delete()
+        invalidar_cache_cupons()
         messages.success(request, f'Loja "{loja_nome}" deletada com sucesso!')
         return redirect('admin_lojas_list')
     
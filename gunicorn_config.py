@@ -56,6 +56,12 @@ reload_extra_files = []
 keyfile = None
 certfile = None
 
+# Hooks de ciclo de vida do worker
+def worker_exit(server, worker):
+    """Grava os acessos ainda pendentes no buffer antes do worker encerrar"""
+    from consulta_risco.buffer_escrita import descarregar_todos
+    descarregar_todos()
+
 
 
 
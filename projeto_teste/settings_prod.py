@@ -174,6 +174,11 @@ CORS_ALLOWED_ORIGINS = [
 # DEFAULT_FROM_EMAIL: usa o valor da variável de ambiente ou EMAIL_HOST_USER como fallback, ou um padrão
 #DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER or 'noreply@safetyscorebrasil.com.br')
 
+# Proxies cujos cabeçalhos X-Real-IP/X-Forwarded-For são aceitos como o IP do
+# cliente (IPs ou faixas CIDR separados por vírgula). No docker-compose o nginx
+# roda em outro contêiner: usar a faixa da rede do compose
+PROXIES_CONFIAVEIS = config('PROXIES_CONFIAVEIS', default='127.0.0.1,::1', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])
+
 # Configurações de cache
 CACHES = {
     'default': {
@@ -394,8 +394,8 @@ document.addEventListener('DOMContentLoaded', function() {
         submitBtn.innerHTML = '<span class="btn-text">Consultando...</span><span class="btn-icon">⏳</span>';
         submitBtn.disabled = true;
 
-        // Simular delay da consulta
-        setTimeout(() => {
+        // Consulta sem o servidor de risco: cálculo local e médias buscadas separadamente
+        function consultarLocalmente() {
             const resultado = calcularNivelRisco(posicaoOrigem, posicaoDestino);
             
             // Construir HTML do resultado
@@ -437,7 +437,25 @@ document.addEventListener('DOMContentLoaded', function() {
                     submitBtn.disabled = false;
                 }
             }
-        }, 1500);
+        }
+
+        // Posições, médias e nível de risco em uma única chamada ao servidor
+        fetch(`/api/risco/?origem=${cidadeOrigemId}&destino=${cidadeDestinoId}`)
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.error || 'Erro ao consultar risco');
+                }
+                const posOrigem = data.origem.posicao !== null ? data.origem.posicao : 'N/A';
+                const posDestino = data.destino.posicao !== null ? data.destino.posicao : 'N/A';
+                // Sem posição no ranking o servidor não calcula o nível: manter a estimativa local
+                const resultado = data.risco.tipo === 'calculado' ? data.risco : calcularNivelRisco(posOrigem, posDestino);
+                exibirResultado(resultado, obterCorRisco(resultado.nivel), obterIconeRisco(resultado.nivel), cidadeOrigem, estadoOrigem, posOrigem, cidadeDestino, estadoDestino, posDestino, data.origem.media, data.destino.media, originalText, submitBtn);
+            })
+            .catch(error => {
+                console.error('Erro ao consultar risco no servidor:', error);
+                consultarLocalmente();
+            });
         });
     }
     